@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import User, Office, Request, RequestAttachment, Status, TypeOfFailure, Comment, Table, Load, Notification
+from .models import (
+    User, Office, Request, RequestAttachment, Status, TypeOfFailure, Comment, Table, Load, Notification,
+    RequestStatusHistory, BackgroundJob, Blob, RequestExpense, ExpenseRollup, RequestStatsRollup,
+    StaffCompetency, NotificationEvent,
+)
+from .search import search_requests
+
+# Сколько самых релевантных заявок добавлять в результаты поиска в админке
+ADMIN_SEARCH_LIMIT = 500
 
 
 @admin.register(User)
@@ -37,13 +45,22 @@ class OfficeAdmin(admin.ModelAdmin):
 class RequestAdmin(admin.ModelAdmin):
     list_display = ('id_request', 'user', 'failure_type', 'urgency', 'status', 'created_at')
     list_filter = ('status', 'urgency', 'created_at')
-    search_fields = ('description', 'user__last_name', 'user__first_name')
+    search_fields = ('user__last_name', 'user__first_name')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Описание и комментарии ищем по полнотекстовому индексу, а не через icontains
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            found, _ = search_requests(search_term, limit=ADMIN_SEARCH_LIMIT)
+            if found:
+                results |= queryset.filter(id_request__in=[request_id for request_id, _ in found])
+        return results, may_have_duplicates
 
 
 @admin.register(RequestAttachment)
 class RequestAttachmentAdmin(admin.ModelAdmin):
-    list_display = ('id_attachment', 'request', 'file', 'created_at')
-    list_filter = ('created_at',)
+    list_display = ('id_attachment', 'request', 'file', 'state', 'created_at')
+    list_filter = ('state', 'created_at')
     search_fields = ('request__id_request',)
 
 
@@ -59,7 +76,9 @@ class TypeOfFailureAdmin(admin.ModelAdmin):
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_display = ('id_comment', 'content', 'created_at')
+    list_display = ('id_comment', 'request', 'content', 'created_at')
+    list_select_related = ('request',)
+    raw_id_fields = ('request',)
 
 
 @admin.register(Table)
@@ -67,9 +86,38 @@ class TableAdmin(admin.ModelAdmin):
     list_display = ('id_table', 'expense_name', 'amount', 'created_at')
 
 
+@admin.register(RequestExpense)
+class RequestExpenseAdmin(admin.ModelAdmin):
+    list_display = ('id_expense', 'request', 'office', 'month', 'name', 'amount')
+    list_filter = ('month',)
+    raw_id_fields = ('request',)
+
+
+@admin.register(ExpenseRollup)
+class ExpenseRollupAdmin(admin.ModelAdmin):
+    list_display = ('office', 'month', 'total', 'lines_count')
+    list_filter = ('month',)
+    readonly_fields = ('office', 'month', 'total', 'lines_count')
+
+
+@admin.register(RequestStatsRollup)
+class RequestStatsRollupAdmin(admin.ModelAdmin):
+    list_display = ('period', 'bucket', 'office', 'failure_type', 'urgency', 'status', 'created', 'entered', 'left')
+    list_filter = ('period', 'status', 'urgency')
+    date_hierarchy = 'bucket'
+
+
 @admin.register(Load)
 class LoadAdmin(admin.ModelAdmin):
-    list_display = ('id_load', 'staff', 'current_tasks_count', 'urgency')
+    list_display = ('id_load', 'staff', 'current_tasks_count', 'weighted_load', 'urgency')
+
+
+@admin.register(StaffCompetency)
+class StaffCompetencyAdmin(admin.ModelAdmin):
+    list_display = ('id_competency', 'staff', 'failure_type', 'level')
+    list_filter = ('failure_type', 'level')
+    search_fields = ('staff__last_name', 'staff__first_name')
+    raw_id_fields = ('staff',)
 
 
 @admin.register(Notification)
@@ -78,3 +126,36 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ('is_read', 'created_at')
     search_fields = ('user__last_name', 'user__first_name', 'message')
     readonly_fields = ('created_at',)
+
+
+@admin.register(NotificationEvent)
+class NotificationEventAdmin(admin.ModelAdmin):
+    list_display = ('id_event', 'user', 'request', 'message', 'deliver_after')
+    raw_id_fields = ('user', 'request')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(RequestStatusHistory)
+class RequestStatusHistoryAdmin(admin.ModelAdmin):
+    list_display = ('id_history', 'request', 'from_status', 'to_status', 'changed_by', 'changed_at')
+    list_filter = ('to_status', 'changed_at')
+    search_fields = ('request__id_request',)
+    readonly_fields = ('request', 'from_status', 'to_status', 'changed_by', 'changed_at')
+
+    def has_change_permission(self, request, obj=None):
+        # Журнал только пополняется
+        return False
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id_job', 'kind', 'state', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('state', 'kind')
+    readonly_fields = ('created_at', 'updated_at', 'last_error')
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('id_blob', 'name', 'size', 'refcount', 'created_at')
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'refcount', 'created_at')
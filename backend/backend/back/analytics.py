@@ -0,0 +1,237 @@
+"""
+Аналитика по заявкам: векторные расчёты в NumPy поверх массивов,
+выбранных из БД одним запросом (без ORM-объектов на каждую строку).
+"""
+import numpy as np
+from django.utils import timezone
+
+from .models import Request, RequestStatusHistory
+
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+def _epoch_seconds(values, count):
+    """Переводит последовательность datetime в массив секунд epoch"""
+    return np.fromiter((value.timestamp() for value in values), dtype=np.float64, count=count)
+
+
+def _epoch_seconds_or_nan(values, count):
+    """То же для значений, которые могут быть None (None -> NaN)"""
+    return np.fromiter(
+        (value.timestamp() if value is not None else np.nan for value in values),
+        dtype=np.float64, count=count,
+    )
+
+
+def _group_codes(values, count):
+    """Целочисленные коды групп (в порядке первого появления) и значения групп"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64, count=count)
+    return codes, list(index)
+
+
+def _percentiles_by_group(codes, values, group_count, percentiles):
+    """Перцентили values по кодам групп: массив (group_count, len(percentiles)), NaN для пустых групп"""
+    result = np.full((group_count, len(percentiles)), np.nan)
+    keys, _, group_values = grouped_percentiles(codes[:, None], values, percentiles)
+    result[keys[:, 0]] = group_values
+    return result
+
+
+def grouped_percentiles(keys, values, percentiles=DEFAULT_PERCENTILES):
+    """
+    Считает перцентили values внутри каждой группы.
+
+    keys — двумерный массив целых (n, k): составной ключ группы для каждого значения.
+    Возвращает (уникальные ключи (g, k), размеры групп (g,), перцентили (g, len(percentiles))).
+    Перцентили — линейная интерполяция, как в np.percentile(method='linear').
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return (
+            np.empty((0, keys.shape[1]), dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty((0, len(percentiles)), dtype=np.float64),
+        )
+
+    # Сортируем по (ключ..., значение): np.lexsort берёт последний ключ как главный
+    order = np.lexsort((values,) + tuple(keys[:, i] for i in reversed(range(keys.shape[1]))))
+    sorted_keys = keys[order]
+    sorted_values = values[order]
+
+    # Начала групп — позиции, где меняется хотя бы одна компонента ключа
+    boundary = np.ones(len(sorted_values), dtype=bool)
+    boundary[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    starts = np.flatnonzero(boundary)
+    counts = np.diff(np.append(starts, len(sorted_values)))
+
+    # Позиции перцентилей внутри каждой группы: start + (n - 1) * p / 100
+    fractions = np.asarray(percentiles, dtype=np.float64) / 100.0
+    positions = starts[:, None] + (counts[:, None] - 1) * fractions[None, :]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, (starts + counts - 1)[:, None])
+    weight = positions - lower
+    result = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * weight
+
+    return sorted_keys[starts], counts, result
+
+
+def time_in_status(group_by='office', since=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    Перцентили времени пребывания заявок в каждом статусе (в часах),
+    в разрезе офиса ('office') или исполнителя ('performer').
+
+    Время в статусе — интервал между соседними переходами одной заявки.
+    Текущий (ещё не завершённый) статус заявки не учитывается.
+    """
+    group_field = {
+        'office': 'request__office_address_id',
+        'performer': 'request__performer_id',
+    }[group_by]
+
+    qs = RequestStatusHistory.objects.all()
+    if since is not None:
+        # Берём заявки, у которых есть переходы после since, вместе со всей их историей
+        qs = qs.filter(request_id__in=RequestStatusHistory.objects.filter(
+            changed_at__gte=since
+        ).values('request_id'))
+
+    rows = list(
+        qs.order_by('request_id', 'changed_at', 'id_history')
+        .values_list('request_id', 'to_status_id', 'changed_at', group_field)
+    )
+    if not rows:
+        return []
+
+    request_ids, status_ids, changed_at, group_ids = zip(*rows)
+    count = len(rows)
+    request_ids = np.fromiter(request_ids, dtype=np.int64, count=count)
+    status_ids = np.fromiter(status_ids, dtype=np.int64, count=count)
+    timestamps = _epoch_seconds(changed_at, count)
+    # Заявки без исполнителя группируются под ключом -1
+    group_ids = np.fromiter((g if g is not None else -1 for g in group_ids), dtype=np.int64, count=count)
+
+    # Отрезок i закрыт, если следующий переход относится к той же заявке
+    closed = request_ids[:-1] == request_ids[1:]
+    durations_hours = (timestamps[1:] - timestamps[:-1])[closed] / 3600.0
+    keys = np.column_stack((group_ids[:-1][closed], status_ids[:-1][closed]))
+
+    unique_keys, counts, values = grouped_percentiles(keys, durations_hours, percentiles)
+
+    result = []
+    for (group_id, status_id), group_count, group_values in zip(unique_keys.tolist(), counts.tolist(), values.tolist()):
+        item = {
+            'groupId': group_id if group_id != -1 else None,
+            'statusId': status_id,
+            'count': group_count,
+        }
+        for percentile, value in zip(percentiles, group_values):
+            item[f'p{percentile}'] = round(value, 2)
+        result.append(item)
+    return result
+
+
+def _percentile_dict(values, percentiles):
+    return {
+        f'p{percentile}': (round(float(value), 2) if not np.isnan(value) else None)
+        for percentile, value in zip(percentiles, values)
+    }
+
+
+def sla_report(group_by='office', since=None, until=None, now=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    Соблюдение сроков и время решения заявок в разрезе офиса ('office'),
+    исполнителя ('performer') или срочности ('urgency').
+
+    Заявки, созданные в [since, until), загружаются одним запросом в массивы;
+    все показатели считаются векторно:
+      - время решения (часы от создания до выполнения) выполненных заявок — перцентили;
+      - SLA: доля заявок со сроком, выполненных не позже срока. Учитываются
+        выполненные заявки и открытые, срок которых уже прошёл (они — нарушение);
+      - возраст очереди: сколько часов открыты ещё не выполненные заявки — перцентили.
+    """
+    group_field = {
+        'office': 'office_address_id',
+        'performer': 'performer_id',
+        'urgency': 'urgency',
+    }[group_by]
+
+    qs = Request.objects.all()
+    if since is not None:
+        qs = qs.filter(created_at__gte=since)
+    if until is not None:
+        qs = qs.filter(created_at__lt=until)
+    rows = list(qs.order_by().values_list('created_at', 'completed_at', 'due_time', group_field))
+    if not rows:
+        return []
+
+    created_at, completed_at, due_time, groups = zip(*rows)
+    count = len(rows)
+    created = _epoch_seconds(created_at, count)
+    completed = _epoch_seconds_or_nan(completed_at, count)
+    due = _epoch_seconds_or_nan(due_time, count)
+    codes, labels = _group_codes(groups, count)
+    group_count = len(labels)
+    now_ts = (now or timezone.now()).timestamp()
+
+    done = ~np.isnan(completed)
+    totals = np.bincount(codes, minlength=group_count)
+    done_counts = np.bincount(codes[done], minlength=group_count)
+
+    # Сравнения с NaN дают False: заявки без срока не попадают ни в учтённые, ни в выполненные в срок
+    evaluated = ~np.isnan(due) & (done | (due < now_ts))
+    met = evaluated & done & (completed <= due)
+    evaluated_counts = np.bincount(codes[evaluated], minlength=group_count)
+    met_counts = np.bincount(codes[met], minlength=group_count)
+
+    resolution = _percentiles_by_group(
+        codes[done], (completed[done] - created[done]) / 3600.0, group_count, percentiles
+    )
+    backlog_age = _percentiles_by_group(
+        codes[~done], (now_ts - created[~done]) / 3600.0, group_count, percentiles
+    )
+
+    result = []
+    for code, label in enumerate(labels):
+        evaluated_count = int(evaluated_counts[code])
+        result.append({
+            'groupId': label,
+            'total': int(totals[code]),
+            'completed': int(done_counts[code]),
+            'open': int(totals[code] - done_counts[code]),
+            'sla': {
+                'evaluated': evaluated_count,
+                'met': int(met_counts[code]),
+                'hitRate': round(float(met_counts[code]) / evaluated_count, 4) if evaluated_count else None,
+            },
+            'resolutionHours': _percentile_dict(resolution[code], percentiles),
+            'backlogAgeHours': _percentile_dict(backlog_age[code], percentiles),
+        })
+    result.sort(key=lambda item: (item['groupId'] is None, item['groupId'] if item['groupId'] is not None else ''))
+    return result
+
+
+def resolution_medians(group_field='failure_type_id', since=None):
+    """
+    Медианное время решения (часы) выполненных заявок, созданных после since.
+    Возвращает ({группа: (число заявок, медиана)}, общая медиана или None).
+    """
+    qs = Request.objects.filter(completed_at__isnull=False)
+    if since is not None:
+        qs = qs.filter(created_at__gte=since)
+    rows = list(qs.order_by().values_list('created_at', 'completed_at', group_field))
+    if not rows:
+        return {}, None
+
+    created_at, completed_at, groups = zip(*rows)
+    count = len(rows)
+    hours = (_epoch_seconds(completed_at, count) - _epoch_seconds(created_at, count)) / 3600.0
+    codes, labels = _group_codes(groups, count)
+    counts = np.bincount(codes, minlength=len(labels))
+    medians = _percentiles_by_group(codes, hours, len(labels), (50,))[:, 0]
+    return (
+        {label: (int(counts[code]), float(medians[code])) for code, label in enumerate(labels)},
+        float(np.median(hours)),
+    )
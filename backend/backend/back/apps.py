@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BackConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'back'
+
+    def ready(self):
+        # Регистрируем обработчики сигналов (сброс кэшей графа статусов, списка
+        # сотрудников АХО и подписчиков на новые заявки, обновление поискового
+        # индекса и свёртки затрат) и обработчики фоновых задач
+        from . import expenses, notifications, routing, search, uploads, workflow  # noqa: F401
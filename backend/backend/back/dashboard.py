@@ -0,0 +1,278 @@
+"""
+Сводки для дашборда: поток заявок, очередь и затраты по офисам.
+
+Источник — журнал статусов RequestStatusHistory (записи только добавляются).
+Команда refresh_dashboard сворачивает новые записи журнала (id больше позиции
+RollupWatermark) в строки RequestStatsRollup за час и за день и сдвигает
+позицию в той же транзакции. Дашборд читает только свёртку, поэтому время
+ответа не зависит от размера архива заявок.
+
+Запись журнала — вход заявки в статус to_status (создание заявки, если
+from_status пуст) и выход из from_status. Кроме часов и дней каждая порция
+сворачивается в строки периода «всё время» (одна строка на ключ), и число
+заявок в статусе — entered - left этих строк: очередь читает столько строк,
+сколько сочетаний офиса, типа, срочности и статуса, а не дней истории. Офис, тип поломки и срочность записываются
+в журнал при переходе (срез): вход считается по срезу заявки на момент
+перехода, а выход — по срезу, под которым заявка вошла в from_status
+(срез предыдущей записи). Поэтому смена срочности или типа поломки
+в update_request не разносит вход и выход одной заявки по разным ключам,
+и очередь в разрезе срочности или типа не уходит в минус.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, DateTimeField, F, Max, Q, Sum, Value
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .expenses import month_of
+from .models import ExpenseRollup, RequestStatsRollup, RequestStatusHistory, RollupWatermark
+from .workflow import get_workflow
+
+WATERMARK = 'request_stats'
+
+# Начало периода «всё время»: у его строк одно значение bucket на всю историю
+TOTAL_BUCKET = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _total_bucket(field):
+    return Value(TOTAL_BUCKET, output_field=DateTimeField())
+
+
+PERIODS = (
+    (RequestStatsRollup.PERIOD_HOUR, TruncHour),
+    (RequestStatsRollup.PERIOD_DAY, TruncDay),
+    (RequestStatsRollup.PERIOD_TOTAL, _total_bucket),
+)
+
+# Записи моложе этого не сворачиваются: транзакции с меньшими id
+# могли ещё не закоммититься, и позиция перескочила бы через них
+SETTLE_DELAY = timedelta(minutes=1)
+
+
+def request_snapshot(request_obj):
+    """Срез заявки для журнала: (офис, тип поломки, срочность)"""
+    return request_obj.office_address_id, request_obj.failure_type_id, request_obj.urgency
+
+
+def last_snapshots(request_ids):
+    """
+    Срезы, под которыми заявки учтены в текущем статусе (срез последней
+    записи журнала), одним запросом: {id заявки: (офис, тип поломки, срочность)}
+    """
+    last_ids = RequestStatusHistory.objects.filter(request_id__in=request_ids).order_by().values(
+        'request_id'
+    ).annotate(last_id=Max('id_history')).values('last_id')
+    return {
+        request_id: (office_id, failure_type_id, urgency)
+        for request_id, office_id, failure_type_id, urgency in RequestStatusHistory.objects.filter(
+            id_history__in=last_ids
+        ).values_list('request_id', 'office_id', 'failure_type_id', 'urgency')
+    }
+
+
+def history_entry(request_id, snapshot, previous=None, **fields):
+    """
+    Запись журнала со срезами: snapshot — срез заявки сейчас (вход в to_status),
+    previous — срез, под которым заявка была учтена в from_status (по умолчанию тот же)
+    """
+    office_id, failure_type_id, urgency = snapshot
+    from_office_id, from_failure_type_id, from_urgency = previous or snapshot
+    return RequestStatusHistory(
+        request_id=request_id,
+        office_id=office_id,
+        failure_type_id=failure_type_id,
+        urgency=urgency,
+        from_office_id=from_office_id,
+        from_failure_type_id=from_failure_type_id,
+        from_urgency=from_urgency,
+        **fields,
+    )
+
+
+# Поля среза записи журнала для входа в статус и для выхода из статуса
+ENTERED_FIELDS = ('to_status_id', 'office', 'failure_type_id', 'urgency')
+LEFT_FIELDS = ('from_status_id', 'from_office', 'from_failure_type_id', 'from_urgency')
+
+
+def _events(history, trunc, fields):
+    """Число переходов по (период, офис, тип поломки, срочность, статус) одним GROUP BY"""
+    status_field, office_field, failure_type_field, urgency_field = fields
+    # Срез без офиса или типа поломки остаётся, если их удалили, — их строк в свёртке уже нет
+    return history.filter(**{
+        f'{office_field}__isnull': False, f'{failure_type_field}__isnull': False,
+    }).order_by().values(
+        bucket=trunc('changed_at'),
+        # Имена не совпадают с полями журнала: Django не даёт переопределять поля модели
+        key_office=F(f'{office_field}_id'),
+        region=F(f'{office_field}__region'),
+        key_failure_type=F(failure_type_field),
+        key_urgency=F(urgency_field),
+        key_status=F(status_field),
+    ).annotate(
+        count=Count('id_history'),
+        created=Count('id_history', filter=Q(from_status__isnull=True)),
+    )
+
+
+def _row_key(row):
+    return row['bucket'], row['key_office'], row['key_failure_type'], row['key_urgency'], row['key_status']
+
+
+def _upsert(period, deltas, regions):
+    """Добавляет {ключ: [created, entered, left]} к строкам свёртки периода"""
+    if not deltas:
+        return
+    existing = {
+        (rollup.bucket, rollup.office_id, rollup.failure_type_id, rollup.urgency, rollup.status_id): rollup
+        for rollup in RequestStatsRollup.objects.filter(period=period, bucket__in={key[0] for key in deltas})
+    }
+    to_update = []
+    to_create = []
+    for key, (created, entered, left) in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            bucket, office_id, failure_type_id, urgency, status_id = key
+            to_create.append(RequestStatsRollup(
+                period=period,
+                bucket=bucket,
+                office_id=office_id,
+                region=regions[key],
+                failure_type_id=failure_type_id,
+                urgency=urgency,
+                status_id=status_id,
+                created=created,
+                entered=entered,
+                left=left,
+            ))
+        else:
+            rollup.created += created
+            rollup.entered += entered
+            rollup.left += left
+            to_update.append(rollup)
+    RequestStatsRollup.objects.bulk_update(to_update, ['created', 'entered', 'left'], batch_size=1000)
+    RequestStatsRollup.objects.bulk_create(to_create, batch_size=1000)
+
+
+def _fold(history):
+    """Сворачивает записи журнала во все периоды; возвращает число записей"""
+    processed = 0
+    for period, trunc in PERIODS:
+        deltas = defaultdict(lambda: [0, 0, 0])
+        regions = {}
+        processed = 0
+        for row in _events(history, trunc, ENTERED_FIELDS):
+            key = _row_key(row)
+            deltas[key][0] += row['created']
+            deltas[key][1] += row['count']
+            regions[key] = row['region'] or ''
+            processed += row['count']
+        for row in _events(history.filter(from_status__isnull=False), trunc, LEFT_FIELDS):
+            key = _row_key(row)
+            deltas[key][2] += row['count']
+            regions[key] = row['region'] or ''
+        _upsert(period, deltas, regions)
+    return processed
+
+
+def _settled_position():
+    """Последний id журнала, который можно свернуть"""
+    history = RequestStatusHistory.objects.order_by('id_history').values_list('id_history', flat=True)
+    first_recent = history.filter(changed_at__gt=timezone.now() - SETTLE_DELAY).first()
+    if first_recent is not None:
+        return first_recent - 1
+    return history.reverse().first() or 0
+
+
+def refresh(batch_size=10000):
+    """
+    Сворачивает новые записи журнала порциями по batch_size id.
+    Каждая порция и сдвиг позиции — одна транзакция. Возвращает число записей.
+    """
+    upper = _settled_position()
+    processed = 0
+    while True:
+        with transaction.atomic():
+            # Блокировка позиции: параллельный запуск дождётся и продолжит с новой позиции
+            RollupWatermark.objects.get_or_create(name=WATERMARK)
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK)
+            start = watermark.position
+            end = min(start + batch_size, upper)
+            if end <= start:
+                return processed
+            processed += _fold(RequestStatusHistory.objects.filter(id_history__gt=start, id_history__lte=end))
+            watermark.position = end
+            watermark.save(update_fields=['position', 'updated_at'])
+
+
+def rebuild(batch_size=10000):
+    """Удаляет свёртку и строит её заново по всему журналу"""
+    with transaction.atomic():
+        RequestStatsRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).delete()
+    return refresh(batch_size=batch_size)
+
+
+def _scoped(qs, office_id=None, region=None, failure_type=None, urgency=None):
+    if office_id is not None:
+        qs = qs.filter(office_id=office_id)
+    if region:
+        qs = qs.filter(region=region)
+    if failure_type:
+        qs = qs.filter(failure_type__name=failure_type)
+    if urgency:
+        qs = qs.filter(urgency=urgency)
+    return qs
+
+
+def throughput(period, since, until, **scope):
+    """Созданные и выполненные заявки по периодам в [since, until): [(начало, создано, выполнено)]"""
+    closed_ids = get_workflow().ids_for_keys(('completed',))
+    rows = _scoped(
+        RequestStatsRollup.objects.filter(period=period, bucket__gte=since, bucket__lt=until), **scope
+    ).order_by('bucket').values('bucket').annotate(
+        created_total=Sum('created'),
+        closed_total=Sum('entered', filter=Q(status_id__in=closed_ids)),
+    )
+    return [(row['bucket'], row['created_total'] or 0, row['closed_total'] or 0) for row in rows]
+
+
+def backlog(**scope):
+    """Текущее число заявок в каждом статусе: {id статуса: число}"""
+    rows = _scoped(
+        RequestStatsRollup.objects.filter(period=RequestStatsRollup.PERIOD_TOTAL), **scope
+    ).order_by().values('status_id').annotate(total=Sum('entered') - Sum('left'))
+    return {row['status_id']: row['total'] for row in rows if row['total']}
+
+
+def office_summary(since, until, region=None):
+    """
+    Сводка по офисам за [since, until): создано, выполнено, открытых сейчас, затраты.
+    Затраты берутся из помесячной свёртки за месяцы, которые пересекает период.
+    Возвращает {id офиса: {...}}.
+    """
+    closed_ids = get_workflow().ids_for_keys(('completed',))
+    summary = defaultdict(lambda: {'created': 0, 'closed': 0, 'open': 0, 'cost': 0})
+
+    day_rows = _scoped(RequestStatsRollup.objects.filter(period=RequestStatsRollup.PERIOD_DAY), region=region)
+    for row in day_rows.filter(bucket__gte=since, bucket__lt=until).order_by().values('office_id').annotate(
+        created_total=Sum('created'),
+        closed_total=Sum('entered', filter=Q(status_id__in=closed_ids)),
+    ):
+        summary[row['office_id']]['created'] = row['created_total'] or 0
+        summary[row['office_id']]['closed'] = row['closed_total'] or 0
+    total_rows = _scoped(RequestStatsRollup.objects.filter(period=RequestStatsRollup.PERIOD_TOTAL), region=region)
+    for row in total_rows.exclude(status_id__in=closed_ids).order_by().values('office_id').annotate(
+        total=Sum('entered') - Sum('left'),
+    ):
+        summary[row['office_id']]['open'] = row['total'] or 0
+
+    costs = ExpenseRollup.objects.filter(month__gte=month_of(since), month__lte=month_of(until - timedelta(seconds=1)))
+    if region:
+        costs = costs.filter(office__region=region)
+    for office_id, total in costs.order_by().values('office_id').annotate(total=Sum('total')).values_list(
+        'office_id', 'total'
+    ):
+        summary[office_id]['cost'] = total
+    return dict(summary)
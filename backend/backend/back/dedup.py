@@ -0,0 +1,175 @@
+"""
+Поиск похожих заявок (возможных дублей) при создании.
+
+Описание заявки разбивается на шинглы (символьные n-граммы), по ним
+строится MinHash-сигнатура. Сигнатура режется на полосы (LSH): заявки,
+у которых совпала хотя бы одна полоса, становятся кандидатами. Ключ полосы
+включает офис и тип поломки, поэтому кандидаты ищутся только среди заявок
+того же офиса с той же поломкой — одним запросом по индексу, без перебора
+всех открытых заявок. Похожесть кандидатов оценивается по сигнатурам.
+
+Сигнатуры и корзины выполненных заявок и заявок старше окна поиска
+удаляются на шаге обслуживания воркера (purge_index), поэтому индекс
+не растёт вместе с архивом.
+"""
+import hashlib
+import re
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Request, RequestLshBucket, RequestSignature
+from .workflow import get_workflow
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS = NUM_PERMUTATIONS // BANDS  # порог срабатывания LSH ≈ (1 / BANDS) ** (1 / ROWS) ≈ 0.5
+SHINGLE_SIZE = 5
+
+# Простое число Мерсенна 2^31 - 1: произведения a * x помещаются в uint64
+MERSENNE_PRIME = (1 << 31) - 1
+
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_WINDOW_DAYS = 14
+MAX_DUPLICATES = 5
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _permutation_params():
+    """Коэффициенты хеш-функций a * x + b mod p, одинаковые во всех процессах"""
+    params = []
+    for i in range(NUM_PERMUTATIONS):
+        digest = hashlib.blake2b(f'minhash:{i}'.encode(), digest_size=8).digest()
+        a = int.from_bytes(digest[:4], 'big') % (MERSENNE_PRIME - 1) + 1
+        b = int.from_bytes(digest[4:], 'big') % MERSENNE_PRIME
+        params.append((a, b))
+    a, b = zip(*params)
+    return np.array(a, dtype=np.uint64), np.array(b, dtype=np.uint64)
+
+
+_A, _B = _permutation_params()
+
+
+def shingles(text):
+    """Множество хешей символьных n-грамм нормализованного текста"""
+    normalized = ' '.join(WORD_RE.findall((text or '').lower()))
+    if not normalized:
+        return set()
+    if len(normalized) <= SHINGLE_SIZE:
+        return {zlib.crc32(normalized.encode())}
+    return {
+        zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode())
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(text):
+    """MinHash-сигнатура текста (массив uint32 длины NUM_PERMUTATIONS) или None для пустого"""
+    values = shingles(text)
+    if not values:
+        return None
+    x = np.fromiter(values, dtype=np.uint64, count=len(values)) % MERSENNE_PRIME
+    # Матрица (перестановки × шинглы), минимум по каждой перестановке
+    hashed = (_A[:, None] * x[None, :] + _B[:, None]) % MERSENNE_PRIME
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def similarity(signature, other):
+    """Оценка коэффициента Жаккара по доле совпавших позиций сигнатур"""
+    return float(np.count_nonzero(signature == other)) / NUM_PERMUTATIONS
+
+
+def bucket_keys(signature, office_id, failure_type_id):
+    """Ключи LSH-корзин (по одной на полосу) в пределах офиса и типа поломки"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(
+            f'{office_id}:{failure_type_id}:{band}:'.encode() + rows, digest_size=8
+        ).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def find_duplicates(signature, office_id, failure_type_id, exclude_id=None):
+    """
+    Открытые заявки за последние DUPLICATE_WINDOW_DAYS дней в том же офисе
+    и с тем же типом поломки, похожие на сигнатуру. Возвращает список
+    (заявка, похожесть), самые похожие — первыми.
+    """
+    if signature is None:
+        return []
+    threshold = getattr(settings, 'DUPLICATE_SIMILARITY_THRESHOLD', DEFAULT_THRESHOLD)
+    window = timedelta(days=getattr(settings, 'DUPLICATE_WINDOW_DAYS', DEFAULT_WINDOW_DAYS))
+    closed_status_ids = get_workflow().ids_for_keys(('completed',))
+
+    candidate_ids = RequestLshBucket.objects.filter(
+        bucket__in=bucket_keys(signature, office_id, failure_type_id)
+    ).values('request_id')
+    candidates = RequestSignature.objects.filter(
+        request_id__in=candidate_ids,
+        request__created_at__gte=timezone.now() - window,
+    ).exclude(request__status_id__in=closed_status_ids).select_related('request')
+    if exclude_id is not None:
+        candidates = candidates.exclude(request_id=exclude_id)
+
+    duplicates = []
+    for candidate in candidates:
+        score = similarity(signature, np.frombuffer(candidate.signature, dtype=np.uint32))
+        if score >= threshold:
+            duplicates.append((candidate.request, score))
+    duplicates.sort(key=lambda item: (-item[1], -item[0].id_request))
+    return duplicates[:MAX_DUPLICATES]
+
+
+def store_signature(request_obj, signature, replace=True):
+    """Сохраняет сигнатуру и LSH-корзины заявки; replace=False — для новой заявки"""
+    if replace:
+        # Корзины удаляются каскадом вместе с заявкой, но не с сигнатурой
+        RequestSignature.objects.filter(request=request_obj).delete()
+        RequestLshBucket.objects.filter(request=request_obj).delete()
+    if signature is None:
+        return
+    RequestSignature.objects.create(request=request_obj, signature=signature.tobytes())
+    RequestLshBucket.objects.bulk_create([
+        RequestLshBucket(request=request_obj, bucket=key)
+        for key in bucket_keys(signature, request_obj.office_address_id, request_obj.failure_type_id)
+    ])
+
+
+def reindex_request(request_obj):
+    """Пересчитывает сигнатуру после изменения описания, офиса или типа поломки"""
+    store_signature(request_obj, minhash(request_obj.description))
+
+
+def index_open_requests(batch_size=500):
+    """Строит сигнатуры для открытых заявок из окна поиска дублей; возвращает их число"""
+    window = timedelta(days=getattr(settings, 'DUPLICATE_WINDOW_DAYS', DEFAULT_WINDOW_DAYS))
+    qs = Request.objects.filter(created_at__gte=timezone.now() - window).exclude(
+        status_id__in=get_workflow().ids_for_keys(('completed',))
+    ).only('id_request', 'description', 'office_address_id', 'failure_type_id')
+    count = 0
+    for request_obj in qs.iterator(chunk_size=batch_size):
+        reindex_request(request_obj)
+        count += 1
+    return count
+
+
+def purge_index(now=None):
+    """
+    Удаляет сигнатуры и корзины заявок, которые уже не могут оказаться дублями:
+    выполненных и созданных раньше окна поиска. Возвращает число удалённых сигнатур.
+    """
+    window = timedelta(days=getattr(settings, 'DUPLICATE_WINDOW_DAYS', DEFAULT_WINDOW_DAYS))
+    stale_ids = Request.objects.filter(
+        Q(created_at__lt=(now or timezone.now()) - window)
+        | Q(status_id__in=get_workflow().ids_for_keys(('completed',)))
+    ).values('id_request')
+    RequestLshBucket.objects.filter(request_id__in=stale_ids).delete()
+    deleted, _ = RequestSignature.objects.filter(request_id__in=stale_ids).delete()
+    return deleted
@@ -0,0 +1,131 @@
+"""
+Эскалация просроченных заявок.
+
+Команда escalate_overdue (запускается по расписанию) выбирает открытые
+заявки, срок которых прошёл и по которым ещё не было эскалации. Условие
+совпадает с частичным индексом back_request_overdue_idx, а после эскалации
+заявка из индекса выпадает — поэтому каждый запуск читает только впервые
+просроченные заявки, а не все открытые.
+
+Заявки в статусах, не занимающих исполнителя (например, «Ожидают закупки»),
+не эскалируются и не переназначаются: им ставится только отметка
+escalated_at, чтобы они тоже выпали из индекса. Когда заявка возвращается
+в работу (повторное открытие, закупка завершена), отметка сбрасывается,
+и просроченная заявка эскалируется заново.
+
+Заявки обрабатываются порциями, каждая порция — одна транзакция:
+уведомления исполнителю и руководителю офиса ставятся в очередь одним
+INSERT (notify_many), отметка escalated_at ставится одним UPDATE. По желанию
+заявка передаётся другому исполнителю по обычным правилам назначения (routing.py).
+"""
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Office, Request
+from .notifications import notify_many
+from .routing import apply_load_deltas, find_best_performer, increment_performer_load
+from .workflow import get_workflow
+
+ESCALATION_MESSAGE = 'Заявка #{id} просрочена: срок выполнения истёк {due}.'
+REASSIGNED_MESSAGE = 'Вам передана просроченная заявка #{id} (срок истёк {due}).'
+
+
+def overdue_requests(now):
+    """Впервые просроченные открытые заявки (условие частичного индекса)"""
+    return Request.objects.filter(
+        completed_at__isnull=True,
+        escalated_at__isnull=True,
+        due_time__isnull=False,
+        due_time__lte=now,
+    )
+
+
+def _releasing_status_ids():
+    workflow = get_workflow()
+    return set(workflow.ids_for_keys([
+        key for key, status_def in workflow.statuses.items() if status_def.releases_load
+    ]))
+
+
+def _reassign(rows):
+    """
+    Подбирает заявкам нового исполнителя (кроме текущего) и переносит загрузку.
+    Возвращает {id заявки: id нового исполнителя}.
+    """
+    offices = Office.objects.in_bulk({row[2] for row in rows})
+    reassigned = {}
+    for request_id, performer_id, office_id, _, urgency, _, weight, failure_type_id in rows:
+        performer = find_best_performer(
+            offices.get(office_id), urgency, failure_type_id,
+            exclude_ids=[performer_id] if performer_id else (),
+        )
+        if performer is None:
+            continue
+        # Загрузку меняем сразу: следующая заявка порции увидит её при выборе исполнителя
+        if performer_id:
+            apply_load_deltas({performer_id: -1}, {performer_id: -weight})
+        increment_performer_load(performer, request_id, urgency, weight)
+        reassigned[request_id] = performer.id_user
+    return reassigned
+
+
+def escalate_batch(now, batch_size=500, reassign=False):
+    """
+    Обрабатывает одну порцию просроченных заявок.
+    Возвращает (число выбранных заявок, число эскалированных).
+    """
+    with transaction.atomic():
+        # Заблокированные параллельным запуском заявки пропускаем
+        selected = list(
+            overdue_requests(now).select_for_update(skip_locked=True, of=('self',))
+            .order_by('due_time')
+            .values_list(
+                'id_request', 'performer_id', 'office_address_id',
+                'office_address__supervisor_id', 'urgency', 'due_time', 'routing_weight', 'failure_type_id',
+                'status_id',
+            )[:batch_size]
+        )
+        if not selected:
+            return 0, 0
+
+        # Заявки, не занимающие исполнителя, только отмечаем, чтобы они выпали из индекса
+        releasing = _releasing_status_ids()
+        rows = [row[:-1] for row in selected if row[-1] not in releasing]
+        Request.objects.filter(id_request__in=[row[0] for row in selected]).update(escalated_at=now)
+
+        reassigned = _reassign(rows) if reassign else {}
+
+        notifications = []
+        for request_id, performer_id, _, supervisor_id, _, due_time, _, _ in rows:
+            due = timezone.localtime(due_time).strftime('%d.%m.%Y %H:%M')
+            recipients = {user_id for user_id in (performer_id, supervisor_id) if user_id}
+            new_performer_id = reassigned.get(request_id)
+            if new_performer_id:
+                recipients.discard(new_performer_id)
+                notifications.append(
+                    (new_performer_id, request_id, REASSIGNED_MESSAGE.format(id=request_id, due=due))
+                )
+            notifications.extend(
+                (user_id, request_id, ESCALATION_MESSAGE.format(id=request_id, due=due))
+                for user_id in sorted(recipients)
+            )
+        notify_many(notifications)
+
+        if reassigned:
+            Request.objects.filter(id_request__in=reassigned.keys()).update(performer_id=Case(
+                *[When(id_request=request_id, then=Value(user_id)) for request_id, user_id in reassigned.items()],
+                output_field=IntegerField(),
+            ))
+    return len(selected), len(rows)
+
+
+def sweep(batch_size=500, reassign=False, now=None):
+    """Эскалирует все просроченные на момент now заявки; возвращает число эскалированных"""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        selected, escalated = escalate_batch(now, batch_size=batch_size, reassign=reassign)
+        total += escalated
+        if selected < batch_size:
+            return total
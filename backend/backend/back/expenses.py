@@ -0,0 +1,158 @@
+"""
+Затраты по заявкам и их свёртка по офисам и месяцам.
+
+У каждой заявки свои строки затрат (RequestExpense): общих строк Table,
+которые правили сразу все заявки с одинаковым названием затраты, больше нет.
+Строки заявки заменяются целиком: старые удаляются, новые вставляются
+одним bulk_create.
+
+Изменение суммы сразу добавляется к строке ExpenseRollup (офис, месяц)
+через UPDATE ... SET total = total + delta. Поэтому отчёт по затратам
+читает несколько строк по индексу и не обходит все заявки. Месяц
+определяется датой создания заявки. Пересчитать свёртку с нуля можно
+командой manage.py rebuild_expense_rollups.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ExpenseRollup, Request, RequestExpense
+
+MAX_LINES = 50
+MAX_AMOUNT = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+
+class ExpenseError(ValueError):
+    """Некорректные строки затрат от клиента"""
+
+
+def month_of(moment):
+    """Первое число месяца, к которому относится момент времени"""
+    return timezone.localdate(moment).replace(day=1)
+
+
+def parse_expense_lines(raw_lines):
+    """
+    Строки затрат из запроса ([{'name': ..., 'amount': ...}]) в список (название, сумма).
+    Полностью пустые строки пропускаются.
+    """
+    if not isinstance(raw_lines, list):
+        raise ExpenseError('expenses должен быть списком')
+    lines = []
+    for raw in raw_lines:
+        if not isinstance(raw, dict):
+            raise ExpenseError('Строка затрат должна быть объектом')
+        name = str(raw.get('name') or '').strip()[:255]
+        amount = raw.get('amount')
+        if not name and amount in (None, ''):
+            continue
+        try:
+            amount = Decimal(str(amount)).quantize(CENT) if amount not in (None, '') else Decimal(0)
+        except (InvalidOperation, ValueError):
+            raise ExpenseError(f'Неверная сумма затрат: {raw.get("amount")}')
+        if not amount.is_finite() or amount < 0 or amount > MAX_AMOUNT:
+            raise ExpenseError(f'Неверная сумма затрат: {raw.get("amount")}')
+        lines.append((name, amount))
+    if len(lines) > MAX_LINES:
+        raise ExpenseError(f'Не больше {MAX_LINES} строк затрат')
+    return lines
+
+
+def _grouped(lines_qs):
+    """{(офис, месяц): [сумма, число строк]} по строкам затрат"""
+    return {
+        (office_id, month): [total, count]
+        for office_id, month, total, count in lines_qs.order_by().values('office_id', 'month').annotate(
+            total=Sum('amount'), count=Count('id_expense')
+        ).values_list('office_id', 'month', 'total', 'count')
+    }
+
+
+def _apply(deltas):
+    """Добавляет изменения {(офис, месяц): (сумма, число строк)} к свёртке"""
+    # Постоянный порядок обновления строк свёртки — без взаимных блокировок
+    for (office_id, month), (total, count) in sorted(deltas.items()):
+        if not total and not count:
+            continue
+        rollup = ExpenseRollup.objects.filter(office_id=office_id, month=month)
+        if rollup.update(total=F('total') + total, lines_count=F('lines_count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                ExpenseRollup.objects.create(office_id=office_id, month=month, total=total, lines_count=count)
+        except IntegrityError:
+            # Строку только что создал параллельный запрос
+            rollup.update(total=F('total') + total, lines_count=F('lines_count') + count)
+
+
+def set_request_expenses(request_obj, lines):
+    """
+    Заменяет строки затрат заявки на lines ([(название, сумма)]) и обновляет свёртку.
+    Если строки не изменились (например, сохраняли только комментарий), ничего не пишет.
+    """
+    with transaction.atomic():
+        # Блокировка заявки: параллельные замены не должны дважды вычесть старые строки
+        Request.objects.select_for_update().filter(pk=request_obj.pk).exists()
+        old_lines = RequestExpense.objects.filter(request=request_obj)
+        current = list(old_lines.order_by('id_expense'))
+        if [(line.name, line.amount) for line in current] == list(lines):
+            return current
+        deltas = defaultdict(lambda: [Decimal(0), 0])
+        for key, (total, count) in _grouped(old_lines).items():
+            deltas[key] = [-total, -count]
+        old_lines.delete()
+
+        month = month_of(request_obj.created_at)
+        created = RequestExpense.objects.bulk_create([
+            RequestExpense(
+                request=request_obj,
+                office_id=request_obj.office_address_id,
+                month=month,
+                name=name,
+                amount=amount,
+            )
+            for name, amount in lines
+        ])
+        delta = deltas[(request_obj.office_address_id, month)]
+        delta[0] += sum((amount for _, amount in lines), Decimal(0))
+        delta[1] += len(created)
+        _apply(deltas)
+    return created
+
+
+def rebuild_rollups():
+    """Пересчитывает свёртку по всем строкам затрат; возвращает число строк свёртки"""
+    with transaction.atomic():
+        ExpenseRollup.objects.all().delete()
+        rollups = ExpenseRollup.objects.bulk_create([
+            ExpenseRollup(office_id=office_id, month=month, total=total, lines_count=count)
+            for (office_id, month), (total, count) in _grouped(RequestExpense.objects.all()).items()
+        ])
+    return len(rollups)
+
+
+def cost_report(office_ids=None, month_from=None, month_to=None):
+    """Строки свёртки (с офисом) за период [month_from, month_to], по месяцам"""
+    qs = ExpenseRollup.objects.select_related('office')
+    if office_ids is not None:
+        qs = qs.filter(office_id__in=office_ids)
+    if month_from is not None:
+        qs = qs.filter(month__gte=month_from)
+    if month_to is not None:
+        qs = qs.filter(month__lte=month_to)
+    return qs.order_by('month', 'office__name')
+
+
+@receiver(pre_delete, sender=Request)
+def _release_request_expenses(sender, instance, **kwargs):
+    # Строки затрат удалятся каскадом — их суммы вычитаем из свёртки заранее
+    _apply({
+        key: (-total, -count)
+        for key, (total, count) in _grouped(RequestExpense.objects.filter(request=instance)).items()
+    })
@@ -0,0 +1,181 @@
+"""
+Идемпотентность изменяющих запросов по заголовку Idempotency-Key.
+
+Клиент генерирует ключ на каждое действие пользователя и повторяет его
+при ретраях. Первый запрос с ключом выполняется, ответ сохраняется
+(сжатым) на IDEMPOTENCY_KEY_TTL секунд; повторы получают сохранённый
+ответ с заголовком Idempotent-Replayed: true и ничего не пишут в БД.
+Ключ действует в пределах endpoint и пользователя (user_id запроса).
+Пока первый запрос выполняется, повтор получает 409.
+"""
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+from .responses import JsonResponse
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = 24 * 60 * 60
+
+# Запрос, который «выполняется» дольше этого, считается оборванным (упал воркер)
+STALE_AFTER = timedelta(minutes=5)
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL))
+
+
+def _fingerprint(request):
+    """
+    Отпечаток запроса: повтор ключа с другим телом — ошибка клиента.
+    Содержимое файлов multipart не хешируем (они могут быть большими) —
+    учитываем поля формы, имена и размеры файлов.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.get_full_path()}\n'.encode())
+    if request.content_type == 'multipart/form-data':
+        digest.update(json.dumps({
+            'fields': sorted(request.POST.lists()),
+            'files': sorted(
+                (field, upload.name, upload.size)
+                for field, uploads in request.FILES.lists() for upload in uploads
+            ),
+        }, ensure_ascii=False).encode())
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _acting_user(request, kwargs):
+    """
+    Id пользователя, от имени которого выполняется запрос: из пути,
+    JSON-тела, полей формы или строки запроса ('' — не указан)
+    """
+    user_id = kwargs.get('user_id')
+    if user_id is None:
+        if request.content_type in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+            user_id = request.POST.get('user_id')
+        else:
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                user_id = data.get('user_id')
+    if user_id is None:
+        user_id = request.GET.get('user_id')
+    return '' if user_id is None else str(user_id)
+
+
+def _replay(record):
+    response = HttpResponse(
+        zlib.decompress(bytes(record.body)) if record.body else b'',
+        status=record.status_code,
+        content_type=record.content_type or None,
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _create(key, fingerprint, now):
+    """Вставляет запись о ключе; False — ключ уже занят"""
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, expires_at=now + _ttl())
+        return True
+    except IntegrityError:
+        return False
+
+
+def _claim(key, fingerprint):
+    """
+    Регистрирует ключ перед выполнением запроса.
+    Возвращает None, если запрос нужно выполнить, иначе готовый ответ.
+    """
+    now = timezone.now()
+    if _create(key, fingerprint, now):
+        return None
+
+    record = IdempotencyKey.objects.filter(key=key).first()
+    if record is None or record.expires_at <= now or (
+        record.status_code is None and record.created_at <= now - STALE_AFTER
+    ):
+        # Запись устарела — забираем ключ себе, если его не забрал параллельный запрос
+        if record is not None:
+            IdempotencyKey.objects.filter(key=key, created_at=record.created_at).delete()
+        if _create(key, fingerprint, now):
+            return None
+        record = IdempotencyKey.objects.filter(key=key).first()
+
+    if record is None or record.status_code is None:
+        response = JsonResponse(
+            {'error': 'Запрос с этим Idempotency-Key ещё выполняется'},
+            status=409
+        )
+        response['Retry-After'] = '1'
+        return response
+    if record.fingerprint != fingerprint:
+        return JsonResponse(
+            {'error': 'Idempotency-Key уже использован для другого запроса'},
+            status=422
+        )
+    return _replay(record)
+
+
+def idempotent(view):
+    """
+    Декоратор view: учитывает заголовок Idempotency-Key, если он передан.
+    Ответы 5xx не сохраняются — такой запрос можно повторить с тем же ключом.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        client_key = request.headers.get(HEADER)
+        if not client_key:
+            return view(request, *args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            return JsonResponse(
+                {'error': f'Idempotency-Key длиннее {MAX_KEY_LENGTH} символов'},
+                status=400
+            )
+
+        # Ключ действует в пределах endpoint (путь включает id объекта) и пользователя:
+        # одинаковый ключ разных пользователей не должен отдавать чужой ответ
+        key = hashlib.sha256(
+            f'{view.__name__}\n{request.path}\n{_acting_user(request, kwargs)}\n{client_key}'.encode()
+        ).hexdigest()
+        ready = _claim(key, _fingerprint(request))
+        if ready is not None:
+            return ready
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+            raise
+
+        if response.status_code >= 500 or response.streaming:
+            IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+        else:
+            IdempotencyKey.objects.filter(key=key).update(
+                status_code=response.status_code,
+                content_type=response.get('Content-Type', ''),
+                body=zlib.compress(response.content),
+            )
+        return response
+
+    return wrapper
+
+
+def purge_expired():
+    """Удаляет ключи с истёкшим сроком; возвращает число удалённых"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lt=timezone.now()).delete()
+    return deleted
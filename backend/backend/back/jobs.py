@@ -0,0 +1,142 @@
+"""
+Фоновая очередь задач на таблице BackgroundJob, без внешнего брокера.
+
+Задача ставится в очередь в той же транзакции, что и данные, к которым она
+относится, поэтому воркер (manage.py run_jobs) видит её только после коммита.
+Воркеры забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED, так что
+их можно запускать несколько.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Зарегистрированные обработчики: kind -> функция(payload)
+HANDLERS = {}
+
+# Обработчики окончательной ошибки (попытки исчерпаны): kind -> функция(payload)
+FAILURE_HANDLERS = {}
+
+MAX_ATTEMPTS = 5
+
+
+def job(kind, on_failure=None):
+    """
+    Декоратор регистрации обработчика задачи. on_failure(payload) вызывается,
+    когда задача окончательно завершилась ошибкой (например, чтобы убрать временные файлы).
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        if on_failure is not None:
+            FAILURE_HANDLERS[kind] = on_failure
+        return func
+    return decorator
+
+
+def _eager():
+    """В режиме BACKGROUND_JOBS_EAGER задачи выполняются сразу после коммита (удобно без воркера)"""
+    return getattr(settings, 'BACKGROUND_JOBS_EAGER', False)
+
+
+def enqueue(kind, payload):
+    """Ставит задачу в очередь"""
+    return enqueue_many([(kind, payload)])[0]
+
+
+def enqueue_many(items):
+    """Ставит в очередь несколько задач одним INSERT; items — пары (kind, payload)"""
+    jobs = BackgroundJob.objects.bulk_create([
+        BackgroundJob(kind=kind, payload=payload) for kind, payload in items
+    ])
+    if _eager():
+        job_ids = [job.id_job for job in jobs]
+        transaction.on_commit(lambda: run_pending(job_ids=job_ids))
+    return jobs
+
+
+def claim(batch_size=10, job_ids=None):
+    """Забирает из очереди до batch_size готовых к выполнению задач"""
+    with transaction.atomic():
+        qs = BackgroundJob.objects.select_for_update(skip_locked=True).filter(
+            state=BackgroundJob.STATE_PENDING,
+            run_after__lte=timezone.now(),
+        )
+        if job_ids is not None:
+            qs = qs.filter(id_job__in=job_ids)
+        jobs = list(qs.order_by('run_after', 'id_job')[:batch_size])
+        if jobs:
+            BackgroundJob.objects.filter(id_job__in=[job.id_job for job in jobs]).update(
+                state=BackgroundJob.STATE_RUNNING,
+                updated_at=timezone.now(),
+            )
+    return jobs
+
+
+def execute(job):
+    """Выполняет одну задачу; при ошибке планирует повтор с экспоненциальной задержкой"""
+    handler = HANDLERS.get(job.kind)
+    attempts = job.attempts + 1
+    try:
+        if handler is None:
+            raise LookupError(f'Нет обработчика для задачи {job.kind}')
+        handler(job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Задача %s (%s) завершилась ошибкой', job.id_job, job.kind)
+        failed = attempts >= MAX_ATTEMPTS or handler is None
+        BackgroundJob.objects.filter(id_job=job.id_job).update(
+            state=BackgroundJob.STATE_FAILED if failed else BackgroundJob.STATE_PENDING,
+            attempts=attempts,
+            run_after=timezone.now() + timedelta(seconds=30 * 2 ** job.attempts),
+            last_error=error[-5000:],
+            updated_at=timezone.now(),
+        )
+        if failed and job.kind in FAILURE_HANDLERS:
+            try:
+                FAILURE_HANDLERS[job.kind](job.payload)
+            except Exception:
+                logger.exception('Обработчик ошибки задачи %s (%s) завершился ошибкой', job.id_job, job.kind)
+        return False
+    BackgroundJob.objects.filter(id_job=job.id_job).update(
+        state=BackgroundJob.STATE_DONE,
+        attempts=attempts,
+        last_error='',
+        updated_at=timezone.now(),
+    )
+    return True
+
+
+def run_pending(batch_size=10, job_ids=None):
+    """Выполняет задачи, пока очередь не опустеет; возвращает число выполненных"""
+    processed = 0
+    while True:
+        jobs = claim(batch_size=batch_size, job_ids=job_ids)
+        if not jobs:
+            return processed
+        for job in jobs:
+            execute(job)
+            processed += 1
+
+
+def requeue_stale(timeout=timedelta(minutes=30)):
+    """Возвращает в очередь задачи, зависшие в состоянии running (воркер упал)"""
+    return BackgroundJob.objects.filter(
+        state=BackgroundJob.STATE_RUNNING,
+        updated_at__lt=timezone.now() - timeout,
+    ).update(state=BackgroundJob.STATE_PENDING, updated_at=timezone.now())
+
+
+def purge_finished(older_than=timedelta(days=7)):
+    """Удаляет выполненные задачи старше older_than"""
+    deleted, _ = BackgroundJob.objects.filter(
+        state=BackgroundJob.STATE_DONE,
+        updated_at__lt=timezone.now() - older_than,
+    ).delete()
+    return deleted
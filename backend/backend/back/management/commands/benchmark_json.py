@@ -0,0 +1,99 @@
+import gzip
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import RequestFactory
+
+from back import responses
+from back.middleware import brotli
+from back.views import get_archive_requests
+
+
+def _synthetic_archive(count):
+    """Генерирует архив заявок той же формы, что отдаёт get_archive_requests"""
+    requests_list = []
+    for i in range(count):
+        requests_list.append({
+            'id': str(i + 1),
+            'priority': ('low', 'medium', 'high', 'urgent')[i % 4],
+            'location': 'г. Екатеринбург, ул. Мира, д. 19, кабинет 305',
+            'address': 'г. Екатеринбург, ул. Мира, д. 19',
+            'region': 'Свердловская область',
+            'city': 'Екатеринбург',
+            'officeId': i % 20 + 1,
+            'officeName': f'Офис №{i % 20 + 1}',
+            'employeeLocation': f'Стол {i % 40}',
+            'locationDescription': 'Третий этаж, переговорная',
+            'problemDescription': 'Не работает принтер, при печати выдаёт ошибку замятия бумаги',
+            'issueType': 'hardware',
+            'status': 'completed',
+            'createdAt': '2025-11-23T07:31:00+00:00',
+            'attachments': [],
+            'performer': {
+                'id': 7,
+                'first_name': 'Иван',
+                'last_name': 'Петров',
+                'middle_name': 'Сергеевич',
+                'username': 'ipetrov',
+            },
+            'expense': {'id': 1, 'name': 'Заявка', 'amount': 0},
+            'comments': [],
+        })
+    return {'success': True, 'requests': requests_list}
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время кодирования и размер ответа архива заявок (json/orjson, gzip/brotli)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='Использовать синтетический архив из N заявок вместо данных БД',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Число повторов кодирования')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            data = _synthetic_archive(options['synthetic'])
+        else:
+            # URL вложений строятся через build_absolute_uri, поэтому нужен разрешённый хост
+            host = next(
+                (h for h in settings.ALLOWED_HOSTS if h and not h.startswith(('.', '*'))),
+                'localhost',
+            )
+            request = RequestFactory().get('/api/requests/archive/', HTTP_HOST=host)
+            response = get_archive_requests(request)
+            data = json.loads(response.content)
+        repeat = max(1, options['repeat'])
+
+        def stdlib_dumps(payload):
+            return json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+
+        encoders = [('json (stdlib)', stdlib_dumps), ('responses.dumps', responses.dumps)]
+
+        self.stdout.write(f"Заявок в ответе: {len(data.get('requests', []))}")
+        self.stdout.write(f"Кодировщик responses.dumps: {'orjson' if responses.orjson else 'json'}")
+
+        for name, encode in encoders:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                body = encode(data)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+            self.stdout.write(f'{name:>16}: {elapsed_ms:8.2f} мс, {len(body)} байт')
+
+        body = responses.dumps(data)
+        start = time.perf_counter()
+        gzipped = gzip.compress(body, compresslevel=6)
+        gzip_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'{"gzip":>16}: {gzip_ms:8.2f} мс, {len(gzipped)} байт')
+
+        if brotli is not None:
+            start = time.perf_counter()
+            compressed = brotli.compress(body, quality=5)
+            br_ms = (time.perf_counter() - start) * 1000
+            self.stdout.write(f'{"brotli":>16}: {br_ms:8.2f} мс, {len(compressed)} байт')
+        else:
+            self.stdout.write('brotli не установлен, пропускаем')
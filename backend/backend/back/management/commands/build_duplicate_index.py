@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from back.dedup import index_open_requests
+
+
+class Command(BaseCommand):
+    help = 'Строит MinHash-сигнатуры открытых заявок для поиска дублей'
+
+    def handle(self, *args, **options):
+        count = index_open_requests()
+        self.stdout.write(f'Проиндексировано заявок: {count}')
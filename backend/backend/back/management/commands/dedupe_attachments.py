@@ -0,0 +1,48 @@
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from back.models import Request, RequestAttachment
+from back.storage import attachment_storage
+
+# Имя файла, уже лежащего в контентно-адресуемом хранилище
+HASHED_NAME = re.compile(r'^attachments/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class Command(BaseCommand):
+    help = 'Переносит вложения, загруженные до дедупликации, в контентно-адресуемое хранилище'
+
+    def handle(self, *args, **options):
+        storage = attachment_storage()
+        moved = {}  # старое имя -> новое имя
+
+        def migrate(name):
+            if name not in moved:
+                with storage.open(name, 'rb') as source:
+                    moved[name] = storage.save(os.path.basename(name), source)
+            else:
+                # Повторная ссылка на уже перенесённый файл
+                storage.retain(moved[name])
+            return moved[name]
+
+        attachments = RequestAttachment.objects.exclude(file='').order_by('id_attachment')
+        for attachment in attachments.iterator():
+            name = attachment.file.name
+            if HASHED_NAME.match(name) or not storage.exists(name):
+                continue
+            RequestAttachment.objects.filter(id_attachment=attachment.id_attachment).update(file=migrate(name))
+
+        requests = Request.objects.exclude(attachments='').exclude(attachments__isnull=True).order_by('id_request')
+        for req in requests.only('id_request', 'attachments').iterator():
+            name = req.attachments.name
+            if HASHED_NAME.match(name) or not storage.exists(name):
+                continue
+            Request.objects.filter(id_request=req.id_request).update(attachments=migrate(name))
+
+        # Старые файлы больше ни на что не ссылаются — удаляем их напрямую, минуя счётчик ссылок
+        for name in moved:
+            FileSystemStorage.delete(storage, name)
+
+        self.stdout.write(f'Перенесено файлов: {len(moved)}, уникальных после переноса: {len(set(moved.values()))}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from back.escalation import sweep
+
+
+class Command(BaseCommand):
+    help = (
+        'Эскалирует просроченные заявки: уведомляет исполнителя и руководителя офиса. '
+        'Запускается по расписанию (например, раз в несколько минут из cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько заявок обрабатывать за транзакцию')
+        parser.add_argument('--reassign', action='store_true', help='Передавать просроченные заявки другому исполнителю')
+
+    def handle(self, *args, **options):
+        escalated = sweep(batch_size=max(1, options['batch_size']), reassign=options['reassign'])
+        self.stdout.write(f'Эскалировано заявок: {escalated}')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from back.models import RequestAttachment, User
+from back.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры для вложений и аватаров, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=0, help='Обработать не больше N файлов каждого вида')
+
+    def handle(self, *args, **options):
+        limit = options['limit'] or None
+
+        attachments = RequestAttachment.objects.filter(
+            state=RequestAttachment.STATE_READY, thumbnails={}
+        ).exclude(file='').order_by('id_attachment')[:limit]
+        done = 0
+        for attachment in attachments.iterator():
+            try:
+                with attachment.file.open('rb') as source:
+                    data = source.read()
+                thumbnails = generate_thumbnails(data, attachment.file.name.rsplit('/', 1)[-1])
+            except Exception as e:
+                self.stderr.write(f'Вложение {attachment.id_attachment}: {e}')
+                continue
+            RequestAttachment.objects.filter(id_attachment=attachment.id_attachment).update(thumbnails=thumbnails)
+            done += 1
+        self.stdout.write(f'Миниатюры вложений: {done}')
+
+        users = User.objects.filter(avatar_thumbnails={}).exclude(avatar='').exclude(
+            avatar__isnull=True
+        ).order_by('id_user')[:limit]
+        done = 0
+        for user in users.iterator():
+            try:
+                with user.avatar.open('rb') as source:
+                    data = source.read()
+                thumbnails = generate_thumbnails(data, f'users/{user.id_user}/avatar', crop=True)
+            except Exception as e:
+                self.stderr.write(f'Аватар пользователя {user.id_user}: {e}')
+                continue
+            User.objects.filter(id_user=user.id_user).update(avatar_thumbnails=thumbnails)
+            done += 1
+        self.stdout.write(f'Миниатюры аватаров: {done}')
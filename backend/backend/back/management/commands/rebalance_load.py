@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+
+from back.models import User
+from back.rebalance import DEFAULT_MAX_MOVES, apply_moves, load_distribution, plan_moves
+
+
+class Command(BaseCommand):
+    help = (
+        'Выравнивает загрузку сотрудников АХО: переназначает новые заявки '
+        'с перегруженных сотрудников на свободных. Без --apply только показывает план'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', help='Применить переназначения')
+        parser.add_argument('--office', type=int, help='Только заявки этого офиса')
+        parser.add_argument('--any-office', action='store_true', help='Разрешить передачу сотрудникам других офисов')
+        parser.add_argument(
+            '--drain', type=int, action='append', default=[],
+            help='id сотрудника (например, в отпуске), с которого снять все новые заявки; можно повторять',
+        )
+        parser.add_argument('--max-moves', type=int, default=DEFAULT_MAX_MOVES, help='Не больше стольких переназначений')
+        parser.add_argument(
+            '--min-gain', type=float, default=0.0,
+            help='Минимальное сокращение разрыва во взвешенной загрузке для переноса',
+        )
+
+    def handle(self, *args, **options):
+        distribution = load_distribution()
+        moves = plan_moves(
+            distribution,
+            office_id=options['office'],
+            any_office=options['any_office'],
+            drain_ids=options['drain'],
+            max_moves=max(0, options['max_moves']),
+            min_gain=options['min_gain'],
+        )
+
+        after = {user_id: stats['weighted'] for user_id, stats in distribution.items()}
+        for move in moves:
+            after[move.source_id] -= move.weight
+            after[move.target_id] = after.get(move.target_id, 0.0) + move.weight
+        names = {
+            user.id_user: f'{user.last_name} {user.first_name}'.strip() or user.username or str(user.id_user)
+            for user in User.objects.filter(id_user__in=after.keys())
+        }
+
+        header = f"{'Сотрудник':<30} {'Задач':>6} {'Новых':>6} {'Вес':>8} {'После':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for user_id, stats in sorted(distribution.items(), key=lambda item: -item[1]['weighted']):
+            self.stdout.write(
+                f"{names.get(user_id, str(user_id))[:30]:<30} {stats['tasks']:>6} {stats['movable']:>6} "
+                f"{stats['weighted']:>8.1f} {after[user_id]:>8.1f}"
+            )
+        for move in moves:
+            self.stdout.write(
+                f'Заявка #{move.request_id}: {names.get(move.source_id, move.source_id)} -> '
+                f'{names.get(move.target_id, move.target_id)} (вес {move.weight:g})'
+            )
+
+        if not options['apply']:
+            self.stdout.write(f'Предложено переназначений: {len(moves)} (для применения запустите с --apply)')
+            return
+        applied = apply_moves(moves)
+        self.stdout.write(f'Переназначено заявок: {len(applied)} из {len(moves)}')
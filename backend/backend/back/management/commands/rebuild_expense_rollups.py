@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from back.expenses import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает свёртку затрат по офисам и месяцам по строкам затрат заявок'
+
+    def handle(self, *args, **options):
+        total = rebuild_rollups()
+        self.stdout.write(f'Строк свёртки: {total}')
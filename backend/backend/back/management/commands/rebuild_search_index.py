@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from back.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс заявок (описание и комментарии)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сколько заявок индексировать за раз')
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=max(1, options['batch_size']))
+        self.stdout.write(f'Проиндексировано заявок: {total}')
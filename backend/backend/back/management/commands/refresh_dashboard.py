@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from back import dashboard
+
+
+class Command(BaseCommand):
+    help = (
+        'Сворачивает новые записи журнала статусов в почасовую и подневную сводку для дашборда. '
+        'Запускается по расписанию (например, раз в минуту из cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Сколько записей журнала сворачивать за транзакцию')
+        parser.add_argument('--rebuild', action='store_true', help='Удалить сводку и построить её заново по всему журналу')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        if options['rebuild']:
+            processed = dashboard.rebuild(batch_size=batch_size)
+        else:
+            processed = dashboard.refresh(batch_size=batch_size)
+        self.stdout.write(f'Свёрнуто записей журнала: {processed}')
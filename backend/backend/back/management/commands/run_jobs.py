@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from back import dedup, idempotency, jobs, notifications
+from back.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Фоновый воркер: выполняет задачи из очереди BackgroundJob и доставляет уведомления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать очередь один раз и выйти')
+        parser.add_argument('--batch-size', type=int, default=10, help='Сколько задач забирать за раз')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Пауза при пустой очереди, секунд')
+
+    def maintenance(self):
+        """
+        Возвращает зависшие задачи, чистит выполненные, брошенные загрузки частями,
+        истёкшие ключи идемпотентности и индекс поиска дублей
+        """
+        jobs.requeue_stale()
+        jobs.purge_finished()
+        purge_stale_uploads()
+        idempotency.purge_expired()
+        dedup.purge_index()
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        if options['once']:
+            # Режим для запуска из cron: обслуживание выполняется при каждом запуске
+            self.maintenance()
+            processed = jobs.run_pending(batch_size=batch_size)
+            delivered = notifications.dispatch()
+            self.stdout.write(f'Выполнено задач: {processed}, доставлено уведомлений: {delivered}')
+            return
+
+        self.stdout.write('Воркер запущен, Ctrl+C для остановки')
+        next_maintenance = timezone.now()
+        try:
+            while True:
+                # Обслуживание — раз в несколько минут
+                if timezone.now() >= next_maintenance:
+                    self.maintenance()
+                    next_maintenance = timezone.now() + timedelta(minutes=5)
+
+                processed = jobs.run_pending(batch_size=batch_size)
+                delivered = notifications.dispatch()
+                if not processed and not delivered:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Воркер остановлен')
@@ -0,0 +1,64 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from back.analytics import sla_report
+from back.views import sla_group_names
+
+
+def _date(value):
+    try:
+        return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+    except ValueError:
+        raise CommandError(f'Неверная дата {value}, ожидается YYYY-MM-DD')
+
+
+def _hours(value):
+    return f'{value:.1f}' if value is not None else '-'
+
+
+class Command(BaseCommand):
+    help = 'Отчёт по SLA: доля заявок в срок, перцентили времени решения и возраста очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group-by', choices=('office', 'performer', 'urgency'), default='office')
+        parser.add_argument('--since', help='Заявки, созданные с этой даты (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Заявки, созданные по эту дату включительно (YYYY-MM-DD)')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        since = _date(options['since']) if options['since'] else None
+        until = _date(options['until']) + timedelta(days=1) if options['until'] else None
+
+        started = time.perf_counter()
+        metrics = sla_report(group_by=options['group_by'], since=since, until=until)
+        elapsed = time.perf_counter() - started
+
+        names = sla_group_names(
+            options['group_by'], {item['groupId'] for item in metrics if item['groupId'] is not None}
+        )
+        for item in metrics:
+            item['groupName'] = names.get(item['groupId'], '')
+
+        if options['json']:
+            self.stdout.write(json.dumps(metrics, ensure_ascii=False, indent=2))
+            return
+
+        header = f"{'Группа':<30} {'Всего':>7} {'Откр.':>7} {'SLA, %':>7} {'Реш. p50':>9} {'p90':>7} {'p99':>7} {'Возр. p50':>9} {'p90':>7}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for item in metrics:
+            hit_rate = item['sla']['hitRate']
+            resolution = item['resolutionHours']
+            age = item['backlogAgeHours']
+            self.stdout.write(
+                f"{(item['groupName'] or str(item['groupId']))[:30]:<30} {item['total']:>7} {item['open']:>7} "
+                f"{(f'{hit_rate * 100:.1f}' if hit_rate is not None else '-'):>7} "
+                f"{_hours(resolution.get('p50')):>9} {_hours(resolution.get('p90')):>7} {_hours(resolution.get('p99')):>7} "
+                f"{_hours(age.get('p50')):>9} {_hours(age.get('p90')):>7}"
+            )
+        total = sum(item['total'] for item in metrics)
+        self.stdout.write(f'Заявок: {total}, групп: {len(metrics)}, расчёт: {elapsed:.2f} с')
@@ -0,0 +1,173 @@
+"""
+Отдача медиафайлов (вложений, миниатюр, аватаров) с проверкой доступа.
+
+Ссылку на файл выдаёт только API, которое уже проверило, что пользователь
+может видеть заявку (или профиль). Ссылка подписывается вместе со сроком
+действия, поэтому view отдачи не обращается к БД. Срок округляется до
+периода MEDIA_URL_MAX_AGE, чтобы в пределах периода ссылка не менялась
+и браузер мог брать файл из кэша. Аватары перезаписываются под тем же
+именем, поэтому их браузер не кэширует без проверки.
+
+Сам файл отдаёт веб-сервер (X-Accel-Redirect для nginx, X-Sendfile для
+Apache/lighttpd), если это включено в настройках. Иначе — FileResponse
+(sendfile через wsgi.file_wrapper) с поддержкой Range и условных запросов.
+"""
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Файлы, которые перезаписываются под тем же именем: аватары и их миниатюры
+MUTABLE_PREFIXES = ('users/', 'thumbs/users/')
+
+_signer = signing.Signer(salt='back.media')
+
+
+def url_max_age():
+    return getattr(settings, 'MEDIA_URL_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def sign_media(name, now=None):
+    """Подпись ссылки на файл: '<истекает>.<подпись>'"""
+    period = url_max_age()
+    now = int(now if now is not None else time.time())
+    # Ссылка действует от одного до двух периодов
+    expires = (now // period + 2) * period
+    signature = _signer.signature(f'{name}|{expires}')
+    return f'{expires}.{signature}'
+
+
+def check_media_signature(name, token, now=None):
+    expires, _, signature = (token or '').partition('.')
+    if not expires.isdigit():
+        return False
+    if int(expires) < (now if now is not None else time.time()):
+        return False
+    return signing.constant_time_compare(signature, _signer.signature(f'{name}|{expires}'))
+
+
+def media_url(request, name):
+    """Абсолютная подписанная ссылка на файл из хранилища"""
+    url = reverse('serve_media', args=[name])
+    return request.build_absolute_uri(f'{url}?token={sign_media(name)}')
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном.
+    Возвращает (start, end) включительно, None — если заголовок не подходит
+    (тогда отдаётся весь файл), или бросает ValueError для невыполнимого диапазона.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N — последние N байт
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    """If-Range: диапазон отдаём, только если файл не изменился"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(last_modified) <= if_range_date
+
+
+def _file_range(path, start, length, chunk_size=FileResponse.block_size):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, name, storage=default_storage):
+    """Ответ с содержимым файла name из хранилища (без проверки доступа)"""
+    try:
+        path = storage.path(name)
+        stat = os.stat(path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Файл не найден')
+
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    # Наносекунды — чтобы аватар, заменённый в ту же секунду, получил новый ETag
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '')
+
+    if accel_prefix:
+        # nginx сам отдаст файл из internal-location, включая Range
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{quote(name)}"
+    elif getattr(settings, 'MEDIA_X_SENDFILE', False):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and _if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _file_range(path, start, length), status=206, content_type=content_type
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if name.startswith(MUTABLE_PREFIXES):
+        # Новый аватар получает то же имя и ту же ссылку, поэтому браузер
+        # перепроверяет файл по ETag при каждом показе (обычно ответ 304)
+        response['Cache-Control'] = 'private, no-cache'
+    else:
+        response['Cache-Control'] = f'private, max-age={url_max_age()}'
+    return response
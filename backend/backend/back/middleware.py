@@ -0,0 +1,111 @@
+"""
+Сжатие ответов API с выбором кодировки по Accept-Encoding (brotli / gzip).
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli опционален
+    brotli = None
+
+
+# Ответы меньше порога не сжимаем: выигрыш в байтах съедается заголовками и CPU
+DEFAULT_MIN_SIZE = 1024
+
+# Сжимаем только ответы API. HTML (админка) несёт CSRF-токен рядом с данными из
+# запроса, и его сжатие открывает атаку BREACH; картинки и архивы уже сжаты
+COMPRESSIBLE_CONTENT_TYPES = (
+    'application/json',
+)
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Разбирает Accept-Encoding в словарь {кодировка: q}"""
+    encodings = {}
+    for part in header.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(header: str) -> str | None:
+    """Выбирает лучшую поддерживаемую кодировку: br предпочтительнее gzip"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжимает JSON-ответы больше RESPONSE_COMPRESSION_MIN_SIZE байт.
+    Поддерживает brotli (если установлен пакет brotli) и gzip,
+    для потоковых ответов используется только gzip.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_CONTENT_TYPES):
+            return response
+        # Файлы, Range-ответы и отданные через X-Accel/X-Sendfile файлы не трогаем:
+        # смещения Range считаются по несжатому телу
+        if (
+            response.status_code == 206
+            or response.has_header('Content-Range')
+            or response.get('Accept-Ranges') == 'bytes'
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+
+        if response.streaming:
+            if encoding != 'gzip' or getattr(response, 'is_async', False):
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if len(response.content) < min_size:
+                return response
+            if encoding == 'br':
+                level = getattr(settings, 'RESPONSE_COMPRESSION_BROTLI_QUALITY', 5)
+                compressed = brotli.compress(response.content, quality=level)
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # Сжатое тело отличается от несжатого побайтно, поэтому ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+        response.headers['Content-Encoding'] = encoding
+        return response
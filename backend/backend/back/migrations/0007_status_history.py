@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Начальный статус заявки (workflow.INITIAL_STATUS_KEY) на момент миграции
+INITIAL_STATUS_NAME = 'Новая'
+
+
+def backfill_status_history(apps, schema_editor):
+    """
+    Для уже существующих заявок истории нет. Записываем создание заявки
+    в начальном статусе на момент создания и, если заявка уже не в нём,
+    переход в текущий статус на момент последнего изменения (промежуточные
+    переходы неизвестны).
+    """
+    Request = apps.get_model('back', 'Request')
+    Status = apps.get_model('back', 'Status')
+    RequestStatusHistory = apps.get_model('back', 'RequestStatusHistory')
+    initial_id = Status.objects.filter(name=INITIAL_STATUS_NAME).values_list('id_status', flat=True).first()
+    batch = []
+    for request_id, status_id, created_at, last_updated in Request.objects.values_list(
+        'id_request', 'status_id', 'created_at', 'last_updated'
+    ).iterator(chunk_size=2000):
+        if initial_id is None or status_id == initial_id:
+            batch.append(RequestStatusHistory(request_id=request_id, to_status_id=status_id, changed_at=created_at))
+        else:
+            batch.append(RequestStatusHistory(request_id=request_id, to_status_id=initial_id, changed_at=created_at))
+            batch.append(RequestStatusHistory(
+                request_id=request_id,
+                from_status_id=initial_id,
+                to_status_id=status_id,
+                changed_at=last_updated,
+            ))
+        if len(batch) >= 2000:
+            RequestStatusHistory.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        RequestStatusHistory.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0006_requestattachment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestStatusHistory',
+            fields=[
+                ('id_history', models.AutoField(primary_key=True, serialize=False)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата изменения')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='back.user', verbose_name='FK Кто изменил')),
+                ('from_status', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='back.status', verbose_name='Предыдущий статус')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='back.request', verbose_name='FK Заявка')),
+                ('to_status', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='back.status', verbose_name='Новый статус')),
+            ],
+            options={
+                'ordering': ['changed_at'],
+                'indexes': [models.Index(fields=['request', 'changed_at'], name='back_status_hist_req_idx'), models.Index(fields=['changed_at'], name='back_status_hist_time_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_status_history, migrations.RunPython.noop),
+    ]
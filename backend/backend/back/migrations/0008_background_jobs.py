@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0007_status_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestattachment',
+            name='original_name',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Исходное имя файла'),
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='state',
+            field=models.CharField(choices=[('pending', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка обработки')], default='ready', max_length=20, verbose_name='Состояние обработки'),
+        ),
+        migrations.AlterField(
+            model_name='requestattachment',
+            name='file',
+            field=models.FileField(blank=True, upload_to='attachments/', verbose_name='Файл'),
+        ),
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id_job', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=100, verbose_name='Тип задачи')),
+                ('payload', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('state', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Состояние')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Число попыток')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Не раньше')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'run_after'], name='back_job_queue_idx')],
+            },
+        ),
+    ]
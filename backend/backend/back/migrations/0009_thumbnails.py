@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0008_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestattachment',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Миниатюры'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_thumbnails',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Миниатюры аватара'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:19
+
+import back.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0009_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id_blob', models.BigAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь в хранилище')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('refcount', models.IntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='request',
+            name='attachments',
+            field=models.FileField(blank=True, null=True, storage=back.storage.attachment_storage, upload_to='attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='requestattachment',
+            name='file',
+            field=models.FileField(blank=True, storage=back.storage.attachment_storage, upload_to='attachments/', verbose_name='Файл'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0010_blob_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id_upload', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('original_name', models.CharField(max_length=255, verbose_name='Исходное имя файла')),
+                ('staged_name', models.CharField(max_length=64, verbose_name='Имя во временном каталоге')),
+                ('size', models.BigIntegerField(verbose_name='Размер файла, байт')),
+                ('received', models.BigIntegerField(default=0, verbose_name='Получено, байт')),
+                ('state', models.CharField(choices=[('uploading', 'Загружается'), ('complete', 'Загружена'), ('attached', 'Прикреплена к заявке')], default='uploading', max_length=20, verbose_name='Состояние')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to='back.user', verbose_name='FK Пользователь')),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'back_request_search'
+
+POSTGRES_FORWARD = [
+    f'''
+    CREATE TABLE {SEARCH_TABLE} (
+        request_id integer PRIMARY KEY REFERENCES back_request (id_request) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )
+    ''',
+    f'CREATE INDEX {SEARCH_TABLE}_gin ON {SEARCH_TABLE} USING GIN (document)',
+    # Первичное заполнение: описание (вес A) и комментарии (вес B) в конфигурациях russian и english
+    f'''
+    INSERT INTO {SEARCH_TABLE} (request_id, document)
+    SELECT r.id_request,
+           setweight(to_tsvector('russian', coalesce(r.description, '')), 'A')
+           || setweight(to_tsvector('english', coalesce(r.description, '')), 'A')
+           || setweight(to_tsvector('russian', coalesce(c.comments, '')), 'B')
+           || setweight(to_tsvector('english', coalesce(c.comments, '')), 'B')
+    FROM back_request r
+    LEFT JOIN (
+        SELECT rc.request_id, string_agg(cm.content, E'\\n') AS comments
+        FROM back_request_comments rc
+        JOIN back_comment cm ON cm.id_comment = rc.comment_id
+        GROUP BY rc.request_id
+    ) c ON c.request_id = r.id_request
+    ''',
+]
+
+SQLITE_FORWARD = [
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(description, comments, tokenize='unicode61 remove_diacritics 2')",
+    f'''
+    INSERT INTO {SEARCH_TABLE} (rowid, description, comments)
+    SELECT r.id_request, coalesce(r.description, ''),
+           coalesce((
+               SELECT group_concat(cm.content, char(10))
+               FROM back_request_comments rc
+               JOIN back_comment cm ON cm.id_comment = rc.comment_id
+               WHERE rc.request_id = r.id_request
+           ), '')
+    FROM back_request r
+    ''',
+]
+
+
+def create_search_table(apps, schema_editor):
+    statements = {
+        'postgresql': POSTGRES_FORWARD,
+        'sqlite': SQLITE_FORWARD,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0011_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# Выражение совпадает с back.search.USER_SEARCH_DOCUMENT
+USER_SEARCH_DOCUMENT = (
+    "lower(last_name || ' ' || first_name || ' ' || middle_name || ' ' "
+    "|| coalesce(username, '') || ' ' || coalesce(email, ''))"
+)
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS back_user_search_trgm ON back_user '
+        f'USING GIN (({USER_SEARCH_DOCUMENT}) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS back_user_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0012_request_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
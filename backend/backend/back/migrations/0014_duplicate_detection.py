@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0013_user_trigram_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestSignature',
+            fields=[
+                ('request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='back.request', verbose_name='FK Заявка')),
+                ('signature', models.BinaryField(verbose_name='Сигнатура')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestLshBucket',
+            fields=[
+                ('id_bucket', models.BigAutoField(primary_key=True, serialize=False)),
+                ('bucket', models.BigIntegerField(verbose_name='Ключ корзины')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='back.request', verbose_name='FK Заявка')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='back_lsh_bucket_idx')],
+            },
+        ),
+    ]
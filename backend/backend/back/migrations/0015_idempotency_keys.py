@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0014_duplicate_detection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256 от endpoint и ключа')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='SHA-256 запроса')),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Код ответа')),
+                ('content_type', models.CharField(blank=True, default='', max_length=100, verbose_name='Тип ответа')),
+                ('body', models.BinaryField(blank=True, default=b'', verbose_name='Тело ответа (zlib)')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата создания')),
+                ('expires_at', models.DateTimeField(verbose_name='Истекает')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='back_idempotency_exp_idx')],
+            },
+        ),
+    ]
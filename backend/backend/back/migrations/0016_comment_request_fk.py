@@ -0,0 +1,79 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_links(apps, schema_editor):
+    """
+    Переносит связи из таблицы M2M в Comment.request. Комментарий, привязанный
+    к нескольким заявкам, копируется; комментарии без заявки удаляются.
+    """
+    Comment = apps.get_model('back', 'Comment')
+    Request = apps.get_model('back', 'Request')
+    Through = Request.comments.through
+
+    seen = set()
+    copies = []
+    links = Through.objects.order_by('comment_id', 'request_id').values_list('comment_id', 'request_id')
+    comments = Comment.objects.in_bulk(list({comment_id for comment_id, _ in links}))
+    for comment_id, request_id in links:
+        comment = comments[comment_id]
+        if comment_id not in seen:
+            seen.add(comment_id)
+            Comment.objects.filter(id_comment=comment_id).update(request_id=request_id)
+        else:
+            copies.append(Comment(
+                request_id=request_id,
+                content=comment.content,
+                created_at=comment.created_at,
+                updated_at=comment.updated_at,
+            ))
+    # auto_now_add перезаписывает дату при вставке — восстанавливаем исходную
+    created_at = [copy.created_at for copy in copies]
+    for copy, original_date in zip(Comment.objects.bulk_create(copies), created_at):
+        Comment.objects.filter(id_comment=copy.id_comment).update(created_at=original_date)
+    Comment.objects.filter(request__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+    # Перенос связей и NOT NULL не могут идти в одной транзакции: на PostgreSQL
+    # FK создаётся DEFERRABLE INITIALLY DEFERRED, и ALTER TABLE после UPDATE/DELETE
+    # в той же транзакции падает с "pending trigger events". Перенос выполняется
+    # отдельной транзакцией, остальные операции — каждая сама по себе.
+    atomic = False
+
+    dependencies = [
+        ('back', '0015_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='request',
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='+',
+                to='back.request',
+                verbose_name='FK Заявка',
+            ),
+        ),
+        migrations.RunPython(copy_links, migrations.RunPython.noop, atomic=True),
+        migrations.RemoveField(
+            model_name='request',
+            name='comments',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='request',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='comments',
+                to='back.request',
+                verbose_name='FK Заявка',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['request', 'created_at'], name='back_comment_req_time_idx'),
+        ),
+    ]
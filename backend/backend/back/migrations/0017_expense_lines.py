@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+
+def copy_expenses(apps, schema_editor):
+    """
+    Строка затрат для каждой заявки, ссылавшейся на непустую строку Table
+    (общая строка 'Заявка' с нулевой суммой — это отсутствие затрат), и свёртка по ним.
+    """
+    Request = apps.get_model('back', 'Request')
+    RequestExpense = apps.get_model('back', 'RequestExpense')
+    ExpenseRollup = apps.get_model('back', 'ExpenseRollup')
+
+    requests = Request.objects.filter(expense__isnull=False).exclude(
+        Q(expense__expense_name='Заявка') & Q(expense__amount=0)
+    ).values_list('id_request', 'office_address_id', 'created_at', 'expense__expense_name', 'expense__amount')
+    batch = []
+    for request_id, office_id, created_at, name, amount in requests.iterator(chunk_size=1000):
+        batch.append(RequestExpense(
+            request_id=request_id,
+            office_id=office_id,
+            month=timezone.localdate(created_at).replace(day=1),
+            name='' if name == 'Заявка' else name,
+            amount=amount,
+        ))
+        if len(batch) >= 1000:
+            RequestExpense.objects.bulk_create(batch)
+            batch = []
+    RequestExpense.objects.bulk_create(batch)
+
+    ExpenseRollup.objects.bulk_create([
+        ExpenseRollup(office_id=row['office_id'], month=row['month'], total=row['total'], lines_count=row['count'])
+        for row in RequestExpense.objects.order_by().values('office_id', 'month').annotate(
+            total=Sum('amount'), count=Count('id_expense')
+        )
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0016_comment_request_fk'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='request',
+            name='expense',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='back.table', verbose_name='FK таблица затрат'),
+        ),
+        migrations.CreateModel(
+            name='RequestExpense',
+            fields=[
+                ('id_expense', models.BigAutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField(verbose_name='Месяц (первое число)')),
+                ('name', models.CharField(max_length=255, verbose_name='Статья затрат')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('office', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='back.office', verbose_name='FK Офис')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_lines', to='back.request', verbose_name='FK Заявка')),
+            ],
+            options={
+                'ordering': ['id_expense'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id_rollup', models.BigAutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField(verbose_name='Месяц (первое число)')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма затрат')),
+                ('lines_count', models.IntegerField(default=0, verbose_name='Число строк затрат')),
+                ('office', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to='back.office', verbose_name='FK Офис')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='back_expense_rollup_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('office', 'month'), name='back_expense_rollup_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_expenses, migrations.RunPython.noop),
+    ]
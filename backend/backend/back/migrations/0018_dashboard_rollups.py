@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0017_expense_lines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0, verbose_name='Последний обработанный id')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestStatsRollup',
+            fields=[
+                ('id_rollup', models.BigAutoField(primary_key=True, serialize=False)),
+                ('period', models.CharField(choices=[('hour', 'Час'), ('day', 'День')], max_length=10, verbose_name='Период')),
+                ('bucket', models.DateTimeField(verbose_name='Начало периода')),
+                ('region', models.CharField(blank=True, default='', max_length=255, verbose_name='Регион офиса')),
+                ('urgency', models.CharField(max_length=50, verbose_name='Срочность')),
+                ('created', models.IntegerField(default=0, verbose_name='Создано заявок')),
+                ('entered', models.IntegerField(default=0, verbose_name='Переходов в статус')),
+                ('left', models.IntegerField(default=0, verbose_name='Переходов из статуса')),
+                ('failure_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='back.typeoffailure', verbose_name='Тип поломки')),
+                ('office', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='back.office', verbose_name='FK Офис')),
+                ('status', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='back.status', verbose_name='Статус')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['office', 'period', 'bucket'], name='back_stats_rollup_office_idx'), models.Index(fields=['region', 'period', 'bucket'], name='back_stats_rollup_region_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'office', 'failure_type', 'urgency', 'status'), name='back_stats_rollup_uniq')],
+            },
+        ),
+    ]
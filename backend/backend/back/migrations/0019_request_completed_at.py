@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:39
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Названия статуса 'Выполнена' в БД, включая устаревшее
+COMPLETED_NAMES = ('Выполнена', 'Выполненные')
+
+
+def backfill_completed_at(apps, schema_editor):
+    """Время выполнения — последний переход в выполненный статус по журналу (или last_updated)"""
+    Request = apps.get_model('back', 'Request')
+    Status = apps.get_model('back', 'Status')
+    RequestStatusHistory = apps.get_model('back', 'RequestStatusHistory')
+
+    completed_ids = list(Status.objects.filter(name__in=COMPLETED_NAMES).values_list('id_status', flat=True))
+    if not completed_ids:
+        return
+    last_completed = RequestStatusHistory.objects.filter(
+        request_id=OuterRef('pk'), to_status_id__in=completed_ids
+    ).order_by().values('request_id').annotate(last=Max('changed_at')).values('last')
+    Request.objects.filter(status_id__in=completed_ids).update(
+        completed_at=Coalesce(Subquery(last_completed), 'last_updated')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0018_dashboard_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['created_at'], name='back_request_created_idx'),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+    ]
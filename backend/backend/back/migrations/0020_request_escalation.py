@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0019_request_completed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='escalated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('completed_at__isnull', True), ('due_time__isnull', False), ('escalated_at__isnull', True)), fields=['due_time'], name='back_request_overdue_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:45
+
+from django.db import migrations, models
+from django.db.models import Case, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+# Веса срочности на момент миграции (трудоёмкость типов поломок не учитывается)
+URGENCY_WEIGHTS = {'Критическая': 4.0, 'Высокая': 2.0, 'Средняя': 1.0, 'Низкая': 0.5}
+
+# Статусы, в которых заявка не занимает исполнителя
+RELEASING_NAMES = ('Выполнена', 'Выполненные', 'Ожидают закупки')
+
+
+def backfill_weights(apps, schema_editor):
+    """Вес заявок по срочности и взвешенная загрузка сотрудников по их открытым заявкам"""
+    Request = apps.get_model('back', 'Request')
+    Load = apps.get_model('back', 'Load')
+
+    Request.objects.update(routing_weight=Case(
+        *[When(urgency=urgency, then=Value(weight)) for urgency, weight in URGENCY_WEIGHTS.items()],
+        default=Value(1.0),
+        output_field=FloatField(),
+    ))
+    open_weights = Request.objects.filter(performer_id=OuterRef('staff_id')).exclude(
+        status__name__in=RELEASING_NAMES
+    ).order_by().values('performer_id').annotate(total=Sum('routing_weight')).values('total')
+    Load.objects.update(weighted_load=Coalesce(Subquery(open_weights), Value(0.0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0020_request_escalation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='load',
+            name='weighted_load',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='routing_weight',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.RunPython(backfill_weights, migrations.RunPython.noop),
+    ]
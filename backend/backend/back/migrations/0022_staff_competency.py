@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0021_routing_weights'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffCompetency',
+            fields=[
+                ('id_competency', models.AutoField(primary_key=True, serialize=False)),
+                ('level', models.PositiveSmallIntegerField(choices=[(1, 'Базовый'), (2, 'Уверенный'), (3, 'Эксперт')], default=2, verbose_name='Уровень')),
+                ('failure_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='competencies', to='back.typeoffailure', verbose_name='FK Тип поломки')),
+                ('staff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='competencies', to='back.user', verbose_name='FK Сотрудник АХО')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('staff', 'failure_type'), name='back_staff_competency_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0022_staff_competency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id_event', models.BigAutoField(primary_key=True, serialize=False)),
+                ('message', models.TextField(verbose_name='Текст уведомления')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('deliver_after', models.DateTimeField(verbose_name='Доставить не раньше')),
+                ('request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='back.request', verbose_name='FK Заявка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='back.user', verbose_name='FK Получатель')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deliver_after'], name='back_notif_event_due_idx'), models.Index(fields=['user', 'request'], name='back_notif_event_key_idx')],
+            },
+        ),
+    ]
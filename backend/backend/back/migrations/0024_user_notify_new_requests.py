@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0023_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='notify_new_requests',
+            field=models.BooleanField(default=False, verbose_name='Уведомлять о новых заявках'),
+        ),
+    ]
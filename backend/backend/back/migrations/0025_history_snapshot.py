@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0024_user_notify_new_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requeststatushistory',
+            name='failure_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='back.typeoffailure', verbose_name='Тип поломки'),
+        ),
+        migrations.AddField(
+            model_name='requeststatushistory',
+            name='from_failure_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='back.typeoffailure', verbose_name='Тип поломки в предыдущем статусе'),
+        ),
+        migrations.AddField(
+            model_name='requeststatushistory',
+            name='from_office',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='back.office', verbose_name='FK Офис в предыдущем статусе'),
+        ),
+        migrations.AddField(
+            model_name='requeststatushistory',
+            name='from_urgency',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Срочность в предыдущем статусе'),
+        ),
+        migrations.AddField(
+            model_name='requeststatushistory',
+            name='office',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='back.office', verbose_name='FK Офис'),
+        ),
+        migrations.AddField(
+            model_name='requeststatushistory',
+            name='urgency',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Срочность'),
+        ),
+    ]
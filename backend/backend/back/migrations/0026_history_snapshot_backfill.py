@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:06
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_snapshots(apps, schema_editor):
+    """
+    Срез для старых записей журнала — текущие офис, тип поломки и срочность заявки
+    (истории их изменений нет). Сводка дашборда удаляется: refresh_dashboard
+    построит её заново по срезам, а не по текущим значениям заявок.
+    """
+    Request = apps.get_model('back', 'Request')
+    RequestStatusHistory = apps.get_model('back', 'RequestStatusHistory')
+    RequestStatsRollup = apps.get_model('back', 'RequestStatsRollup')
+    RollupWatermark = apps.get_model('back', 'RollupWatermark')
+
+    request = Request.objects.filter(id_request=OuterRef('request_id'))
+    office = Subquery(request.values('office_address_id')[:1])
+    failure_type = Subquery(request.values('failure_type_id')[:1])
+    urgency = Subquery(request.values('urgency')[:1])
+    RequestStatusHistory.objects.update(
+        office_id=office, failure_type_id=failure_type, urgency=urgency,
+        from_office_id=office, from_failure_type_id=failure_type, from_urgency=urgency,
+    )
+    RequestStatsRollup.objects.all().delete()
+    RollupWatermark.objects.filter(name='request_stats').delete()
+
+
+class Migration(migrations.Migration):
+    # Отдельно от добавления полей: на PostgreSQL UPDATE новых FK-колонок
+    # в одной транзакции с изменением схемы таблицы может упасть с "pending trigger events"
+
+    dependencies = [
+        ('back', '0025_history_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
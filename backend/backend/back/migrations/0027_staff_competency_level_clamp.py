@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:10
+
+from django.db import migrations
+
+
+def clamp_levels(apps, schema_editor):
+    """Уровень 0 (допускался PositiveSmallIntegerField) заменяем базовым"""
+    StaffCompetency = apps.get_model('back', 'StaffCompetency')
+    StaffCompetency.objects.filter(level__lt=1).update(level=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0026_history_snapshot_backfill'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_levels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0027_staff_competency_level_clamp'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='staffcompetency',
+            constraint=models.CheckConstraint(condition=models.Q(('level__gte', 1)), name='back_staff_competency_level_gte_1'),
+        ),
+    ]
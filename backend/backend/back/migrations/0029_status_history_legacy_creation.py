@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:25
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# Начальный статус заявки (workflow.INITIAL_STATUS_KEY) на момент миграции
+INITIAL_STATUS_NAME = 'Новая'
+
+
+def repair_legacy_history(apps, schema_editor):
+    """
+    Прежняя версия 0007 записывала заявкам, созданным до журнала, одну запись
+    «создана в текущем статусе» на момент последнего изменения: дашборд и время
+    в статусе считали их созданными тогда же, а выполненные — созданными
+    и закрытыми одновременно. Переписываем их так же, как теперь делает 0007:
+    создание в начальном статусе на момент создания и переход в текущий статус
+    на момент последнего изменения. Сводка дашборда строится заново.
+    """
+    Request = apps.get_model('back', 'Request')
+    Status = apps.get_model('back', 'Status')
+    RequestStatusHistory = apps.get_model('back', 'RequestStatusHistory')
+    RequestStatsRollup = apps.get_model('back', 'RequestStatsRollup')
+    RollupWatermark = apps.get_model('back', 'RollupWatermark')
+
+    initial_id = Status.objects.filter(name=INITIAL_STATUS_NAME).values_list('id_status', flat=True).first()
+    if initial_id is None:
+        return
+    created_at = Subquery(Request.objects.filter(id_request=OuterRef('request_id')).values('created_at')[:1])
+    # Записи создания, сделанные views, стоят ровно на created_at заявки
+    legacy = RequestStatusHistory.objects.filter(from_status__isnull=True).exclude(changed_at=created_at)
+    if not legacy.exists():
+        return
+
+    legacy.filter(to_status_id=initial_id).update(changed_at=created_at)
+
+    moved = legacy.exclude(to_status_id=initial_id)
+    batch = []
+    for request_id, office_id, failure_type_id, urgency, request_created_at in moved.annotate(
+        request_created_at=created_at
+    ).values_list(
+        'request_id', 'office_id', 'failure_type_id', 'urgency', 'request_created_at'
+    ).iterator(chunk_size=2000):
+        batch.append(RequestStatusHistory(
+            request_id=request_id,
+            to_status_id=initial_id,
+            changed_at=request_created_at,
+            office_id=office_id,
+            failure_type_id=failure_type_id,
+            urgency=urgency,
+            from_office_id=office_id,
+            from_failure_type_id=failure_type_id,
+            from_urgency=urgency,
+        ))
+        if len(batch) >= 2000:
+            RequestStatusHistory.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        RequestStatusHistory.objects.bulk_create(batch)
+    # Новые записи создания стоят на created_at и под условие legacy не попадают
+    moved.update(from_status_id=initial_id)
+
+    RequestStatsRollup.objects.all().delete()
+    RollupWatermark.objects.filter(name='request_stats').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0028_staff_competency_level_check'),
+    ]
+
+    operations = [
+        migrations.RunPython(repair_legacy_history, migrations.RunPython.noop),
+    ]
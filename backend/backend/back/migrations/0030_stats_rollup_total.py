@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0029_status_history_legacy_creation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='requeststatsrollup',
+            name='period',
+            field=models.CharField(choices=[('hour', 'Час'), ('day', 'День'), ('total', 'Всё время')], max_length=10, verbose_name='Период'),
+        ),
+        migrations.AddIndex(
+            model_name='requeststatsrollup',
+            index=models.Index(fields=['period', 'status'], name='back_stats_rollup_period_idx'),
+        ),
+    ]
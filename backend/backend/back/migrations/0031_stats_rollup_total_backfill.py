@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:20
+
+from datetime import datetime, timezone
+
+from django.db import migrations
+from django.db.models import Sum
+
+# dashboard.TOTAL_BUCKET на момент миграции
+TOTAL_BUCKET = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_totals(apps, schema_editor):
+    """Строки «всё время» — суммы уже свёрнутых дневных строк по ключу"""
+    RequestStatsRollup = apps.get_model('back', 'RequestStatsRollup')
+    RequestStatsRollup.objects.filter(period='total').delete()
+    totals = RequestStatsRollup.objects.filter(period='day').order_by().values(
+        'office_id', 'region', 'failure_type_id', 'urgency', 'status_id'
+    ).annotate(created_total=Sum('created'), entered_total=Sum('entered'), left_total=Sum('left'))
+    RequestStatsRollup.objects.bulk_create([
+        RequestStatsRollup(
+            period='total',
+            bucket=TOTAL_BUCKET,
+            office_id=row['office_id'],
+            region=row['region'],
+            failure_type_id=row['failure_type_id'],
+            urgency=row['urgency'],
+            status_id=row['status_id'],
+            created=row['created_total'],
+            entered=row['entered_total'],
+            left=row['left_total'],
+        )
+        for row in totals.iterator(chunk_size=2000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back', '0030_stats_rollup_total'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
+from django.utils import timezone
 import os
 
+from .storage import attachment_storage
+
 
 def user_avatar_path(instance, filename):
     """Генерирует путь для сохранения аватара пользователя"""
@@ -56,6 +59,9 @@ class User(models.Model):
     desk_number = models.CharField(max_length=50, null=True, blank=True, verbose_name='Номер стола')
     birth_date = models.DateField(null=True, blank=True, verbose_name='Дата рождения')
     avatar = models.ImageField(upload_to=user_avatar_path, null=True, blank=True, verbose_name='Аватар')
+    avatar_thumbnails = models.JSONField(default=dict, blank=True, verbose_name='Миниатюры аватара')
+    # Сотрудник АХО получает уведомления о новых заявках своего офиса и дочерних офисов
+    notify_new_requests = models.BooleanField(default=False, verbose_name='Уведомлять о новых заявках')
     office = models.ForeignKey(
         Office,
         on_delete=models.CASCADE,
@@ -110,10 +116,21 @@ class TypeOfFailure(models.Model):
 
 class Comment(models.Model):
     id_comment = models.AutoField(primary_key=True)
+    request = models.ForeignKey(
+        'Request',
+        on_delete=models.CASCADE,
+        related_name='comments',
+        verbose_name='FK Заявка'
+    )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['request', 'created_at'], name='back_comment_req_time_idx'),
+        ]
+
 
 class Request(models.Model):
     id_request = models.AutoField(primary_key=True)
@@ -131,7 +148,7 @@ class Request(models.Model):
     )
     urgency = models.CharField(max_length=50)
     description = models.TextField()
-    attachments = models.FileField(upload_to='attachments/', null=True, blank=True)
+    attachments = models.FileField(upload_to='attachments/', storage=attachment_storage, null=True, blank=True)
     office_address = models.ForeignKey(
         Office,
         on_delete=models.CASCADE,
@@ -140,12 +157,14 @@ class Request(models.Model):
     office_location = models.CharField(max_length=255)  # внутри офиса
     employee_location = models.CharField(max_length=255)  # место сотрудника
 
+    # Устаревшая общая строка затрат; затраты заявки хранятся в RequestExpense
     expense = models.ForeignKey(
         Table,
         on_delete=models.CASCADE,
+        null=True,
+        blank=True,
         verbose_name='FK таблица затрат'
     )
-    comments = models.ManyToManyField(Comment, blank=True)
     performer = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -161,6 +180,25 @@ class Request(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     due_time = models.DateTimeField(null=True, blank=True)  # Время на выполнение
+    # Когда заявка перешла в статус 'Выполнена'; сбрасывается при переоткрытии
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # Когда по просроченной заявке отправлена эскалация; сбрасывается при смене срока
+    escalated_at = models.DateTimeField(null=True, blank=True)
+    # Вес заявки в загрузке исполнителя (срочность × трудоёмкость), см. routing.py
+    routing_weight = models.FloatField(default=1.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='back_request_created_idx'),
+            # Частичный индекс: только открытые заявки, по которым ещё не было эскалации.
+            # Эскалированные и выполненные выпадают из индекса, поэтому обход
+            # просроченных стоит столько, сколько заявок просрочено впервые
+            models.Index(
+                fields=['due_time'],
+                name='back_request_overdue_idx',
+                condition=models.Q(completed_at__isnull=True, escalated_at__isnull=True, due_time__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Заявка {self.id_request}"
@@ -175,7 +213,24 @@ class RequestAttachment(models.Model):
         related_name='request_attachments',
         verbose_name='FK Заявка'
     )
-    file = models.FileField(upload_to='attachments/', verbose_name='Файл')
+    STATE_PENDING = 'pending'
+    STATE_READY = 'ready'
+    STATE_FAILED = 'failed'
+    STATE_CHOICES = [
+        (STATE_PENDING, 'Обрабатывается'),
+        (STATE_READY, 'Готово'),
+        (STATE_FAILED, 'Ошибка обработки'),
+    ]
+
+    file = models.FileField(upload_to='attachments/', storage=attachment_storage, blank=True, verbose_name='Файл')
+    original_name = models.CharField(max_length=255, blank=True, default='', verbose_name='Исходное имя файла')
+    thumbnails = models.JSONField(default=dict, blank=True, verbose_name='Миниатюры')
+    state = models.CharField(
+        max_length=20,
+        choices=STATE_CHOICES,
+        default=STATE_READY,
+        verbose_name='Состояние обработки'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
 
     class Meta:
@@ -212,6 +267,38 @@ class Notification(models.Model):
         return f"Уведомление для {self.user} - {self.message[:50]}"
 
 
+class NotificationEvent(models.Model):
+    """
+    Очередь уведомлений (outbox). Событие пишется в транзакции изменения заявки;
+    воркер склеивает события одного получателя по одной заявке и создаёт
+    уведомления пачкой (notifications.py).
+    """
+    id_event = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='FK Получатель'
+    )
+    request = models.ForeignKey(
+        Request,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True,
+        verbose_name='FK Заявка'
+    )
+    message = models.TextField(verbose_name='Текст уведомления')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    deliver_after = models.DateTimeField(verbose_name='Доставить не раньше')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deliver_after'], name='back_notif_event_due_idx'),
+            models.Index(fields=['user', 'request'], name='back_notif_event_key_idx'),
+        ]
+
+
 class Load(models.Model):
     id_load = models.AutoField(primary_key=True)
     staff = models.ForeignKey(
@@ -223,3 +310,381 @@ class Load(models.Model):
     current_tasks_count = models.IntegerField()
     current_tasks = models.TextField()
     urgency = models.CharField(max_length=50)
+    # Сумма весов открытых заявок сотрудника; меняется вместе с current_tasks_count
+    weighted_load = models.FloatField(default=0)
+
+
+class StaffCompetency(models.Model):
+    """
+    Компетенция сотрудника АХО по типу поломки. Если для типа поломки заданы
+    компетенции, заявки этого типа назначаются только компетентным сотрудникам.
+    """
+    LEVEL_BASIC = 1
+    LEVEL_CONFIDENT = 2
+    LEVEL_EXPERT = 3
+    LEVEL_CHOICES = (
+        (LEVEL_BASIC, 'Базовый'),
+        (LEVEL_CONFIDENT, 'Уверенный'),
+        (LEVEL_EXPERT, 'Эксперт'),
+    )
+
+    id_competency = models.AutoField(primary_key=True)
+    staff = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='competencies',
+        verbose_name='FK Сотрудник АХО'
+    )
+    failure_type = models.ForeignKey(
+        TypeOfFailure,
+        on_delete=models.CASCADE,
+        related_name='competencies',
+        verbose_name='FK Тип поломки'
+    )
+    level = models.PositiveSmallIntegerField(choices=LEVEL_CHOICES, default=LEVEL_CONFIDENT, verbose_name='Уровень')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['staff', 'failure_type'], name='back_staff_competency_uniq'),
+            # Загрузка кандидата делится на уровень при выборе исполнителя
+            models.CheckConstraint(condition=models.Q(level__gte=1), name='back_staff_competency_level_gte_1'),
+        ]
+
+    def __str__(self):
+        return f"{self.staff_id} / {self.failure_type_id}: {self.get_level_display()}"
+
+
+class RequestStatusHistory(models.Model):
+    """Журнал переходов статусов заявки (только добавление записей)"""
+    id_history = models.AutoField(primary_key=True)
+    request = models.ForeignKey(
+        Request,
+        on_delete=models.CASCADE,
+        related_name='status_history',
+        verbose_name='FK Заявка'
+    )
+    from_status = models.ForeignKey(
+        Status,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Предыдущий статус'
+    )
+    to_status = models.ForeignKey(
+        Status,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Новый статус'
+    )
+    changed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='FK Кто изменил'
+    )
+    changed_at = models.DateTimeField(default=timezone.now, verbose_name='Дата изменения')
+    # Срез заявки для сводки дашборда: под каким офисом, типом поломки и срочностью
+    # заявка вошла в to_status и под каким была учтена в from_status (см. dashboard.py)
+    office = models.ForeignKey(
+        Office,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='FK Офис'
+    )
+    failure_type = models.ForeignKey(
+        TypeOfFailure,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Тип поломки'
+    )
+    urgency = models.CharField(max_length=50, blank=True, default='', verbose_name='Срочность')
+    from_office = models.ForeignKey(
+        Office,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='FK Офис в предыдущем статусе'
+    )
+    from_failure_type = models.ForeignKey(
+        TypeOfFailure,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Тип поломки в предыдущем статусе'
+    )
+    from_urgency = models.CharField(max_length=50, blank=True, default='', verbose_name='Срочность в предыдущем статусе')
+
+    class Meta:
+        ordering = ['changed_at']
+        indexes = [
+            models.Index(fields=['request', 'changed_at'], name='back_status_hist_req_idx'),
+            models.Index(fields=['changed_at'], name='back_status_hist_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Заявка {self.request_id}: {self.from_status_id} -> {self.to_status_id}"
+
+
+class RequestExpense(models.Model):
+    """
+    Строка затрат заявки. Офис и месяц копируются из заявки при записи,
+    чтобы свёртка ExpenseRollup обновлялась по самим строкам.
+    """
+    id_expense = models.BigAutoField(primary_key=True)
+    request = models.ForeignKey(
+        Request,
+        on_delete=models.CASCADE,
+        related_name='expense_lines',
+        verbose_name='FK Заявка'
+    )
+    office = models.ForeignKey(
+        Office,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='FK Офис'
+    )
+    month = models.DateField(verbose_name='Месяц (первое число)')
+    name = models.CharField(max_length=255, verbose_name='Статья затрат')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Сумма')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    class Meta:
+        ordering = ['id_expense']
+
+    def __str__(self):
+        return f"{self.name}: {self.amount}"
+
+
+class ExpenseRollup(models.Model):
+    """Сумма затрат по офису за месяц, обновляется при каждой записи строк затрат"""
+    id_rollup = models.BigAutoField(primary_key=True)
+    office = models.ForeignKey(
+        Office,
+        on_delete=models.CASCADE,
+        related_name='expense_rollups',
+        verbose_name='FK Офис'
+    )
+    month = models.DateField(verbose_name='Месяц (первое число)')
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма затрат')
+    lines_count = models.IntegerField(default=0, verbose_name='Число строк затрат')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['office', 'month'], name='back_expense_rollup_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['month'], name='back_expense_rollup_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.office_id} {self.month:%Y-%m}: {self.total}"
+
+
+class RequestStatsRollup(models.Model):
+    """
+    Сводка событий журнала статусов за час или день в разрезе офиса, типа
+    поломки, срочности и статуса. Строки периода «всё время» (одна на ключ)
+    хранят итог с начала журнала: по ним считается текущая очередь. Заполняется командой refresh_dashboard (см. dashboard.py).
+    """
+    PERIOD_HOUR = 'hour'
+    PERIOD_DAY = 'day'
+    PERIOD_TOTAL = 'total'
+    PERIOD_CHOICES = [
+        (PERIOD_HOUR, 'Час'),
+        (PERIOD_DAY, 'День'),
+        (PERIOD_TOTAL, 'Всё время'),
+    ]
+
+    id_rollup = models.BigAutoField(primary_key=True)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, verbose_name='Период')
+    bucket = models.DateTimeField(verbose_name='Начало периода')
+    office = models.ForeignKey(
+        Office,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='FK Офис'
+    )
+    region = models.CharField(max_length=255, blank=True, default='', verbose_name='Регион офиса')
+    failure_type = models.ForeignKey(
+        TypeOfFailure,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Тип поломки'
+    )
+    urgency = models.CharField(max_length=50, verbose_name='Срочность')
+    status = models.ForeignKey(
+        Status,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Статус'
+    )
+    created = models.IntegerField(default=0, verbose_name='Создано заявок')
+    entered = models.IntegerField(default=0, verbose_name='Переходов в статус')
+    left = models.IntegerField(default=0, verbose_name='Переходов из статуса')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'bucket', 'office', 'failure_type', 'urgency', 'status'],
+                name='back_stats_rollup_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['office', 'period', 'bucket'], name='back_stats_rollup_office_idx'),
+            models.Index(fields=['region', 'period', 'bucket'], name='back_stats_rollup_region_idx'),
+            # Очередь без фильтра по офису читает только строки «всё время»
+            models.Index(fields=['period', 'status'], name='back_stats_rollup_period_idx'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Позиция, до которой журнал уже свёрнут (id последней обработанной записи)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0, verbose_name='Последний обработанный id')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
+class RequestSignature(models.Model):
+    """MinHash-сигнатура описания заявки для поиска дублей (см. dedup.py)"""
+    request = models.OneToOneField(
+        Request,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='FK Заявка'
+    )
+    signature = models.BinaryField(verbose_name='Сигнатура')
+
+    def __str__(self):
+        return f"Сигнатура заявки {self.request_id}"
+
+
+class RequestLshBucket(models.Model):
+    """LSH-корзина сигнатуры заявки: по одной строке на полосу"""
+    id_bucket = models.BigAutoField(primary_key=True)
+    request = models.ForeignKey(
+        Request,
+        on_delete=models.CASCADE,
+        related_name='lsh_buckets',
+        verbose_name='FK Заявка'
+    )
+    bucket = models.BigIntegerField(verbose_name='Ключ корзины')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bucket'], name='back_lsh_bucket_idx'),
+        ]
+
+
+class ChunkedUpload(models.Model):
+    """
+    Загрузка файла частями (с возможностью продолжить после обрыва).
+    Части дописываются в файл во временном каталоге загрузок, после
+    завершения файл прикрепляется к заявке по id загрузки.
+    """
+    STATE_UPLOADING = 'uploading'
+    STATE_COMPLETE = 'complete'
+    STATE_ATTACHED = 'attached'
+    STATE_CHOICES = [
+        (STATE_UPLOADING, 'Загружается'),
+        (STATE_COMPLETE, 'Загружена'),
+        (STATE_ATTACHED, 'Прикреплена к заявке'),
+    ]
+
+    id_upload = models.CharField(max_length=32, primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='chunked_uploads',
+        verbose_name='FK Пользователь'
+    )
+    original_name = models.CharField(max_length=255, verbose_name='Исходное имя файла')
+    staged_name = models.CharField(max_length=64, verbose_name='Имя во временном каталоге')
+    size = models.BigIntegerField(verbose_name='Размер файла, байт')
+    received = models.BigIntegerField(default=0, verbose_name='Получено, байт')
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=STATE_UPLOADING, verbose_name='Состояние')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    def __str__(self):
+        return f"Загрузка {self.id_upload} ({self.received}/{self.size})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Сохранённый ответ на изменяющий запрос с заголовком Idempotency-Key.
+    Повтор запроса с тем же ключом получает этот ответ без повторных записей.
+    """
+    key = models.CharField(max_length=64, primary_key=True, verbose_name='SHA-256 от endpoint и ключа')
+    fingerprint = models.CharField(max_length=64, verbose_name='SHA-256 запроса')
+    # None — первый запрос с этим ключом ещё выполняется
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Код ответа')
+    content_type = models.CharField(max_length=100, blank=True, default='', verbose_name='Тип ответа')
+    body = models.BinaryField(blank=True, default=b'', verbose_name='Тело ответа (zlib)')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата создания')
+    expires_at = models.DateTimeField(verbose_name='Истекает')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='back_idempotency_exp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key[:12]}… ({self.status_code})"
+
+
+class Blob(models.Model):
+    """Файл в контентно-адресуемом хранилище вложений со счётчиком ссылок"""
+    id_blob = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=255, unique=True, verbose_name='Путь в хранилище')
+    sha256 = models.CharField(max_length=64, verbose_name='SHA-256')
+    size = models.BigIntegerField(default=0, verbose_name='Размер, байт')
+    refcount = models.IntegerField(default=0, verbose_name='Число ссылок')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class BackgroundJob(models.Model):
+    """Задача фоновой очереди (обрабатывается командой run_jobs)"""
+    STATE_PENDING = 'pending'
+    STATE_RUNNING = 'running'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+    STATE_CHOICES = [
+        (STATE_PENDING, 'В очереди'),
+        (STATE_RUNNING, 'Выполняется'),
+        (STATE_DONE, 'Выполнена'),
+        (STATE_FAILED, 'Ошибка'),
+    ]
+
+    id_job = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=100, verbose_name='Тип задачи')
+    payload = models.JSONField(default=dict, verbose_name='Параметры')
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=STATE_PENDING, verbose_name='Состояние')
+    attempts = models.IntegerField(default=0, verbose_name='Число попыток')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Не раньше')
+    last_error = models.TextField(blank=True, default='', verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_after'], name='back_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Задача {self.id_job} ({self.kind}, {self.state})"
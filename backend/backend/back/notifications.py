@@ -0,0 +1,159 @@
+"""
+Отправка уведомлений через очередь (outbox) со склейкой.
+
+Views не создают Notification сами: notify_many записывает события
+NotificationEvent одним INSERT в той же транзакции, что и изменение заявки.
+Воркер (manage.py run_jobs) вызывает dispatch: события одного получателя
+по одной заявке, первое из которых ждёт дольше NOTIFICATION_COALESCE_SECONDS,
+склеиваются в одно уведомление, уведомления создаются одним bulk_create,
+события удаляются. Так массовая смена статуса 1000 заявок — один INSERT
+в запросе, а «создана» и «взята в работу» подряд приходят одним сообщением.
+
+О новой заявке также уведомляются сотрудники АХО, включившие подписку
+(User.notify_new_requests), из офиса заявки и всех вышестоящих офисов.
+Получатели берутся из индекса офис → подписчики, который кэшируется
+в процессе, поэтому их число не добавляет запросов.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Notification, NotificationEvent, Office, User
+
+DEFAULT_COALESCE_SECONDS = 30
+
+# Сколько последних разных сообщений оставлять в склеенном уведомлении
+MAX_COALESCED = 5
+
+NEW_REQUEST_MESSAGE = 'Новая заявка #{id} в офисе «{office}»: {failure_type}, срочность {urgency}.'
+
+# Индекс подписчиков сбрасывается при изменении пользователей и офисов в этом процессе;
+# изменения из других процессов подхватываются не позже чем через FANOUT_TTL секунд
+FANOUT_TTL = 5 * 60
+
+
+def _window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', DEFAULT_COALESCE_SECONDS))
+
+
+def notify(user_id, request_id, message):
+    """Ставит в очередь одно уведомление"""
+    notify_many([(user_id, request_id, message)])
+
+
+def notify_many(items):
+    """Ставит в очередь уведомления одним INSERT; items — тройки (получатель, заявка, текст)"""
+    deliver_after = timezone.now() + _window()
+    events = NotificationEvent.objects.bulk_create([
+        NotificationEvent(user_id=user_id, request_id=request_id, message=message, deliver_after=deliver_after)
+        for user_id, request_id, message in items
+    ])
+    if events and getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+        # Без воркера доставляем сразу после коммита, не дожидаясь окна склейки
+        transaction.on_commit(lambda: dispatch(force=True))
+    return events
+
+
+def coalesce(messages):
+    """Текст одного уведомления из нескольких сообщений (в порядке событий)"""
+    unique = list(dict.fromkeys(messages))
+    shown = unique[-MAX_COALESCED:]
+    hidden = len(unique) - len(shown)
+    if hidden:
+        shown.insert(0, f'Ранее изменений: {hidden}.')
+    return ' '.join(shown)
+
+
+def _dispatch_batch(batch_size, now, force):
+    """Доставляет одну порцию получателей-заявок; None — очередь пуста"""
+    with transaction.atomic():
+        due = NotificationEvent.objects.select_for_update(skip_locked=True)
+        if not force:
+            due = due.filter(deliver_after__lte=now)
+        keys = set(due.order_by('deliver_after', 'id_event').values_list('user_id', 'request_id')[:batch_size])
+        if not keys:
+            return None
+
+        # Вместе с готовыми событиями забираем более поздние события тех же заявок
+        grouped = {}
+        event_ids = []
+        for event_id, user_id, request_id, message in NotificationEvent.objects.select_for_update(
+            skip_locked=True
+        ).filter(user_id__in={user_id for user_id, _ in keys}).order_by('id_event').values_list(
+            'id_event', 'user_id', 'request_id', 'message'
+        ):
+            if (user_id, request_id) in keys:
+                grouped.setdefault((user_id, request_id), []).append(message)
+                event_ids.append(event_id)
+
+        Notification.objects.bulk_create([
+            Notification(user_id=user_id, request_id=request_id, message=coalesce(messages))
+            for (user_id, request_id), messages in grouped.items()
+        ])
+        NotificationEvent.objects.filter(id_event__in=event_ids).delete()
+    return len(grouped)
+
+
+def dispatch(batch_size=1000, now=None, force=False):
+    """
+    Доставляет готовые события; force — все события, не дожидаясь окна склейки.
+    Возвращает число созданных уведомлений.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        created = _dispatch_batch(batch_size, now, force)
+        if created is None:
+            return total
+        total += created
+
+
+_fanout = None  # (момент истечения, {id офиса: id родителя}, {id офиса: [id подписчиков]})
+
+
+def fanout_index():
+    """Родительские офисы и подписанные на новые заявки сотрудники АХО по офисам"""
+    global _fanout
+    if _fanout is None or _fanout[0] <= time.monotonic():
+        parents = dict(Office.objects.values_list('id_office', 'parent_office_id'))
+        subscribers = defaultdict(list)
+        for user_id, office_id in User.objects.filter(notify_new_requests=True).filter(
+            Q(role__icontains='ахо') | Q(role__icontains='aho')
+        ).order_by('id_user').values_list('id_user', 'office_id'):
+            subscribers[office_id].append(user_id)
+        _fanout = (time.monotonic() + FANOUT_TTL, parents, dict(subscribers))
+    return _fanout[1], _fanout[2]
+
+
+def reset_fanout_index():
+    global _fanout
+    _fanout = None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Office)
+@receiver(post_delete, sender=Office)
+def _invalidate_fanout_index(sender, **kwargs):
+    reset_fanout_index()
+
+
+def new_request_recipients(office_id, exclude_ids=()):
+    """Подписчики офиса заявки и всех вышестоящих офисов"""
+    parents, subscribers = fanout_index()
+    excluded = set(exclude_ids)
+    recipients = []
+    seen_offices = set()
+    # seen_offices защищает от циклов в иерархии офисов
+    while office_id is not None and office_id not in seen_offices:
+        seen_offices.add(office_id)
+        recipients.extend(user_id for user_id in subscribers.get(office_id, ()) if user_id not in excluded)
+        office_id = parents.get(office_id)
+    return list(dict.fromkeys(recipients))
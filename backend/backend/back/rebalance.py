@@ -0,0 +1,196 @@
+"""
+Перераспределение загрузки сотрудников АХО.
+
+Исполнитель назначается один раз при создании заявки, поэтому после отпуска
+сотрудника или наплыва заявок в одном офисе загрузка расходится и сама не
+выравнивается. Команда rebalance_load считает текущую загрузку одним
+агрегирующим запросом (число и сумма весов открытых заявок по исполнителям)
+и жадно подбирает минимальный набор переназначений ещё не начатых заявок
+(статус 'Новая'): на каждом шаге самая тяжёлая заявка самого загруженного
+сотрудника переходит к наименее загруженному подходящему сотруднику, если
+разрыв между ними после переноса сокращается. Подходящий сотрудник — сотрудник
+АХО того же офиса (или любого, если разрешено), компетентный по типу поломки,
+если для типа заданы компетенции.
+
+Переназначения применяются одной транзакцией: заявки блокируются и
+перепроверяются, исполнители меняются одним UPDATE, загрузка — через
+apply_load_deltas, уведомления ставятся в очередь одним INSERT (notify_many).
+"""
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import Load, Request
+from .notifications import notify_many
+from .routing import aho_roster, apply_load_deltas, competency_matrix
+from .workflow import INITIAL_STATUS_KEY, get_workflow
+
+MOVED_IN_MESSAGE = 'Вам передана заявка #{id} (перераспределение нагрузки).'
+MOVED_OUT_MESSAGE = 'Заявка #{id} передана другому исполнителю (перераспределение нагрузки).'
+
+DEFAULT_MAX_MOVES = 200
+
+
+@dataclass(frozen=True)
+class Move:
+    request_id: int
+    source_id: int
+    target_id: int
+    weight: float
+
+
+def _releasing_status_ids(workflow):
+    return workflow.ids_for_keys([key for key, status_def in workflow.statuses.items() if status_def.releases_load])
+
+
+def load_distribution():
+    """
+    Загрузка исполнителей одним запросом:
+    {id сотрудника: {'tasks': открытых заявок, 'weighted': сумма весов, 'movable': новых заявок}}.
+    Сотрудники АХО без открытых заявок входят с нулями.
+    """
+    workflow = get_workflow()
+    rows = Request.objects.filter(performer__isnull=False).exclude(
+        status_id__in=_releasing_status_ids(workflow)
+    ).order_by().values('performer_id').annotate(
+        tasks=Count('id_request'),
+        weighted=Sum('routing_weight'),
+        movable=Count('id_request', filter=Q(status_id__in=workflow.ids_for_keys((INITIAL_STATUS_KEY,)))),
+    )
+    distribution = {
+        user_id: {'tasks': 0, 'weighted': 0.0, 'movable': 0}
+        for user_ids in aho_roster().values() for user_id in user_ids
+    }
+    for row in rows:
+        distribution[row['performer_id']] = {
+            'tasks': row['tasks'],
+            'weighted': float(row['weighted'] or 0),
+            'movable': row['movable'],
+        }
+    return distribution
+
+
+def plan_moves(
+    distribution, office_id=None, any_office=False, drain_ids=(), max_moves=DEFAULT_MAX_MOVES, min_gain=0.0,
+):
+    """
+    Жадно подбирает переназначения новых заявок. Перенос заявки веса w от
+    сотрудника с загрузкой a к сотруднику с загрузкой b принимается, если
+    a - b - w > min_gain: разрыв сокращается, и сумма квадратов загрузок
+    строго убывает, поэтому перебор конечен. Заявки сотрудников из drain_ids
+    переносятся все, сами они заявки не получают.
+    Возвращает список Move; загрузки в distribution не меняются.
+    """
+    roster = aho_roster()
+    matrix = competency_matrix()
+    all_staff = [user_id for user_ids in roster.values() for user_id in user_ids]
+    drain_ids = set(drain_ids)
+
+    movable = Request.objects.filter(
+        performer_id__in=distribution.keys(),
+        status_id__in=get_workflow().ids_for_keys((INITIAL_STATUS_KEY,)),
+    )
+    if office_id is not None:
+        movable = movable.filter(office_address_id=office_id)
+    by_source = defaultdict(list)
+    for request_id, performer_id, request_office_id, failure_type_id, weight in movable.order_by(
+        '-routing_weight', 'id_request'
+    ).values_list('id_request', 'performer_id', 'office_address_id', 'failure_type_id', 'routing_weight'):
+        by_source[performer_id].append((request_id, request_office_id, failure_type_id, weight))
+
+    loads = {user_id: stats['weighted'] for user_id, stats in distribution.items()}
+
+    def targets(request_office_id, failure_type_id, source_id):
+        staff = all_staff if any_office else roster.get(request_office_id, ())
+        levels = matrix.get(failure_type_id)
+        return [
+            user_id for user_id in staff
+            if user_id != source_id and user_id not in drain_ids and (not levels or user_id in levels)
+        ]
+
+    moves = []
+    while len(moves) < max_moves:
+        move = None
+        # Источники — от самого загруженного; сотрудники из drain_ids — первыми
+        for source_id in sorted(by_source, key=lambda user_id: (user_id not in drain_ids, -loads[user_id], user_id)):
+            for index, (request_id, request_office_id, failure_type_id, weight) in enumerate(by_source[source_id]):
+                candidates = targets(request_office_id, failure_type_id, source_id)
+                if not candidates:
+                    continue
+                target_id = min(candidates, key=lambda user_id: (loads.get(user_id, 0.0), user_id))
+                if source_id in drain_ids or loads[source_id] - loads.get(target_id, 0.0) - weight > min_gain:
+                    move = Move(request_id, source_id, target_id, weight)
+                    del by_source[source_id][index]
+                    break
+            if move is not None:
+                break
+        if move is None:
+            break
+        loads[move.source_id] -= move.weight
+        loads[move.target_id] = loads.get(move.target_id, 0.0) + move.weight
+        moves.append(move)
+    return moves
+
+
+def apply_moves(moves, now=None):
+    """
+    Применяет переназначения одной транзакцией. Заявки, которые успели взять
+    в работу или передать другому исполнителю, пропускаются.
+    Возвращает применённые переназначения.
+    """
+    if not moves:
+        return []
+    now = now or timezone.now()
+    with transaction.atomic():
+        current = dict(
+            Request.objects.select_for_update(of=('self',)).filter(
+                id_request__in=[move.request_id for move in moves],
+                status_id__in=get_workflow().ids_for_keys((INITIAL_STATUS_KEY,)),
+            ).values_list('id_request', 'performer_id')
+        )
+        moves = [move for move in moves if current.get(move.request_id) == move.source_id]
+        if not moves:
+            return []
+
+        Request.objects.filter(id_request__in=[move.request_id for move in moves]).update(
+            performer_id=Case(
+                *[When(id_request=move.request_id, then=Value(move.target_id)) for move in moves],
+                output_field=IntegerField(),
+            ),
+            last_updated=now,
+        )
+
+        counts = Counter()
+        weights = Counter()
+        for move in moves:
+            counts[move.source_id] -= 1
+            weights[move.source_id] -= move.weight
+            counts[move.target_id] += 1
+            weights[move.target_id] += move.weight
+        apply_load_deltas(counts, weights)
+        # Записей Load у сотрудников, ещё не получавших заявок, нет — создаём их
+        target_ids = {move.target_id for move in moves}
+        existing = set(Load.objects.filter(staff_id__in=target_ids).values_list('staff_id', flat=True))
+        Load.objects.bulk_create([
+            Load(
+                staff_id=staff_id,
+                current_tasks_count=max(counts[staff_id], 0),
+                current_tasks='',
+                urgency='',
+                weighted_load=max(weights[staff_id], 0.0),
+            )
+            for staff_id in sorted(target_ids - existing)
+        ])
+
+        notify_many([
+            item
+            for move in moves
+            for item in (
+                (move.target_id, move.request_id, MOVED_IN_MESSAGE.format(id=move.request_id)),
+                (move.source_id, move.request_id, MOVED_OUT_MESSAGE.format(id=move.request_id)),
+            )
+        ])
+    return moves
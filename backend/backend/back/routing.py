@@ -0,0 +1,264 @@
+"""
+Назначение исполнителей заявок, сроки выполнения и учёт загрузки.
+
+Срок заявки (due_time) считается от создания по таблицам SLA_HOURS
+и SLA_HOURS_BY_FAILURE_TYPE из настроек.
+
+Вес заявки (routing_weight) — вес срочности из ROUTING_URGENCY_WEIGHTS,
+умноженный на трудоёмкость типа поломки: медиану фактического времени
+решения заявок этого типа, делённую на общую медиану. Трудоёмкость
+пересчитывается одним запросом не чаще раза в EFFORT_TTL секунд на процесс.
+
+Load.weighted_load — сумма весов открытых заявок сотрудника. Она меняется
+тем же UPDATE, что и current_tasks_count (назначение, смена статуса,
+переназначение), поэтому выбор исполнителя читает одну строку Load
+на кандидата. Список сотрудников АХО по офисам и матрица компетенций
+(StaffCompetency: тип поломки × сотрудник → уровень) кэшируются в процессе.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Q, TextField, Value, When
+from django.db.models.functions import Coalesce, Concat, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .analytics import resolution_medians
+from .models import Load, Office, StaffCompetency, User
+
+DEFAULT_SLA_HOURS = {'Критическая': 4, 'Высокая': 24, 'Средняя': 72, 'Низкая': 168}
+DEFAULT_URGENCY_WEIGHTS = {'Критическая': 4.0, 'Высокая': 2.0, 'Средняя': 1.0, 'Низкая': 0.5}
+
+# Трудоёмкость: окно истории, минимум заявок типа и допустимые границы множителя
+EFFORT_WINDOW = timedelta(days=180)
+EFFORT_MIN_SAMPLES = 5
+EFFORT_BOUNDS = (0.25, 4.0)
+EFFORT_TTL = 60 * 60
+
+# Список сотрудников АХО и матрица компетенций сбрасываются при изменениях в этом
+# процессе; изменения из других процессов подхватываются не позже чем через ROSTER_TTL секунд
+ROSTER_TTL = 5 * 60
+
+
+def due_time_for(created_at, urgency, failure_type_name=None):
+    """Срок выполнения заявки или None, если для срочности срок не задан"""
+    hours = getattr(settings, 'SLA_HOURS', DEFAULT_SLA_HOURS).get(urgency)
+    overrides = getattr(settings, 'SLA_HOURS_BY_FAILURE_TYPE', {}).get(failure_type_name) or {}
+    hours = overrides.get(urgency, hours)
+    if not hours:
+        return None
+    return created_at + timedelta(hours=hours)
+
+
+_effort = None  # (момент истечения, {id типа поломки: множитель})
+
+
+def compute_effort_factors(now=None):
+    """{id типа поломки: трудоёмкость} по выполненным заявкам за EFFORT_WINDOW"""
+    medians, overall = resolution_medians('failure_type_id', since=(now or timezone.now()) - EFFORT_WINDOW)
+    if not overall:
+        return {}
+    low, high = EFFORT_BOUNDS
+    return {
+        failure_type_id: round(min(max(median / overall, low), high), 3)
+        for failure_type_id, (count, median) in medians.items()
+        if failure_type_id is not None and count >= EFFORT_MIN_SAMPLES
+    }
+
+
+def effort_factors():
+    global _effort
+    if _effort is None or _effort[0] <= time.monotonic():
+        _effort = (time.monotonic() + EFFORT_TTL, compute_effort_factors())
+    return _effort[1]
+
+
+def reset_effort_factors():
+    global _effort
+    _effort = None
+
+
+def request_weight(urgency, failure_type_id=None):
+    """Вес заявки в загрузке исполнителя"""
+    weight = getattr(settings, 'ROUTING_URGENCY_WEIGHTS', DEFAULT_URGENCY_WEIGHTS).get(urgency, 1.0)
+    return round(weight * effort_factors().get(failure_type_id, 1.0), 3)
+
+
+_roster = None  # (момент истечения, {id офиса: [id сотрудников АХО]})
+
+
+def aho_roster():
+    """Сотрудники АХО (роль содержит "ахо" или "aho") по офисам, id по возрастанию"""
+    global _roster
+    if _roster is None or _roster[0] <= time.monotonic():
+        by_office = defaultdict(list)
+        for user_id, office_id in User.objects.filter(
+            Q(role__icontains='ахо') | Q(role__icontains='aho')
+        ).order_by('id_user').values_list('id_user', 'office_id'):
+            by_office[office_id].append(user_id)
+        _roster = (time.monotonic() + ROSTER_TTL, dict(by_office))
+    return _roster[1]
+
+
+def reset_roster():
+    global _roster
+    _roster = None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _invalidate_roster(sender, **kwargs):
+    reset_roster()
+
+
+_competencies = None  # (момент истечения, {id типа поломки: {id сотрудника: уровень}})
+
+
+def competency_matrix():
+    """Уровни компетенций по типам поломок; типы без компетенций в матрицу не входят"""
+    global _competencies
+    if _competencies is None or _competencies[0] <= time.monotonic():
+        matrix = defaultdict(dict)
+        for staff_id, failure_type_id, level in StaffCompetency.objects.values_list(
+            'staff_id', 'failure_type_id', 'level'
+        ):
+            matrix[failure_type_id][staff_id] = level
+        _competencies = (time.monotonic() + ROSTER_TTL, dict(matrix))
+    return _competencies[1]
+
+
+def reset_competencies():
+    global _competencies
+    _competencies = None
+
+
+@receiver(post_save, sender=StaffCompetency)
+@receiver(post_delete, sender=StaffCompetency)
+def _invalidate_competencies(sender, **kwargs):
+    reset_competencies()
+
+
+def _candidates(office, failure_type_id, excluded):
+    """Кандидаты первой непустой группы и их уровни компетенции по типу поломки"""
+    roster = aho_roster()
+    local = roster.get(office.id_office, ()) if office else ()
+    everyone = [user_id for user_ids in roster.values() for user_id in user_ids]
+    levels = competency_matrix().get(failure_type_id, {})
+    groups = []
+    if levels:
+        groups += [
+            [user_id for user_id in local if user_id in levels],
+            [user_id for user_id in everyone if user_id in levels],
+        ]
+    groups += [local, everyone]
+    for group in groups:
+        candidates = [user_id for user_id in group if user_id not in excluded]
+        if candidates:
+            return candidates, levels
+    return [], levels
+
+
+def find_best_performer(office: Office, urgency: str | None = None, failure_type_id=None, exclude_ids=()):
+    """
+    Выбирает наилучшего исполнителя (сотрудника АХО) для заявки.
+    Приоритет:
+    1. Если для типа поломки заданы компетенции — компетентные сотрудники
+       того же офиса, затем компетентные сотрудники других офисов.
+    2. Иначе (или если компетентных нет) — сотрудники АХО того же офиса, затем все.
+    3. Среди кандидатов выбирается сотрудник с наименьшей взвешенной загрузкой
+       (weighted_load: срочность и трудоёмкость его открытых заявок), делённой
+       на уровень компетенции, затем — с наименьшим числом задач.
+    4. При равной загрузке выбирается сотрудник с наименьшим id (стабильный выбор).
+    Срочность новой заявки учитывается её весом, который прибавляется
+    к загрузке выбранного исполнителя (increment_performer_load).
+    exclude_ids — сотрудники, которых не рассматривать (например, текущий исполнитель).
+    """
+    candidates, levels = _candidates(office, failure_type_id, set(exclude_ids))
+    if not candidates:
+        return None
+
+    loads = {
+        staff_id: (weighted or 0.0, count or 0)
+        for staff_id, weighted, count in Load.objects.filter(staff_id__in=candidates).values_list(
+            'staff_id', 'weighted_load', 'current_tasks_count'
+        )
+    }
+
+    def score(user_id):
+        weighted, count = loads.get(user_id, (0.0, 0))
+        return weighted / levels.get(user_id, 1), count, user_id
+
+    best_id = min(candidates, key=score)
+    return User.objects.filter(id_user=best_id).first()
+
+
+def increment_performer_load(performer, request_id, urgency, weight=1.0):
+    """
+    Увеличивает загрузку исполнителя одним UPDATE; запись Load создаётся,
+    только если её ещё нет.
+    """
+    updated = Load.objects.filter(staff=performer).update(
+        current_tasks_count=Coalesce(F('current_tasks_count'), Value(0)) + 1,
+        weighted_load=F('weighted_load') + weight,
+        # id заявки в текстовом поле (обратная совместимость)
+        current_tasks=Case(
+            When(current_tasks='', then=Value(str(request_id))),
+            default=Concat(F('current_tasks'), Value(f', {request_id}')),
+            output_field=TextField(),
+        ),
+        urgency=urgency,
+    )
+    if not updated:
+        Load.objects.create(
+            staff=performer,
+            current_tasks_count=1,
+            current_tasks=str(request_id),
+            urgency=urgency,
+            weighted_load=weight,
+        )
+
+
+def apply_load_deltas(deltas, weight_deltas=None):
+    """
+    Меняет загрузку нескольких исполнителей одним UPDATE:
+    deltas — {id сотрудника: изменение числа задач},
+    weight_deltas — {id сотрудника: изменение взвешенной загрузки}.
+    """
+    deltas = {staff_id: delta for staff_id, delta in deltas.items() if delta}
+    weight_deltas = {staff_id: delta for staff_id, delta in (weight_deltas or {}).items() if delta}
+    staff_ids = deltas.keys() | weight_deltas.keys()
+    if not staff_ids:
+        return
+    count_delta = Case(
+        *[When(staff_id=staff_id, then=Value(value)) for staff_id, value in deltas.items()],
+        default=Value(0),
+    )
+    weight_delta = Case(
+        *[When(staff_id=staff_id, then=Value(float(value))) for staff_id, value in weight_deltas.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    Load.objects.filter(staff_id__in=staff_ids).update(
+        current_tasks_count=Greatest(F('current_tasks_count') + count_delta, Value(0)),
+        weighted_load=Greatest(F('weighted_load') + weight_delta, Value(0.0)),
+    )
+
+
+def move_request_load(request_obj, old_performer_id, old_weight):
+    """
+    Переносит открытую заявку в загрузке после смены исполнителя или веса:
+    снимает её со старого исполнителя со старым весом и добавляет текущему.
+    """
+    if request_obj.performer_id == old_performer_id:
+        if old_performer_id:
+            apply_load_deltas({}, {old_performer_id: request_obj.routing_weight - old_weight})
+        return
+    if old_performer_id:
+        apply_load_deltas({old_performer_id: -1}, {old_performer_id: -old_weight})
+    if request_obj.performer_id:
+        increment_performer_load(
+            request_obj.performer, request_obj.id_request, request_obj.urgency, request_obj.routing_weight
+        )
@@ -0,0 +1,261 @@
+"""
+Поиск: полнотекстовый по заявкам и нечёткий (триграммы) по справочнику пользователей.
+
+Полнотекстовый поиск идёт по описанию заявки и комментариям к ней.
+
+Поисковый документ хранится в отдельной таблице back_request_search
+(одна строка на заявку), которая не описана моделью Django, потому что
+её устройство зависит от СУБД:
+  - PostgreSQL: колонка tsvector с GIN-индексом. Текст индексируется
+    в конфигурациях russian и english, описание весит больше комментариев;
+  - SQLite (локальный запуск): виртуальная таблица FTS5, ранжирование bm25.
+
+Документ пересобирается сигналами после коммита при изменении заявки
+или её комментариев. Полная пересборка: manage.py rebuild_search_index.
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Comment, Request, User
+
+SEARCH_TABLE = 'back_request_search'
+
+# Конфигурации PostgreSQL, в которых индексируется и ищется текст
+SEARCH_CONFIGS = ('russian', 'english')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+@dataclass
+class SearchFilters:
+    office_id: int | None = None
+    status_ids: list | None = None
+    date_from: object = None
+    date_to: object = None
+    # Ограничение видимости: только заявки, где пользователь автор или исполнитель
+    participant_id: int | None = None
+
+
+def _document_texts(request_ids):
+    """{id заявки: (описание, комментарии одной строкой)}"""
+    texts = {
+        request_id: [description or '', []]
+        for request_id, description in Request.objects.filter(
+            id_request__in=request_ids
+        ).values_list('id_request', 'description')
+    }
+    comments = Comment.objects.filter(
+        request_id__in=texts.keys()
+    ).order_by('request_id', 'created_at').values_list('request_id', 'content')
+    for request_id, content in comments:
+        if content:
+            texts[request_id][1].append(content)
+    return {request_id: (description, '\n'.join(parts)) for request_id, (description, parts) in texts.items()}
+
+
+def _vector_sql(weight):
+    """Выражение tsvector для одного текста во всех конфигурациях"""
+    return ' || '.join(
+        f"setweight(to_tsvector('{config}', %s), '{weight}')" for config in SEARCH_CONFIGS
+    )
+
+
+def index_requests(request_ids):
+    """Пересобирает поисковые документы указанных заявок"""
+    request_ids = list(set(request_ids))
+    if not request_ids:
+        return
+    texts = _document_texts(request_ids)
+    deleted = [request_id for request_id in request_ids if request_id not in texts]
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            sql = (
+                f'INSERT INTO {SEARCH_TABLE} (request_id, document) '
+                f"VALUES (%s, {_vector_sql('A')} || {_vector_sql('B')}) "
+                'ON CONFLICT (request_id) DO UPDATE SET document = EXCLUDED.document'
+            )
+            per_config = len(SEARCH_CONFIGS)
+            cursor.executemany(sql, [
+                (request_id,) + (description,) * per_config + (comments,) * per_config
+                for request_id, (description, comments) in texts.items()
+            ])
+            if deleted:
+                cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE request_id = ANY(%s)', [deleted])
+        elif connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(request_ids))
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', request_ids)
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, description, comments) VALUES (%s, %s, %s)',
+                [(request_id, description, comments) for request_id, (description, comments) in texts.items()],
+            )
+
+
+def rebuild_index(batch_size=1000):
+    """Полностью пересобирает поисковый индекс; возвращает число заявок"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    total = 0
+    ids = Request.objects.order_by('id_request').values_list('id_request', flat=True)
+    batch = []
+    for request_id in ids.iterator(chunk_size=batch_size):
+        batch.append(request_id)
+        if len(batch) >= batch_size:
+            index_requests(batch)
+            total += len(batch)
+            batch = []
+    index_requests(batch)
+    return total + len(batch)
+
+
+def fts5_query(text):
+    """
+    Строка запроса FTS5 из пользовательского ввода: каждое слово берётся
+    в кавычки (спецсимволы синтаксиса FTS5 не работают) и ищется по префиксу.
+    """
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(text))
+
+
+def search_requests(text, filters=None, limit=20, offset=0):
+    """
+    Ищет заявки по тексту. Возвращает (список (id заявки, релевантность), всего найдено).
+    Результаты отсортированы по релевантности, при равенстве — по дате создания.
+    """
+    filters = filters or SearchFilters()
+    where = []
+    params = []
+    if filters.office_id is not None:
+        where.append('r.office_address_id = %s')
+        params.append(filters.office_id)
+    if filters.status_ids is not None:
+        if not filters.status_ids:
+            return [], 0
+        where.append(f"r.status_id IN ({', '.join(['%s'] * len(filters.status_ids))})")
+        params.extend(filters.status_ids)
+    if filters.date_from is not None:
+        where.append('r.created_at >= %s')
+        params.append(connection.ops.adapt_datetimefield_value(filters.date_from))
+    if filters.date_to is not None:
+        where.append('r.created_at < %s')
+        params.append(connection.ops.adapt_datetimefield_value(filters.date_to))
+    if filters.participant_id is not None:
+        where.append('(r.user_id = %s OR r.performer_id = %s)')
+        params.extend([filters.participant_id, filters.participant_id])
+    extra_where = ''.join(f' AND {condition}' for condition in where)
+
+    if connection.vendor == 'postgresql':
+        query = ' || '.join(f"websearch_to_tsquery('{config}', %s)" for config in SEARCH_CONFIGS)
+        sql = (
+            'SELECT s.request_id, ts_rank_cd(s.document, q.query) AS rank, COUNT(*) OVER () '
+            f'FROM {SEARCH_TABLE} s '
+            'JOIN back_request r ON r.id_request = s.request_id '
+            f'CROSS JOIN (SELECT {query} AS query) q '
+            f'WHERE s.document @@ q.query{extra_where} '
+            'ORDER BY rank DESC, r.created_at DESC LIMIT %s OFFSET %s'
+        )
+        params = [text] * len(SEARCH_CONFIGS) + params + [limit, offset]
+    elif connection.vendor == 'sqlite':
+        match = fts5_query(text)
+        if not match:
+            return [], 0
+        # bm25 возвращает отрицательные значения: чем меньше, тем релевантнее.
+        # Ранжирование — во вложенном запросе: FTS5 не даёт вызывать bm25
+        # вместе с оконными функциями, а к таблице обращается только по имени
+        sql = (
+            'SELECT m.id, m.rank, COUNT(*) OVER () FROM ('
+            f'SELECT rowid AS id, -bm25({SEARCH_TABLE}, 2.0, 1.0) AS rank '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+            ') m '
+            'JOIN back_request r ON r.id_request = m.id '
+            f'WHERE 1 = 1{extra_where} '
+            'ORDER BY m.rank DESC, r.created_at DESC LIMIT %s OFFSET %s'
+        )
+        params = [match] + params + [limit, offset]
+    else:
+        raise NotImplementedError(f'Полнотекстовый поиск не поддерживается для {connection.vendor}')
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    total = rows[0][2] if rows else 0
+    return [(request_id, float(rank)) for request_id, rank, _ in rows], total
+
+
+# Текст, по которому ищутся пользователи. Выражение должно совпадать
+# с выражением GIN-индекса back_user_search_trgm (миграция 0013)
+USER_SEARCH_DOCUMENT = (
+    "lower(last_name || ' ' || first_name || ' ' || middle_name || ' ' "
+    "|| coalesce(username, '') || ' ' || coalesce(email, ''))"
+)
+
+
+def search_users(text, limit=10, role=None):
+    """
+    Нечёткий поиск пользователей по ФИО, логину и email для подсказок при вводе.
+    Каждое слово запроса должно встретиться как подстрока или быть похожим
+    на слово из документа (pg_trgm, оператор <%, опечатки допускаются).
+    Возвращает id пользователей, самые похожие — первыми.
+    """
+    tokens = [token.lower() for token in TOKEN_RE.findall(text)]
+    if not tokens:
+        return []
+
+    if connection.vendor != 'postgresql':
+        # Локальный запуск: простой поиск подстрок без ранжирования
+        qs = User.objects.all()
+        for token in tokens:
+            qs = qs.filter(
+                Q(last_name__icontains=token) | Q(first_name__icontains=token)
+                | Q(middle_name__icontains=token) | Q(username__icontains=token)
+                | Q(email__icontains=token)
+            )
+        if role:
+            qs = qs.filter(role__iexact=role)
+        return list(qs.order_by('last_name', 'first_name').values_list('id_user', flat=True)[:limit])
+
+    where = []
+    params = []
+    for token in tokens:
+        # %% — экранированный символ % оператора <% (параметры подставляет драйвер)
+        where.append(f'({USER_SEARCH_DOCUMENT} LIKE %s OR %s <%% {USER_SEARCH_DOCUMENT})')
+        params.extend([f'%{token}%', token])
+    if role:
+        where.append('lower(role) = lower(%s)')
+        params.append(role)
+    sql = (
+        f'SELECT id_user FROM back_user WHERE {" AND ".join(where)} '
+        f'ORDER BY word_similarity(%s, {USER_SEARCH_DOCUMENT}) DESC, last_name, first_name LIMIT %s'
+    )
+    params.extend([' '.join(tokens), limit])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _schedule_index(request_ids):
+    request_ids = list(request_ids)
+    if request_ids:
+        transaction.on_commit(lambda: index_requests(request_ids))
+
+
+@receiver(post_save, sender=Request)
+def _index_request(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'description' not in update_fields:
+        return
+    _schedule_index([instance.id_request])
+
+
+@receiver(post_delete, sender=Request)
+def _unindex_request(sender, instance, **kwargs):
+    _schedule_index([instance.id_request])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def _index_comment(sender, instance, **kwargs):
+    _schedule_index([instance.request_id])
@@ -0,0 +1,113 @@
+"""
+Контентно-адресуемое хранилище вложений.
+
+Имя файла — SHA-256 содержимого, файл лежит в шардированном каталоге
+attachments/ab/cd/<hash>.<ext>, поэтому одинаковые файлы хранятся один раз,
+а в одном каталоге не скапливаются миллионы записей. Хеш считается во время
+записи во временный файл, без повторного чтения.
+
+На каждый файл заводится строка Blob со счётчиком ссылок: save() увеличивает
+счётчик, delete() уменьшает, физически файл удаляется при нуле ссылок.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+HASH_PREFIX = 'attachments'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage с дедупликацией по SHA-256 и подсчётом ссылок"""
+
+    def __init__(self, prefix=HASH_PREFIX, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+
+    def hashed_name(self, digest, ext):
+        return f'{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save, суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()[:10]
+        tmp_dir = os.path.join(self.location, self.prefix, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # Пишем во временный файл и одновременно считаем хеш
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+
+            name = self.hashed_name(digest.hexdigest(), ext)
+            # Сначала берём ссылку, потом кладём файл: параллельный delete()
+            # держит блокировку строки и удаляет файл до своего коммита
+            self.retain(name, sha256=digest.hexdigest(), size=size)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def retain(self, name, sha256='', size=0):
+        """Добавляет ссылку на файл (например, когда имя копируется в другое поле)"""
+        from .models import Blob
+
+        if Blob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+            return
+        try:
+            with transaction.atomic():
+                Blob.objects.create(name=name, sha256=sha256, size=size, refcount=1)
+        except IntegrityError:
+            # Строку только что создал параллельный запрос
+            Blob.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+    def delete(self, name):
+        """
+        Снимает одну ссылку с файла; файл удаляется, когда ссылок не осталось.
+        Файлы, которых нет в учёте (загруженные до дедупликации), не трогаем.
+        """
+        from .models import Blob
+
+        if not name:
+            return
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.refcount > 1:
+                Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            super().delete(name)
+
+
+def attachment_storage():
+    """Хранилище для полей вложений (вызываемый объект, чтобы не попадать в миграции)"""
+    return _storage
+
+
+_storage = ContentAddressedStorage()
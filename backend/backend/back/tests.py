@@ -1,3 +1,548 @@
-from django.test import TestCase
+import hashlib
+import shutil
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import dashboard, escalation, rebalance
+from .models import (
+    ChunkedUpload, IdempotencyKey, Load, NotificationEvent, Office, Request, RequestAttachment,
+    RequestStatsRollup, RequestStatusHistory, RollupWatermark, TypeOfFailure, User,
+)
+from .notifications import reset_fanout_index
+from .routing import reset_competencies, reset_effort_factors, reset_roster
+from .workflow import get_workflow, reset_workflow
+
+
+class BackTestCase(TestCase):
+    """Офисы и пользователи как в демонстрационных данных: сотрудник и двое АХО"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.root = Office.objects.create(
+            name='Главный', region='Свердловская', city='Екатеринбург', address='ул. Мира 19', level=1,
+        )
+        cls.sub = Office.objects.create(
+            name='Филиал', region='Свердловская', city='Екатеринбург', address='ул. Ленина 1', level=2,
+            parent_office=cls.root,
+        )
+        cls.employee = User.objects.create(
+            username='emp', email='e@x.ru', first_name='Иван', last_name='Иванов', middle_name='И',
+            position='dev', role='employee', office=cls.sub,
+        )
+        cls.aho = User.objects.create(
+            username='aho1', email='a1@x.ru', first_name='Пётр', last_name='Петров', middle_name='П',
+            position='aho', role='АХО', office=cls.sub,
+        )
+        cls.aho_root = User.objects.create(
+            username='aho2', email='a2@x.ru', first_name='Сидор', last_name='Сидоров', middle_name='С',
+            position='aho', role='aho', office=cls.root,
+        )
+        cls.root.supervisor = cls.aho_root
+        cls.root.save()
+        cls.failure_type = TypeOfFailure.objects.create(name='Оборудование', description='')
+
+    def setUp(self):
+        # Кэши модулей переживают откат транзакции теста — сбрасываем их
+        reset_workflow()
+        reset_roster()
+        reset_competencies()
+        reset_fanout_index()
+        reset_effort_factors()
+        self.workflow = get_workflow()
+
+    def make_request(self, status_key='new', performer=None, office=None, **fields):
+        return Request.objects.create(
+            user=self.employee,
+            failure_type=self.failure_type,
+            urgency=fields.pop('urgency', 'Средняя'),
+            description=fields.pop('description', 'Не работает принтер'),
+            office_address=office or self.sub,
+            office_location='ул. Ленина 1',
+            employee_location='',
+            performer=performer,
+            status=self.workflow.status(status_key),
+            **fields,
+        )
+
+
+class MediaTestCase(BackTestCase):
+    """Медиафайлы и временный каталог загрузок — во временной папке"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            UPLOAD_STAGING_ROOT=f'{media_root}/staging',
+            BACKGROUND_JOBS_EAGER=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def start_upload(self, content, user=None):
+        response = self.client.post(
+            reverse('create_upload'),
+            {'user_id': (user or self.employee).id_user, 'fileName': 'scan.pdf', 'size': len(content)},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload']['uploadId']
+
+    def put_chunk(self, upload_id, offset, data, user=None):
+        return self.client.put(
+            reverse('upload_chunk', args=[upload_id]) + f'?offset={offset}&user_id={(user or self.employee).id_user}',
+            data,
+            content_type='application/octet-stream',
+        )
+
+    def complete(self, upload_id, sha256=None, user=None):
+        return self.client.post(
+            reverse('complete_upload', args=[upload_id]),
+            {'user_id': (user or self.employee).id_user, 'sha256': sha256},
+            content_type='application/json',
+        )
+
+    def create_form(self, **fields):
+        form = {
+            'user_id': self.employee.id_user,
+            'issueType': 'hardware',
+            'priority': 'high',
+            'problemDescription': 'Не включается монитор',
+            'address': 'ул. Ленина 1',
+        }
+        form.update(fields)
+        return form
+
+
+class ChunkedUploadTests(MediaTestCase):
+
+    def test_chunks_are_appended_at_expected_offset(self):
+        content = b'0123456789'
+        upload_id = self.start_upload(content)
+
+        self.assertEqual(self.put_chunk(upload_id, 0, content[:4]).status_code, 200)
+        # Повтор уже принятой части: сервер сообщает верное смещение
+        response = self.put_chunk(upload_id, 0, content[:4])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4)
+
+        response = self.put_chunk(upload_id, 4, content[4:])
+        self.assertEqual(response.json()['upload']['offset'], len(content))
+        response = self.complete(upload_id, hashlib.sha256(content).hexdigest())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ChunkedUpload.objects.get(id_upload=upload_id).state, ChunkedUpload.STATE_COMPLETE)
+
+    def test_upload_belongs_to_its_author(self):
+        upload_id = self.start_upload(b'abc')
+        self.assertEqual(self.put_chunk(upload_id, 0, b'abc', user=self.aho).status_code, 403)
+        self.assertEqual(self.client.get(
+            reverse('upload_chunk', args=[upload_id]) + f'?user_id={self.aho.id_user}'
+        ).status_code, 403)
+        self.put_chunk(upload_id, 0, b'abc')
+        self.assertEqual(self.complete(upload_id, user=self.aho).status_code, 403)
+
+    def test_checksum_mismatch_keeps_upload_open(self):
+        upload_id = self.start_upload(b'abc')
+        self.put_chunk(upload_id, 0, b'abc')
+        response = self.complete(upload_id, hashlib.sha256(b'abd').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ChunkedUpload.objects.get(id_upload=upload_id).state, ChunkedUpload.STATE_UPLOADING)
+
+    def test_incomplete_upload_cannot_be_completed(self):
+        upload_id = self.start_upload(b'abcdef')
+        self.put_chunk(upload_id, 0, b'abc')
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 3)
+
+
+class CreateRequestTests(MediaTestCase):
+
+    def completed_upload(self, content=b'%PDF-1.4'):
+        upload_id = self.start_upload(content)
+        self.put_chunk(upload_id, 0, content)
+        self.complete(upload_id)
+        return upload_id
+
+    def test_upload_ids_are_attached(self):
+        upload_id = self.completed_upload()
+        response = self.client.post(reverse('create_request'), self.create_form(upload_ids=[upload_id]))
+        self.assertEqual(response.status_code, 200)
+
+        request_obj = Request.objects.get(id_request=response.json()['request']['id'])
+        self.assertEqual(request_obj.status_id, self.workflow.initial_status.id_status)
+        attachment = RequestAttachment.objects.get(request=request_obj)
+        self.assertEqual(attachment.original_name, 'scan.pdf')
+        self.assertEqual(attachment.state, RequestAttachment.STATE_PENDING)
+        self.assertEqual(ChunkedUpload.objects.get(id_upload=upload_id).state, ChunkedUpload.STATE_ATTACHED)
+        self.assertTrue(RequestStatusHistory.objects.filter(
+            request=request_obj, from_status__isnull=True, to_status=self.workflow.initial_status,
+        ).exists())
+
+    def test_unknown_upload_rolls_back_request(self):
+        upload_id = self.completed_upload()
+        response = self.client.post(
+            reverse('create_request'), self.create_form(upload_ids=[upload_id, 'f' * 32])
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Request.objects.exists())
+        self.assertFalse(RequestAttachment.objects.exists())
+        self.assertFalse(NotificationEvent.objects.exists())
+        # Загрузку можно прикрепить к следующей заявке
+        self.assertEqual(ChunkedUpload.objects.get(id_upload=upload_id).state, ChunkedUpload.STATE_COMPLETE)
+
+    def test_foreign_upload_is_rejected(self):
+        upload_id = self.start_upload(b'abc', user=self.aho)
+        self.put_chunk(upload_id, 0, b'abc', user=self.aho)
+        self.complete(upload_id, user=self.aho)
+        response = self.client.post(reverse('create_request'), self.create_form(upload_ids=[upload_id]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Request.objects.exists())
+
+
+class IdempotencyTests(MediaTestCase):
+
+    def create(self, key, **fields):
+        return self.client.post(reverse('create_request'), self.create_form(**fields), HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        first = self.create('key-1')
+        second = self.create('key-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['request']['id'], first.json()['request']['id'])
+        self.assertEqual(Request.objects.count(), 1)
+
+    def test_same_key_with_other_form_is_rejected(self):
+        self.create('key-1')
+        response = self.create('key-1', problemDescription='Не работает клавиатура')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Request.objects.count(), 1)
+
+    def test_files_are_part_of_fingerprint(self):
+        self.assertEqual(self.create('key-1').status_code, 200)
+        with tempfile.TemporaryFile() as attachment:
+            attachment.write(b'data')
+            attachment.seek(0)
+            response = self.client.post(
+                reverse('create_request'), self.create_form(attachments=attachment), HTTP_IDEMPOTENCY_KEY='key-1',
+            )
+        self.assertEqual(response.status_code, 422)
+
+    def test_key_is_scoped_to_user(self):
+        first = self.create('key-1')
+        other = self.create('key-1', user_id=self.aho.id_user)
+        self.assertEqual(other.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', other)
+        self.assertNotEqual(other.json()['request']['id'], first.json()['request']['id'])
+        self.assertEqual(Request.objects.count(), 2)
+
+    def test_request_in_progress_returns_conflict(self):
+        self.create('key-1')
+        # Ответ ещё не сохранён — как если бы первый запрос выполнялся
+        IdempotencyKey.objects.update(status_code=None)
+        response = self.create('key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class WorkflowTests(BackTestCase):
+
+    def change_status(self, request_obj, status_key, user=None):
+        return self.client.patch(
+            reverse('update_request_status', args=[request_obj.id_request]),
+            {'user_id': (user or self.aho).id_user, 'status': status_key},
+            content_type='application/json',
+        )
+
+    def test_transition_moves_load_and_writes_history(self):
+        request_obj = self.make_request(performer=self.aho)
+        Load.objects.create(
+            staff=self.aho, current_tasks_count=1, current_tasks='', urgency='Средняя', weighted_load=1.0,
+        )
+
+        response = self.change_status(request_obj, 'completed')
+        self.assertEqual(response.status_code, 200)
+        request_obj.refresh_from_db()
+        self.assertEqual(request_obj.status_id, self.workflow.status('completed').id_status)
+        self.assertIsNotNone(request_obj.completed_at)
+        self.assertEqual(Load.objects.get(staff=self.aho).current_tasks_count, 0)
+        entry = RequestStatusHistory.objects.get(request=request_obj)
+        self.assertEqual(entry.from_status_id, self.workflow.status('new').id_status)
+        self.assertTrue(NotificationEvent.objects.filter(user=self.employee, request=request_obj).exists())
+
+        # Переоткрытие возвращает заявку в загрузку исполнителя
+        self.change_status(request_obj, 'in_progress')
+        request_obj.refresh_from_db()
+        self.assertIsNone(request_obj.completed_at)
+        self.assertEqual(Load.objects.get(staff=self.aho).current_tasks_count, 1)
+
+    def test_invalid_status_is_rejected(self):
+        request_obj = self.make_request()
+        response = self.change_status(request_obj, 'archived')
+        self.assertEqual(response.status_code, 400)
+        request_obj.refresh_from_db()
+        self.assertEqual(request_obj.status_id, self.workflow.status('new').id_status)
+        self.assertFalse(RequestStatusHistory.objects.exists())
+
+    def test_only_aho_changes_status(self):
+        request_obj = self.make_request()
+        self.assertEqual(self.change_status(request_obj, 'completed', user=self.employee).status_code, 403)
+
+    def test_bulk_update_reports_each_request(self):
+        fresh = self.make_request()
+        done = self.make_request('completed')
+        response = self.client.patch(
+            reverse('bulk_update_request_status'),
+            {'user_id': self.aho.id_user, 'status': 'completed', 'request_ids': [fresh.id_request, done.id_request, 999]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['updated'], [fresh.id_request])
+        self.assertEqual(data['unchanged'], [done.id_request])
+        self.assertEqual(data['rejected'], [])
+        self.assertEqual(data['notFound'], [999])
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status_id, self.workflow.status('completed').id_status)
+        self.assertEqual(RequestStatusHistory.objects.filter(request=fresh).count(), 1)
+
+    def test_bulk_update_rejects_unknown_status(self):
+        request_obj = self.make_request()
+        response = self.client.patch(
+            reverse('bulk_update_request_status'),
+            {'user_id': self.aho.id_user, 'status': 'archived', 'request_ids': [request_obj.id_request]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class DashboardTests(BackTestCase):
+
+    def history(self, request_obj, to_key, from_key=None, changed_at=None):
+        return dashboard.history_entry(
+            request_obj.id_request,
+            dashboard.request_snapshot(request_obj),
+            to_status=self.workflow.status(to_key),
+            from_status=self.workflow.status(from_key) if from_key else None,
+            changed_at=changed_at or timezone.now() - timedelta(hours=2),
+        ).save()
+
+    def test_refresh_folds_history_once(self):
+        first = self.make_request()
+        second = self.make_request()
+        self.history(first, 'new')
+        self.history(second, 'new')
+        self.history(first, 'completed', 'new')
+
+        self.assertEqual(dashboard.refresh(batch_size=2), 3)
+        self.assertEqual(
+            RollupWatermark.objects.get(name=dashboard.WATERMARK).position,
+            RequestStatusHistory.objects.latest('id_history').id_history,
+        )
+        new_id = self.workflow.status('new').id_status
+        completed_id = self.workflow.status('completed').id_status
+        self.assertEqual(dashboard.backlog(), {new_id: 1, completed_id: 1})
+        day = RequestStatsRollup.objects.filter(period=RequestStatsRollup.PERIOD_DAY)
+        self.assertEqual(sum(row.created for row in day), 2)
+
+        # Повторный запуск без новых записей ничего не добавляет
+        self.assertEqual(dashboard.refresh(), 0)
+        self.assertEqual(dashboard.backlog(), {new_id: 1, completed_id: 1})
+
+    def test_recent_history_waits_for_settle_delay(self):
+        request_obj = self.make_request()
+        self.history(request_obj, 'new')
+        self.history(request_obj, 'completed', 'new', changed_at=timezone.now())
+
+        self.assertEqual(dashboard.refresh(), 1)
+        self.assertEqual(dashboard.backlog(), {self.workflow.status('new').id_status: 1})
+
+    def test_rebuild_matches_refresh(self):
+        request_obj = self.make_request()
+        self.history(request_obj, 'new')
+        self.history(request_obj, 'in_progress', 'new')
+        dashboard.refresh()
+        totals = dashboard.backlog()
+        self.assertEqual(dashboard.rebuild(), 2)
+        self.assertEqual(dashboard.backlog(), totals)
+
+
+class EscalationTests(BackTestCase):
+
+    def overdue(self, status_key='new', **fields):
+        return self.make_request(
+            status_key, performer=self.aho, office=self.root, due_time=timezone.now() - timedelta(hours=1), **fields
+        )
+
+    def test_sweep_notifies_performer_and_supervisor_once(self):
+        request_obj = self.overdue()
+        self.make_request(performer=self.aho, due_time=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(escalation.sweep(batch_size=1), 1)
+        request_obj.refresh_from_db()
+        self.assertIsNotNone(request_obj.escalated_at)
+        self.assertEqual(
+            set(NotificationEvent.objects.values_list('user_id', flat=True)),
+            {self.aho.id_user, self.aho_root.id_user},
+        )
+        self.assertEqual(escalation.sweep(), 0)
+
+    def test_awaiting_purchase_is_marked_without_notification(self):
+        request_obj = self.overdue('awaiting_purchase')
+        self.assertEqual(escalation.sweep(), 0)
+        request_obj.refresh_from_db()
+        self.assertIsNotNone(request_obj.escalated_at)
+        self.assertFalse(NotificationEvent.objects.exists())
+        # Отмеченная заявка больше не выбирается
+        self.assertFalse(escalation.overdue_requests(timezone.now()).exists())
+
+    def test_reopened_request_is_escalated_again(self):
+        request_obj = self.overdue('awaiting_purchase')
+        escalation.sweep()
+        response = self.client.patch(
+            reverse('update_request_status', args=[request_obj.id_request]),
+            {'user_id': self.aho.id_user, 'status': 'in_progress'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        request_obj.refresh_from_db()
+        self.assertIsNone(request_obj.escalated_at)
+        self.assertEqual(escalation.sweep(), 1)
+
+
+class RebalanceTests(BackTestCase):
+
+    def test_plan_moves_evens_out_new_requests(self):
+        # Роль латиницей: на SQLite icontains не сворачивает регистр кириллицы
+        helper = User.objects.create(
+            username='aho3', email='a3@x.ru', first_name='Олег', last_name='Олегов', middle_name='О',
+            position='aho', role='aho', office=self.sub,
+        )
+        for _ in range(3):
+            self.make_request(performer=self.aho)
+        started = self.make_request('in_progress', performer=self.aho)
+
+        distribution = rebalance.load_distribution()
+        self.assertEqual(distribution[self.aho.id_user], {'tasks': 4, 'weighted': 4.0, 'movable': 3})
+        self.assertEqual(distribution[helper.id_user]['tasks'], 0)
+
+        moves = rebalance.plan_moves(distribution)
+        # 4 и 0 -> 3 и 1 -> 2 и 2; начатая заявка не переносится
+        self.assertEqual(len(moves), 2)
+        self.assertTrue(all(move.source_id == self.aho.id_user and move.target_id == helper.id_user for move in moves))
+        self.assertNotIn(started.id_request, {move.request_id for move in moves})
+
+    def test_drained_staff_gives_away_all_new_requests(self):
+        helper = User.objects.create(
+            username='aho3', email='a3@x.ru', first_name='Олег', last_name='Олегов', middle_name='О',
+            position='aho', role='aho', office=self.sub,
+        )
+        requests = [self.make_request(performer=self.aho) for _ in range(2)]
+        moves = rebalance.plan_moves(rebalance.load_distribution(), drain_ids=[self.aho.id_user])
+        self.assertEqual(sorted(move.request_id for move in moves), sorted(r.id_request for r in requests))
+        self.assertTrue(all(move.target_id == helper.id_user for move in moves))
+
+
+class DataMigrationTests(TransactionTestCase):
+    """Шаги переноса данных: схема откатывается до миграции, данные заполняются старыми моделями"""
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+
+    def tearDown(self):
+        self.migrate_to(self.executor.loader.graph.leaf_nodes('back')[0][1])
+        reset_workflow()
+
+    def migrate_to(self, name):
+        self.executor.loader.build_graph()
+        self.executor.migrate([('back', name)])
+        return self.executor.loader.project_state(('back', name)).apps
+
+    def legacy_request(self, apps, status, created_at, last_updated, expense=None):
+        Office = apps.get_model('back', 'Office')
+        User = apps.get_model('back', 'User')
+        Table = apps.get_model('back', 'Table')
+        TypeOfFailure = apps.get_model('back', 'TypeOfFailure')
+        Request = apps.get_model('back', 'Request')
+        office = Office.objects.first() or Office.objects.create(
+            name='Филиал', region='Свердловская', city='Екатеринбург', address='ул. Ленина 1', level=1,
+        )
+        user = User.objects.first() or User.objects.create(
+            first_name='Иван', last_name='Иванов', middle_name='И', position='dev', role='employee', office=office,
+        )
+        failure_type = TypeOfFailure.objects.first() or TypeOfFailure.objects.create(name='Другое', description='')
+        expense = expense or Table.objects.create(expense_name='Заявка', amount=0)
+        request_obj = Request.objects.create(
+            user=user, failure_type=failure_type, urgency='Средняя', description='', office_address=office,
+            office_location='', employee_location='', expense=expense, status=status,
+        )
+        # auto_now и auto_now_add не дают задать даты при создании
+        Request.objects.filter(pk=request_obj.pk).update(created_at=created_at, last_updated=last_updated)
+        return request_obj
+
+    def test_0007_backfills_creation_and_current_status(self):
+        old_apps = self.migrate_to('0006_requestattachment')
+        Status = old_apps.get_model('back', 'Status')
+        initial = Status.objects.create(name='Новая')
+        done = Status.objects.create(name='Выполнена')
+        created_at = timezone.now() - timedelta(days=3)
+        updated_at = timezone.now() - timedelta(days=1)
+        fresh = self.legacy_request(old_apps, initial, created_at, created_at)
+        closed = self.legacy_request(old_apps, done, created_at, updated_at)
+
+        new_apps = self.migrate_to('0007_status_history')
+        History = new_apps.get_model('back', 'RequestStatusHistory')
+        self.assertEqual(
+            list(History.objects.filter(request_id=fresh.pk).values_list('from_status_id', 'to_status_id', 'changed_at')),
+            [(None, initial.pk, created_at)],
+        )
+        self.assertEqual(
+            list(History.objects.filter(request_id=closed.pk).order_by('changed_at').values_list(
+                'from_status_id', 'to_status_id', 'changed_at'
+            )),
+            [(None, initial.pk, created_at), (initial.pk, done.pk, updated_at)],
+        )
+
+    def test_0016_copies_shared_comments_and_drops_orphans(self):
+        old_apps = self.migrate_to('0015_idempotency_keys')
+        Status = old_apps.get_model('back', 'Status')
+        Comment = old_apps.get_model('back', 'Comment')
+        status = Status.objects.create(name='Новая')
+        first = self.legacy_request(old_apps, status, timezone.now(), timezone.now())
+        second = self.legacy_request(old_apps, status, timezone.now(), timezone.now())
+        shared = Comment.objects.create(content='Общий комментарий')
+        Comment.objects.create(content='Без заявки')
+        old_apps.get_model('back', 'Request').objects.get(pk=first.pk).comments.add(shared)
+        old_apps.get_model('back', 'Request').objects.get(pk=second.pk).comments.add(shared)
+
+        new_apps = self.migrate_to('0016_comment_request_fk')
+        comments = new_apps.get_model('back', 'Comment').objects.order_by('request_id')
+        self.assertEqual(
+            list(comments.values_list('request_id', 'content')),
+            [(first.pk, 'Общий комментарий'), (second.pk, 'Общий комментарий')],
+        )
+
+    def test_0017_moves_nonempty_expenses_to_lines(self):
+        old_apps = self.migrate_to('0016_comment_request_fk')
+        Status = old_apps.get_model('back', 'Status')
+        Table = old_apps.get_model('back', 'Table')
+        status = Status.objects.create(name='Новая')
+        repair = self.legacy_request(
+            old_apps, status, timezone.now(), timezone.now(),
+            expense=Table.objects.create(expense_name='Ремонт', amount=150),
+        )
+        self.legacy_request(old_apps, status, timezone.now(), timezone.now())
+
+        new_apps = self.migrate_to('0017_expense_lines')
+        lines = new_apps.get_model('back', 'RequestExpense').objects.all()
+        self.assertEqual(list(lines.values_list('request_id', 'name', 'amount')), [(repair.pk, 'Ремонт', 150)])
+        rollup = new_apps.get_model('back', 'ExpenseRollup').objects.get()
+        self.assertEqual((rollup.total, rollup.lines_count), (150, 1))
@@ -0,0 +1,112 @@
+"""
+Уменьшенные копии изображений (миниатюры) для списков и карточек.
+
+Для каждого размера из THUMBNAIL_SIZES создаются WebP и JPEG.
+Кодирование выполняется в пуле процессов, по одной задаче на размер.
+Результат хранится в JSON-поле модели: {размер: {формат: имя файла}}.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .media import media_url
+
+DEFAULT_SIZES = {'small': 160, 'medium': 480}
+
+# Форматы миниатюр: WebP для современных браузеров, JPEG как запасной
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+THUMBNAILS_DIR = 'thumbs'
+
+_executor = None
+
+
+def thumbnail_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def _get_executor():
+    """Пул процессов создаётся один раз на процесс воркера"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'THUMBNAIL_WORKERS', None))
+    return _executor
+
+
+def render_thumbnail(source, side, crop):
+    """
+    Строит миниатюру с большей стороной side (или квадрат side×side при crop)
+    и кодирует её во все форматы. source — байты изображения или путь к файлу
+    (крупный файл дочерний процесс читает сам, без передачи через pipe).
+    Выполняется в дочернем процессе.
+    """
+    with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        if crop:
+            # Маленькие изображения не увеличиваем
+            side = min(side, *image.size)
+            image = ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail((side, side), Image.Resampling.LANCZOS)
+        encoded = {}
+        for key, image_format, options in FORMATS:
+            buffer = BytesIO()
+            image.save(buffer, format=image_format, **options)
+            encoded[key] = buffer.getvalue()
+    return encoded
+
+
+def _render_all(data, sizes, crop):
+    """Рендерит все размеры: параллельно в пуле, если он разрешён настройками"""
+    if getattr(settings, 'THUMBNAIL_WORKERS', None) == 0:
+        return {name: render_thumbnail(data, side, crop) for name, side in sizes.items()}
+    executor = _get_executor()
+    futures = {name: executor.submit(render_thumbnail, data, side, crop) for name, side in sizes.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def generate_thumbnails(data, base_name, crop=False, storage=default_storage):
+    """
+    Создаёт миниатюры всех размеров для изображения data (байты или путь
+    к файлу) и сохраняет их в хранилище. Возвращает {размер: {формат: имя}}.
+    """
+    stem = os.path.splitext(base_name)[0]
+    result = {}
+    for size_name, encoded in _render_all(data, thumbnail_sizes(), crop).items():
+        result[size_name] = {}
+        for key, content in encoded.items():
+            ext = 'jpg' if key == 'jpeg' else key
+            name = storage.save(f'{THUMBNAILS_DIR}/{stem}_{size_name}.{ext}', ContentFile(content))
+            result[size_name][key] = name
+    return result
+
+
+def delete_thumbnails(thumbnails, storage=default_storage):
+    """Удаляет файлы миниатюр, ошибки удаления игнорируются"""
+    for formats in (thumbnails or {}).values():
+        for name in formats.values():
+            try:
+                storage.delete(name)
+            except Exception:
+                pass
+
+
+def thumbnail_urls(thumbnails, request):
+    """Подписанные URL миниатюр для ответа API: {размер: {формат: url}}"""
+    return {
+        size_name: {
+            key: media_url(request, name)
+            for key, name in formats.items()
+        }
+        for size_name, formats in (thumbnails or {}).items()
+    }
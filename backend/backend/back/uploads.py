@@ -0,0 +1,400 @@
+"""
+Обработка загруженных файлов вне HTTP-запроса.
+
+View только перемещает загрузку во временный каталог (UPLOAD_STAGING_ROOT),
+записывает метаданные и ставит задачу в очередь. Проверку изображения,
+уменьшение и запись в хранилище выполняет фоновый воркер (manage.py run_jobs).
+Аватар небольшой, поэтому проверяется и сохраняется в запросе (чтобы сразу
+вернуть ссылку на него), в фоне строятся только его миниатюры.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.move import file_move_safe
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import job
+from .models import ChunkedUpload, Request, RequestAttachment, User
+from .thumbnails import delete_thumbnails, generate_thumbnails
+
+
+class InvalidImage(Exception):
+    """Файл не является корректным изображением"""
+
+
+class UploadError(Exception):
+    """Ошибка загрузки файла частями"""
+
+
+class OffsetMismatch(UploadError):
+    """Часть пришла не с того смещения, которое ожидает сервер"""
+
+    def __init__(self, expected):
+        super().__init__(f'Ожидается смещение {expected}')
+        self.expected = expected
+
+
+# Тег EXIF с ориентацией снимка
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def staging_root():
+    return str(settings.UPLOAD_STAGING_ROOT)
+
+
+def staged_path(staged_name):
+    # Имя генерируется нами, но всё равно не даём выйти за пределы каталога
+    return os.path.join(staging_root(), os.path.basename(staged_name))
+
+
+def stage_upload(uploaded):
+    """
+    Перемещает загруженный файл во временный каталог и возвращает его имя.
+    Большие загрузки Django уже держит во временном файле — его просто переносим,
+    без копирования содержимого.
+    """
+    root = staging_root()
+    os.makedirs(root, exist_ok=True)
+    ext = os.path.splitext(uploaded.name)[1].lower()[:10]
+    name = f'{uuid.uuid4().hex}{ext}'
+    path = os.path.join(root, name)
+    if hasattr(uploaded, 'temporary_file_path'):
+        file_move_safe(uploaded.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as destination:
+            for chunk in uploaded.chunks():
+                destination.write(chunk)
+    return name
+
+
+def discard_staged(names):
+    """Удаляет временные файлы, ошибки игнорируются"""
+    for name in names:
+        try:
+            os.remove(staged_path(name))
+        except OSError:
+            pass
+
+
+def create_chunked_upload(user, filename, size):
+    """Начинает загрузку частями: резервирует имя во временном каталоге"""
+    max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+    if size <= 0 or size > max_size:
+        raise UploadError(f'Размер файла должен быть от 1 байта до {max_size} байт')
+    os.makedirs(staging_root(), exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    staged_name = f'{upload_id}{ext}'
+    # Пустой файл создаём сразу, части будут дописываться в него
+    open(staged_path(staged_name), 'wb').close()
+    return ChunkedUpload.objects.create(
+        id_upload=upload_id,
+        user=user,
+        original_name=os.path.basename(filename)[:255],
+        staged_name=staged_name,
+        size=size,
+    )
+
+
+def append_chunk(upload, offset, stream, block_size=64 * 1024):
+    """
+    Дописывает часть из потока stream (тело запроса) в файл загрузки начиная с offset.
+    Смещение должно совпадать с числом уже полученных байт: если ответ на
+    предыдущую часть потерялся, клиент получит OffsetMismatch с верным смещением.
+    Недописанный хвост после обрыва отрезается, поэтому повтор части безопасен.
+    """
+    if upload.state != ChunkedUpload.STATE_UPLOADING:
+        raise UploadError('Загрузка уже завершена')
+    if offset != upload.received:
+        raise OffsetMismatch(upload.received)
+
+    # Часть сначала читается из сети во временный файл без транзакции:
+    # медленный клиент не держит соединение с БД и блокировку строки
+    remaining = upload.size - offset
+    written = 0
+    part_path = staged_path(f'{upload.staged_name}.{uuid.uuid4().hex}.part')
+    try:
+        with open(part_path, 'wb') as part:
+            while True:
+                block = stream.read(block_size)
+                if not block:
+                    break
+                written += len(block)
+                if written > remaining:
+                    raise UploadError('Получено больше данных, чем объявлено при создании загрузки')
+                part.write(block)
+
+        with transaction.atomic():
+            # Дописывать одну загрузку одновременно может только один запрос:
+            # строка блокируется на время проверки смещения и копирования части
+            try:
+                locked = ChunkedUpload.objects.select_for_update(nowait=True).get(id_upload=upload.id_upload)
+            except DatabaseError:
+                raise UploadError('Часть этой загрузки уже передаётся') from None
+            if locked.state != ChunkedUpload.STATE_UPLOADING:
+                raise UploadError('Загрузка уже завершена')
+            if offset != locked.received:
+                raise OffsetMismatch(locked.received)
+
+            with open(staged_path(upload.staged_name), 'r+b') as destination, open(part_path, 'rb') as part:
+                destination.seek(offset)
+                destination.truncate()
+                shutil.copyfileobj(part, destination, block_size)
+
+            # Смещение сдвигаем, только если его не изменил параллельный запрос
+            # (на СУБД без SELECT ... FOR UPDATE блокировки строки нет)
+            received = offset + written
+            if not ChunkedUpload.objects.filter(id_upload=upload.id_upload, received=offset).update(
+                received=received, updated_at=timezone.now()
+            ):
+                raise OffsetMismatch(ChunkedUpload.objects.get(id_upload=upload.id_upload).received)
+    finally:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+    upload.received = received
+    return upload
+
+
+def complete_chunked_upload(upload, sha256=None):
+    """Завершает загрузку; если передан sha256, сверяет контрольную сумму файла"""
+    if upload.state != ChunkedUpload.STATE_UPLOADING:
+        return upload
+    if upload.received != upload.size:
+        raise OffsetMismatch(upload.received)
+    if sha256:
+        digest = hashlib.sha256()
+        with open(staged_path(upload.staged_name), 'rb') as source:
+            for block in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(block)
+        if digest.hexdigest() != sha256.lower():
+            raise UploadError('Контрольная сумма файла не совпадает')
+    ChunkedUpload.objects.filter(id_upload=upload.id_upload).update(
+        state=ChunkedUpload.STATE_COMPLETE, updated_at=timezone.now()
+    )
+    upload.state = ChunkedUpload.STATE_COMPLETE
+    return upload
+
+
+def claim_uploads(user, upload_ids):
+    """
+    Забирает завершённые загрузки пользователя для прикрепления к заявке.
+    Вызывается внутри транзакции создания заявки: если хоть одна загрузка
+    не найдена или не завершена, бросает UploadError и транзакция откатывается.
+    Дальше файлом владеет задача process_attachment.
+    """
+    upload_ids = list(dict.fromkeys(upload_ids))
+    claimed = ChunkedUpload.objects.filter(
+        id_upload__in=upload_ids,
+        user=user,
+        state=ChunkedUpload.STATE_COMPLETE,
+    ).update(state=ChunkedUpload.STATE_ATTACHED, updated_at=timezone.now())
+    if claimed != len(upload_ids):
+        raise UploadError('Загрузка не найдена или ещё не завершена')
+    uploads = {
+        upload.id_upload: upload
+        for upload in ChunkedUpload.objects.filter(id_upload__in=upload_ids)
+    }
+    return [uploads[upload_id] for upload_id in upload_ids]
+
+
+def purge_stale_uploads(older_than=timedelta(hours=24)):
+    """Удаляет брошенные загрузки и записи о давно прикреплённых"""
+    stale = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - older_than)
+    discard_staged(
+        stale.exclude(state=ChunkedUpload.STATE_ATTACHED).values_list('staged_name', flat=True)
+    )
+    deleted, _ = stale.delete()
+    return deleted
+
+
+def prepare_image(path, max_side):
+    """
+    Проверяет, что файл — изображение, и при необходимости уменьшает его
+    до max_side по большей стороне (с учётом поворота из EXIF).
+    Возвращает (содержимое файла в байтах, расширение); содержимое None —
+    исходный файл подходит как есть (его не нужно читать в память).
+    """
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        image = Image.open(path)
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+
+    with image:
+        image_format = image.format or 'PNG'
+        if image_format == 'MPO':
+            # Снимки с некоторых телефонов — это JPEG с дополнительными кадрами
+            image_format = 'JPEG'
+        ext = '.jpg' if image_format == 'JPEG' else f'.{image_format.lower()}'
+        needs_rotation = image.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+        if max(image.size) <= max_side and not needs_rotation:
+            # Исходный файл подходит как есть — не перекодируем
+            return None, ext
+
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        save_kwargs = {}
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            save_kwargs = {'quality': 85, 'optimize': True, 'progressive': True}
+        image.save(buffer, format=image_format, **save_kwargs)
+        return buffer.getvalue(), ext
+
+
+def _store_attachment(attachment, staged):
+    """
+    Кладёт файл вложения в хранилище, строит миниатюры изображения и отмечает
+    вложение готовым. Если после сохранения файла что-то упало, ссылка на файл
+    снимается: повтор задачи сохранит его заново, и счётчик ссылок не растёт.
+    """
+    max_side = getattr(settings, 'ATTACHMENT_MAX_IMAGE_SIDE', 2560)
+    base_name = os.path.splitext(attachment.original_name or staged)[0] or 'attachment'
+    path = staged_path(staged)
+    try:
+        data, ext = prepare_image(path, max_side)
+    except InvalidImage:
+        # Не изображение — файл сохраняется как есть, без миниатюр
+        data, ext, is_image = None, os.path.splitext(staged)[1], False
+    else:
+        is_image = True
+
+    # Крупные файлы (в том числе загруженные частями) копируются в хранилище
+    # потоком; в память читается только уменьшенное изображение
+    if data is None:
+        with open(path, 'rb') as source:
+            attachment.file.save(f'{base_name}{ext}', File(source), save=False)
+    else:
+        attachment.file.save(f'{base_name}{ext}', ContentFile(data), save=False)
+    try:
+        thumbnails = {}
+        if is_image:
+            thumbnails = generate_thumbnails(
+                data if data is not None else path, os.path.basename(attachment.file.name)
+            )
+        RequestAttachment.objects.filter(id_attachment=attachment.id_attachment).update(
+            file=attachment.file.name,
+            thumbnails=thumbnails,
+            state=RequestAttachment.STATE_READY,
+        )
+    except BaseException:
+        attachment.file.storage.delete(attachment.file.name)
+        raise
+
+
+def _attachment_failed(payload):
+    """Попытки обработки исчерпаны: вложение помечается ошибочным, временный файл удаляется"""
+    RequestAttachment.objects.filter(
+        id_attachment=payload['attachment_id'], state=RequestAttachment.STATE_PENDING
+    ).update(state=RequestAttachment.STATE_FAILED)
+    discard_staged([payload['staged']])
+
+
+@job('process_attachment', on_failure=_attachment_failed)
+def process_attachment(payload):
+    """
+    Сохраняет вложение заявки: изображение проверяется и уменьшается, для него
+    создаются миниатюры; остальные файлы (PDF, документы) сохраняются как есть.
+    """
+    staged = payload['staged']
+    attachment = RequestAttachment.objects.filter(id_attachment=payload['attachment_id']).first()
+    if attachment is None:
+        # Заявку удалили раньше, чем дошла очередь
+        discard_staged([staged])
+        return
+
+    # Повтор после ошибки в копировании в старое поле: файл уже сохранён
+    if attachment.state != RequestAttachment.STATE_READY:
+        _store_attachment(attachment, staged)
+    if payload.get('legacy'):
+        # Первое вложение дублируется в старое поле Request.attachments;
+        # ссылка берётся в той же транзакции, иначе повтор её не возьмёт
+        with transaction.atomic():
+            copied = Request.objects.filter(id_request=attachment.request_id).filter(
+                Q(attachments='') | Q(attachments__isnull=True)
+            ).update(attachments=attachment.file.name)
+            if copied:
+                # Старое поле ссылается на тот же файл в хранилище
+                attachment.file.storage.retain(attachment.file.name)
+    discard_staged([staged])
+
+
+def replace_avatar(user, path):
+    """
+    Проверяет и уменьшает изображение path и делает его аватаром пользователя.
+    Старый аватар и его миниатюры удаляются, новые миниатюры создаёт задача
+    process_avatar. Бросает InvalidImage, если файл не изображение.
+    """
+    max_side = getattr(settings, 'AVATAR_MAX_IMAGE_SIDE', 512)
+    data, ext = prepare_image(path, max_side)
+
+    # Удаляем старый аватар и его миниатюры, если они существуют
+    if user.avatar:
+        try:
+            user.avatar.storage.delete(user.avatar.name)
+        except Exception:
+            pass  # Игнорируем ошибки при удалении старого файла
+    delete_thumbnails(user.avatar_thumbnails)
+
+    if data is None:
+        with open(path, 'rb') as source:
+            user.avatar.save(f'avatar{ext}', File(source), save=False)
+    else:
+        user.avatar.save(f'avatar{ext}', ContentFile(data), save=False)
+    user.avatar_thumbnails = {}
+    User.objects.filter(id_user=user.id_user).update(avatar=user.avatar.name, avatar_thumbnails={})
+    return user.avatar.name
+
+
+@job('process_avatar')
+def process_avatar(payload):
+    """Создаёт миниатюры текущего аватара пользователя"""
+    user = User.objects.filter(id_user=payload['user_id']).first()
+    if user is None or not user.avatar:
+        return
+    name = user.avatar.name
+    with user.avatar.open('rb') as source:
+        data = source.read()
+    thumbnails = generate_thumbnails(data, f'users/{user.id_user}/avatar', crop=True)
+    # Аватар могли заменить, пока строились миниатюры, — тогда они не нужны
+    if not User.objects.filter(id_user=user.id_user, avatar=name).update(avatar_thumbnails=thumbnails):
+        delete_thumbnails(thumbnails)
+
+
+@receiver(post_delete, sender=RequestAttachment)
+def _release_attachment_file(sender, instance, **kwargs):
+    """
+    Снимает ссылку на файл вложения (файл удаляется, когда ссылок не осталось).
+    Делается после коммита, чтобы откат удаления не оставил заявку без файла.
+    """
+    name, thumbnails = instance.file.name, instance.thumbnails
+    storage = instance.file.storage
+
+    def release():
+        if name:
+            storage.delete(name)
+        delete_thumbnails(thumbnails)
+
+    transaction.on_commit(release)
+
+
+@receiver(post_delete, sender=Request)
+def _release_legacy_attachment(sender, instance, **kwargs):
+    name, storage = instance.attachments.name, instance.attachments.storage
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
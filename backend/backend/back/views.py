@@ -1,12 +1,40 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from .responses import JsonResponse
+from django.http import Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import (
+    Q, F, Case, Count, IntegerField, OuterRef, Prefetch, Subquery, Value, When, Window,
+)
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
 import json
 import os
-from .models import User, Request, TypeOfFailure, Status, Office, Table, Comment, Notification, Load
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from .models import (
+    User, Request, RequestAttachment, TypeOfFailure, Office, Comment, Notification,
+    RequestStatusHistory, ChunkedUpload,
+)
+from . import analytics, dashboard, dedup, search
+from .expenses import ExpenseError, cost_report, parse_expense_lines, set_request_expenses
+from .idempotency import idempotent
+from .notifications import NEW_REQUEST_MESSAGE, new_request_recipients, notify, notify_many
+from .jobs import enqueue, enqueue_many
+from .routing import (
+    apply_load_deltas, due_time_for, find_best_performer, increment_performer_load, move_request_load,
+    request_weight,
+)
+from .media import check_media_signature, media_url, serve_file
+from .thumbnails import thumbnail_urls
+from .uploads import (
+    InvalidImage, OffsetMismatch, UploadError, append_chunk, claim_uploads, complete_chunked_upload,
+    create_chunked_upload, discard_staged, replace_avatar, stage_upload, staged_path,
+)
+from .workflow import InvalidTransition, get_workflow
 
 
 @csrf_exempt
@@ -56,7 +84,7 @@ def login(request):
         # Формирование URL аватара
         avatar_url = None
         if user.avatar:
-            avatar_url = request.build_absolute_uri(user.avatar.url)
+            avatar_url = media_url(request, user.avatar.name)
 
         # Формирование ответа с данными пользователя
         response_data = {
@@ -72,7 +100,9 @@ def login(request):
                 'deskNumber': user.desk_number or '',
                 'birthDate': birth_date_str,
                 'avatarUrl': avatar_url,
-                'role': user.role or ''
+                'avatarThumbnails': thumbnail_urls(user.avatar_thumbnails, request) if user.avatar else {},
+                'role': user.role or '',
+                'notifyNewRequests': user.notify_new_requests,
             }
         }
 
@@ -112,7 +142,7 @@ def get_profile(request, user_id):
         # Формирование URL аватара
         avatar_url = None
         if user.avatar:
-            avatar_url = request.build_absolute_uri(user.avatar.url)
+            avatar_url = media_url(request, user.avatar.name)
 
         # Формирование ответа с данными пользователя
         response_data = {
@@ -127,7 +157,9 @@ def get_profile(request, user_id):
                 'deskNumber': user.desk_number or '',
                 'birthDate': birth_date_str,
                 'avatarUrl': avatar_url,
-                'role': user.role or ''
+                'avatarThumbnails': thumbnail_urls(user.avatar_thumbnails, request) if user.avatar else {},
+                'role': user.role or '',
+                'notifyNewRequests': user.notify_new_requests,
             }
         }
 
@@ -140,8 +172,60 @@ def get_profile(request, user_id):
         )
 
 
+@csrf_exempt
+@require_http_methods(["PATCH"])
+def update_notification_settings(request, user_id):
+    """API endpoint для подписки сотрудника АХО на уведомления о новых заявках"""
+    try:
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse(
+                {'error': 'Неверный формат данных'},
+                status=400
+            )
+
+        notify_new_requests = data.get('notifyNewRequests')
+        if not isinstance(notify_new_requests, bool):
+            return JsonResponse(
+                {'error': 'notifyNewRequests должен быть true или false'},
+                status=400
+            )
+
+        try:
+            user = User.objects.get(id_user=user_id)
+        except User.DoesNotExist:
+            return JsonResponse(
+                {'error': 'Пользователь не найден'},
+                status=404
+            )
+
+        if notify_new_requests and (
+            not user.role or ('ахо' not in user.role.lower() and 'aho' not in user.role.lower())
+        ):
+            return JsonResponse(
+                {'error': 'Подписка на новые заявки доступна только сотрудникам АХО'},
+                status=403
+            )
+
+        if user.notify_new_requests != notify_new_requests:
+            user.notify_new_requests = notify_new_requests
+            user.save(update_fields=['notify_new_requests'])
+
+        return JsonResponse({
+            'success': True,
+            'notifyNewRequests': user.notify_new_requests,
+        })
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotent
 def upload_avatar(request, user_id):
     """API endpoint для загрузки аватара пользователя"""
     try:
@@ -177,26 +261,24 @@ def upload_avatar(request, user_id):
                 status=400
             )
 
-        # Удаляем старый аватар, если он существует
-        if user.avatar:
-            old_avatar_path = user.avatar.path
-            if os.path.exists(old_avatar_path):
-                try:
-                    os.remove(old_avatar_path)
-                except Exception:
-                    pass  # Игнорируем ошибки при удалении старого файла
-
-        # Сохраняем новый аватар
-        user.avatar = avatar_file
-        user.save()
-
-        # Формируем URL аватара
-        avatar_url = request.build_absolute_uri(user.avatar.url) if user.avatar else None
+        # Изображение проверяется и уменьшается сразу, миниатюры строит фоновый воркер
+        staged = stage_upload(avatar_file)
+        try:
+            with transaction.atomic():
+                replace_avatar(user, staged_path(staged))
+                enqueue('process_avatar', {'user_id': user.id_user})
+        except InvalidImage:
+            return JsonResponse(
+                {'error': 'Файл должен быть изображением'},
+                status=400
+            )
+        finally:
+            discard_staged([staged])
 
         return JsonResponse({
             'success': True,
             'message': 'Аватар успешно загружен',
-            'avatarUrl': avatar_url
+            'avatarUrl': media_url(request, user.avatar.name),
         })
 
     except Exception as e:
@@ -248,41 +330,54 @@ def get_users(request):
         )
 
 
-def find_best_performer(office: Office, urgency: str | None = None):
+# Число подсказок в поиске пользователей по умолчанию и максимальное
+USER_SEARCH_DEFAULT_LIMIT = 10
+USER_SEARCH_MAX_LIMIT = 50
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def search_users(request):
     """
-    Выбирает наилучшего исполнителя (сотрудника АХО) для заявки.
-    Приоритет:
-    1. Сотрудники АХО из того же офиса, где возникла проблема.
-    2. Среди кандидатов выбирается сотрудник с наименьшей загрузкой (current_tasks_count).
-    3. При равной загрузке выбирается сотрудник с наименьшим id (стабильный выбор).
+    API endpoint подсказок при вводе: нечёткий поиск пользователей по ФИО,
+    логину и email. Параметры: q, limit, role (как в get_users).
     """
-    # Находим всех сотрудников АХО (роль содержит "ахо" или "aho")
-    aho_users = User.objects.filter(
-        Q(role__icontains='ахо') | Q(role__icontains='aho')
-    )
-
-    if not aho_users.exists():
-        return None
-
-    # Сначала пробуем сотрудников из того же офиса
-    same_office_candidates = aho_users.filter(office=office) if office else User.objects.none()
-    candidates = same_office_candidates if same_office_candidates.exists() else aho_users
-
-    # Загружаем информацию о загрузке
-    loads = {
-        load.staff_id: load
-        for load in Load.objects.filter(staff__in=candidates)
-    }
+    try:
+        query = request.GET.get('q', '').strip()
+        try:
+            limit = min(max(int(request.GET.get('limit', USER_SEARCH_DEFAULT_LIMIT)), 1), USER_SEARCH_MAX_LIMIT)
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Неверный формат limit'},
+                status=400
+            )
+
+        user_ids = search.search_users(query, limit=limit, role=request.GET.get('role') or None)
+        users_by_id = User.objects.in_bulk(user_ids)
+
+        users_list = []
+        for user_id in user_ids:
+            user = users_by_id[user_id]
+            users_list.append({
+                'id': user.id_user,
+                'first_name': user.first_name or '',
+                'last_name': user.last_name or '',
+                'middle_name': user.middle_name or '',
+                'username': user.username or '',
+                'email': user.email or '',
+                'role': user.role or '',
+            })
 
-    def load_score(user: User) -> int:
-        load_obj = loads.get(user.id_user)
-        if not load_obj or load_obj.current_tasks_count is None:
-            return 0
-        return load_obj.current_tasks_count
+        return JsonResponse({
+            'success': True,
+            'users': users_list
+        })
 
-    # Выбираем сотрудника с минимальной загрузкой
-    best_user = min(candidates, key=lambda u: (load_score(u), u.id_user))
-    return best_user
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
 
 
 # Маппинг типов поломок с фронтенда на бэкенд
@@ -321,19 +416,12 @@ ISSUE_TYPE_REVERSE_MAPPING = {
     'Другое': 'other',
 }
 
-# Маппинг статусов из БД на фронтенд
-STATUS_MAPPING = {
-    'Новая': 'new',
-    'На доработке': 'revision',
-    'В работе': 'in_progress',
-    'Выполнена': 'completed',
-    'Выполненные': 'completed',
-    'Ожидают закупки': 'awaiting_purchase',
-}
+# Статусы, переходы между ними и их побочные эффекты описаны в workflow.py
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotent
 def create_request(request):
     """API endpoint для создания заявки"""
     try:
@@ -389,17 +477,8 @@ def create_request(request):
             defaults={'description': f'Тип поломки: {issue_type_name}'}
         )
 
-        # Получаем или создаем статус "Новая"
-        status, created = Status.objects.get_or_create(
-            name='Новая',
-            defaults={}
-        )
-
-        # Получаем или создаем запись в таблице затрат (по умолчанию)
-        expense, created = Table.objects.get_or_create(
-            expense_name='Заявка',
-            defaults={'amount': 0}
-        )
+        # Начальный статус "Новая"
+        status = get_workflow().initial_status
 
         # Определяем офис: приоритет — офис, выбранный пользователем в форме, затем офис пользователя
         office_id = request.POST.get('office_id')
@@ -422,65 +501,110 @@ def create_request(request):
         # Маппинг приоритета
         urgency = PRIORITY_MAPPING.get(priority_key, 'Средняя')
 
-        # Создаем заявку (без исполнителя, назначим ниже автоматически)
-        new_request = Request.objects.create(
-            user=user,
-            failure_type=failure_type,
-            urgency=urgency,
-            description=description,
-            office_address=office_address,
-            office_location=office_location,
-            employee_location=employee_location or '',
-            expense=expense,
-            status=status
-        )
-
         # Автоматическое назначение исполнителя (только сотрудники АХО)
-        performer = find_best_performer(office_address, urgency)
-        if performer:
-            new_request.performer = performer
-            new_request.save(update_fields=['performer'])
-
-            # Обновляем загрузку исполнителя
-            load_obj, _ = Load.objects.get_or_create(
-                staff=performer,
-                defaults={
-                    'current_tasks_count': 0,
-                    'current_tasks': '',
-                    'urgency': urgency,
-                },
-            )
-            # Увеличиваем счетчик задач
-            load_obj.current_tasks_count = (load_obj.current_tasks_count or 0) + 1
-            # Добавляем id заявки в текстовое поле (обратная совместимость)
-            if load_obj.current_tasks:
-                load_obj.current_tasks = f"{load_obj.current_tasks}, {new_request.id_request}"
-            else:
-                load_obj.current_tasks = str(new_request.id_request)
-            load_obj.urgency = urgency
-            load_obj.save()
-
-        # Обработка загрузки изображений
-        if 'attachments' in request.FILES:
-            files = request.FILES.getlist('attachments')
-            # Сохраняем все изображения
-            from back.models import RequestAttachment
-            for file in files:
-                RequestAttachment.objects.create(
-                    request=new_request,
-                    file=file
+        performer = find_best_performer(office_address, urgency, failure_type.id_type)
+        # Вес заявки в загрузке исполнителя и срок выполнения по таблицам SLA
+        weight = request_weight(urgency, failure_type.id_type)
+        due_time = due_time_for(timezone.now(), urgency, failure_type.name)
+
+        # Похожие открытые заявки того же офиса с той же поломкой (возможные дубли)
+        signature = dedup.minhash(description)
+        duplicates = dedup.find_duplicates(signature, office_address.id_office, failure_type.id_type)
+
+        # Файлы только переносим во временный каталог: проверку, уменьшение и запись
+        # в хранилище выполнит фоновый воркер после коммита
+        files = request.FILES.getlist('attachments') if 'attachments' in request.FILES else []
+        staged_names = []
+        # Крупные файлы загружаются заранее частями (api/uploads/) и передаются по id
+        upload_ids = request.POST.getlist('upload_ids')
+
+        try:
+            for uploaded in files:
+                staged_names.append(stage_upload(uploaded))
+
+            with transaction.atomic():
+                # Исполнитель записывается сразу при создании заявки
+                new_request = Request.objects.create(
+                    user=user,
+                    failure_type=failure_type,
+                    urgency=urgency,
+                    description=description,
+                    office_address=office_address,
+                    office_location=office_location,
+                    employee_location=employee_location or '',
+                    performer=performer,
+                    status=status,
+                    due_time=due_time,
+                    routing_weight=weight,
                 )
-            # Также сохраняем первое изображение в старое поле для обратной совместимости
-            if files:
-                new_request.attachments = files[0]
-                new_request.save()
-
-        # Создаем уведомление о создании заявки
-        Notification.objects.create(
-            user=user,
-            request=new_request,
-            message=f'Ваша заявка #{new_request.id_request} создана.'
-        )
+
+                # Пары (исходное имя, имя во временном каталоге)
+                staged_files = [
+                    (os.path.basename(uploaded.name)[:255], staged)
+                    for uploaded, staged in zip(files, staged_names)
+                ]
+                if upload_ids:
+                    staged_files += [
+                        (upload.original_name, upload.staged_name)
+                        for upload in claim_uploads(user, upload_ids)
+                    ]
+
+                if staged_files:
+                    attachments = RequestAttachment.objects.bulk_create([
+                        RequestAttachment(
+                            request=new_request,
+                            original_name=original_name,
+                            state=RequestAttachment.STATE_PENDING,
+                        )
+                        for original_name, _ in staged_files
+                    ])
+                    # Первое вложение также попадёт в старое поле (обратная совместимость)
+                    enqueue_many([
+                        ('process_attachment', {
+                            'attachment_id': attachment.id_attachment,
+                            'staged': staged,
+                            'legacy': index == 0,
+                        })
+                        for index, (attachment, (_, staged)) in enumerate(zip(attachments, staged_files))
+                    ])
+
+                if performer:
+                    increment_performer_load(performer, new_request.id_request, urgency, weight)
+
+                dedup.store_signature(new_request, signature, replace=False)
+
+                dashboard.history_entry(
+                    new_request.id_request,
+                    dashboard.request_snapshot(new_request),
+                    to_status=status,
+                    changed_by=user,
+                    changed_at=new_request.created_at,
+                ).save()
+
+                # Уведомления автору и подписанным сотрудникам АХО офиса заявки
+                # и вышестоящих офисов — одним INSERT в очередь (доставит воркер)
+                fanout_message = NEW_REQUEST_MESSAGE.format(
+                    id=new_request.id_request,
+                    office=office_address.name,
+                    failure_type=failure_type.name,
+                    urgency=urgency,
+                )
+                recipient_ids = new_request_recipients(office_address.id_office, exclude_ids=[user.id_user])
+                notify_many(
+                    [(user.id_user, new_request.id_request, f'Ваша заявка #{new_request.id_request} создана.')]
+                    + [(recipient_id, new_request.id_request, fanout_message) for recipient_id in recipient_ids]
+                )
+        except UploadError as e:
+            discard_staged(staged_names)
+            return JsonResponse(
+                {'error': str(e)},
+                status=400
+            )
+        except Exception:
+            # Транзакция откатилась — файлы без записей в БД не нужны
+            # (загрузки частями остаются, их можно прикрепить повторно)
+            discard_staged(staged_names)
+            raise
 
         return JsonResponse({
             'success': True,
@@ -489,7 +613,18 @@ def create_request(request):
                 'id': new_request.id_request,
                 'status': status.name,
                 'created_at': new_request.created_at.isoformat()
-            }
+            },
+            # Фронтенд может предложить связать заявку с уже открытой
+            'possibleDuplicates': [
+                {
+                    'id': duplicate.id_request,
+                    'similarity': round(score, 2),
+                    'status': get_workflow().key_for_id(duplicate.status_id),
+                    'problemDescription': duplicate.description or '',
+                    'createdAt': duplicate.created_at.isoformat(),
+                }
+                for duplicate, score in duplicates
+            ],
         })
 
     except json.JSONDecodeError:
@@ -504,33 +639,138 @@ def create_request(request):
         )
 
 
-# Обратный маппинг приоритетов (из БД на фронтенд)
-PRIORITY_REVERSE_MAPPING = {
-    'Низкая': 'low',
-    'Средняя': 'medium',
-    'Высокая': 'high',
-    'Критическая': 'urgent',
-}
+def serialize_request(req, request, include_office=False):
+    """
+    Преобразует заявку в формат, понятный фронтенду.
+    Ожидает, что связанные объекты загружены через select_related,
+    а вложения и последний комментарий — через with_comment_summary.
+    """
+    # Маппинг приоритета
+    priority = PRIORITY_REVERSE_MAPPING.get(req.urgency, 'medium')
+
+    # Маппинг типа поломки
+    issue_type = ISSUE_TYPE_REVERSE_MAPPING.get(req.failure_type.name, 'other')
+
+    # Маппинг статуса
+    status_key = get_workflow().key_for_id(req.status_id)
+
+    # Формируем location (объединяем office_location и employee_location)
+    location_parts = []
+    if req.office_location:
+        location_parts.append(req.office_location)
+    if req.employee_location:
+        location_parts.append(req.employee_location)
+    location = ', '.join(location_parts) if location_parts else 'Не указано'
+
+    # Формируем список вложений из новой модели RequestAttachment
+    # (миниатюры идут в том же порядке, что и вложения)
+    attachments = []
+    thumbnails = []
+    for attachment in req.request_attachments.all():
+        if attachment.file:
+            attachments.append(media_url(request, attachment.file.name))
+            thumbnails.append(thumbnail_urls(attachment.thumbnails, request))
+
+    # Если нет вложений в новой модели, используем старое поле для обратной совместимости
+    if not attachments and req.attachments:
+        attachments.append(media_url(request, req.attachments.name))
+        thumbnails.append({})
+
+    # Формируем данные об исполнителе
+    performer_data = None
+    if req.performer:
+        performer_data = {
+            'id': req.performer.id_user,
+            'first_name': req.performer.first_name or '',
+            'last_name': req.performer.last_name or '',
+            'middle_name': req.performer.middle_name or '',
+            'username': req.performer.username or '',
+        }
 
-# Обратный маппинг типов поломок (из БД на фронтенд)
-ISSUE_TYPE_REVERSE_MAPPING = {
-    'Доступ': 'access',
-    'Оборудование': 'hardware',
-    'ПО': 'software',
-    'Сеть': 'network',
-    'Мебель': 'furniture',
-    'Другое': 'other',
-}
+    # Формируем данные о затратах; expense — первая строка для совместимости с фронтендом
+    expense_lines = list(req.expense_lines.all())
+    expenses = [
+        {'id': line.id_expense, 'name': line.name, 'amount': float(line.amount)}
+        for line in expense_lines
+    ]
+    expense_data = expenses[0] if expenses else None
+
+    # В списках отдаём только последний комментарий; все — через get_request_comments.
+    # comments оставлен списком из последнего комментария для совместимости с фронтендом
+    latest_comment = serialize_comment(req.latest_comments[0]) if req.latest_comments else None
+
+    office = req.office_address
+    data = {
+        'id': str(req.id_request),
+        'priority': priority,
+        'location': location,
+        'address': office.address if office else '',
+    }
+    if include_office:
+        data.update({
+            'region': office.region if office else '',
+            'city': office.city if office else '',
+            'officeId': office.id_office if office else None,
+            'officeName': office.name if office else '',
+        })
+    data.update({
+        'employeeLocation': req.employee_location or '',
+        'locationDescription': req.office_location or '',
+        'problemDescription': req.description or '',
+        'issueType': issue_type,
+        'status': status_key,
+        'createdAt': req.created_at.isoformat(),
+        'dueTime': req.due_time.isoformat() if req.due_time else None,
+        'attachments': attachments,
+        'attachmentThumbnails': thumbnails,
+        'performer': performer_data,
+        'expense': expense_data,
+        'expenses': expenses,
+        'expensesTotal': float(sum((line.amount for line in expense_lines), Decimal(0))),
+        'commentsCount': req.comments_count,
+        'latestComment': latest_comment,
+        'comments': [latest_comment] if latest_comment else [],
+    })
+    return data
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.id_comment,
+        'content': comment.content or '',
+        'createdAt': comment.created_at.isoformat() if comment.created_at else '',
+    }
 
-# Маппинг статусов из БД на фронтенд
-STATUS_MAPPING = {
-    'Новая': 'new',
-    'На доработке': 'revision',
-    'В работе': 'in_progress',
-    'Выполнена': 'completed',
-    'Выполненные': 'completed',
-    'Ожидают закупки': 'awaiting_purchase',
-}
+
+def with_comment_summary(qs):
+    """
+    Добавляет к заявкам число комментариев (comments_count) и последний
+    комментарий (latest_comments — список из одного элемента). Оба берутся
+    по индексу (request, created_at), без загрузки всех комментариев.
+    """
+    comments_count = Comment.objects.filter(request=OuterRef('pk')).order_by().values(
+        'request'
+    ).annotate(count=Count('*')).values('count')
+    return qs.annotate(
+        comments_count=Coalesce(Subquery(comments_count, output_field=IntegerField()), 0)
+    ).prefetch_related(Prefetch(
+        'comments',
+        queryset=Comment.objects.order_by('-created_at', '-id_comment')[:1],
+        to_attr='latest_comments',
+    ))
+
+
+def requests_for_user(user, filter_type):
+    """Базовый queryset заявок пользователя для фильтров 'мои заявки' / 'я исполнитель'"""
+    if filter_type == 'i_am_performer':
+        # Заявки, где пользователь является исполнителем
+        qs = Request.objects.filter(performer=user)
+    else:
+        # Заявки, которые создал пользователь (по умолчанию)
+        qs = Request.objects.filter(user=user)
+    return with_comment_summary(qs.select_related(
+        'failure_type', 'status', 'office_address', 'performer'
+    ).prefetch_related('request_attachments', 'expense_lines'))
 
 
 @csrf_exempt
@@ -549,98 +789,10 @@ def get_requests(request, user_id):
 
         # Получаем параметр фильтра из запроса
         filter_type = request.GET.get('filter', 'my_requests')
-        
-        # Фильтруем заявки в зависимости от типа фильтра
-        if filter_type == 'i_am_performer':
-            # Заявки, где пользователь является исполнителем
-            requests = Request.objects.filter(performer=user).select_related(
-                'failure_type', 'status', 'office_address', 'performer', 'expense', 'user'
-            ).prefetch_related('comments').order_by('-created_at')
-        else:
-            # Заявки, которые создал пользователь (по умолчанию)
-            requests = Request.objects.filter(user=user).select_related(
-                'failure_type', 'status', 'office_address', 'performer', 'expense'
-            ).prefetch_related('comments').order_by('-created_at')
+        requests = requests_for_user(user, filter_type).order_by('-created_at')
 
         # Формируем список заявок
-        requests_list = []
-        for req in requests:
-            # Маппинг приоритета
-            priority = PRIORITY_REVERSE_MAPPING.get(req.urgency, 'medium')
-            
-            # Маппинг типа поломки
-            issue_type = ISSUE_TYPE_REVERSE_MAPPING.get(req.failure_type.name, 'other')
-            
-            # Маппинг статуса
-            status_key = STATUS_MAPPING.get(req.status.name, 'new')
-            
-            # Формируем location (объединяем office_location и employee_location)
-            location_parts = []
-            if req.office_location:
-                location_parts.append(req.office_location)
-            if req.employee_location:
-                location_parts.append(req.employee_location)
-            location = ', '.join(location_parts) if location_parts else 'Не указано'
-
-            # Формируем список вложений из новой модели RequestAttachment
-            from back.models import RequestAttachment
-            attachments = []
-            request_attachments = RequestAttachment.objects.filter(request=req)
-            for attachment in request_attachments:
-                if attachment.file:
-                    attachment_url = request.build_absolute_uri(attachment.file.url)
-                    attachments.append(attachment_url)
-            
-            # Если нет вложений в новой модели, используем старое поле для обратной совместимости
-            if not attachments and req.attachments:
-                attachment_url = request.build_absolute_uri(req.attachments.url)
-                attachments.append(attachment_url)
-            
-            # Формируем данные об исполнителе
-            performer_data = None
-            if req.performer:
-                performer_data = {
-                    'id': req.performer.id_user,
-                    'first_name': req.performer.first_name or '',
-                    'last_name': req.performer.last_name or '',
-                    'middle_name': req.performer.middle_name or '',
-                    'username': req.performer.username or '',
-                }
-            
-            # Формируем данные о затратах
-            expense_data = None
-            if req.expense:
-                expense_data = {
-                    'id': req.expense.id_table,
-                    'name': req.expense.expense_name or '',
-                    'amount': float(req.expense.amount) if req.expense.amount else 0,
-                }
-            
-            # Формируем список комментариев
-            comments_list = []
-            for comment in req.comments.all():
-                comments_list.append({
-                    'id': comment.id_comment,
-                    'content': comment.content or '',
-                    'createdAt': comment.created_at.isoformat() if comment.created_at else '',
-                })
-            
-            requests_list.append({
-                'id': str(req.id_request),
-                'priority': priority,
-                'location': location,
-                'address': req.office_address.address if req.office_address else '',
-                'employeeLocation': req.employee_location or '',
-                'locationDescription': req.office_location or '',
-                'problemDescription': req.description or '',
-                'issueType': issue_type,
-                'status': status_key,
-                'createdAt': req.created_at.isoformat(),
-                'attachments': attachments,
-                'performer': performer_data,
-                'expense': expense_data,
-                'comments': comments_list,
-            })
+        requests_list = [serialize_request(req, request) for req in requests]
 
         return JsonResponse({
             'success': True,
@@ -654,6 +806,89 @@ def get_requests(request, user_id):
             )
 
 
+# Размер колонки канбан-доски по умолчанию и максимальный
+BOARD_DEFAULT_LIMIT = 20
+BOARD_MAX_LIMIT = 100
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_requests_board(request, user_id):
+    """
+    API endpoint канбан-доски: заявки пользователя, сгруппированные по статусу.
+    В каждой колонке не больше limit самых свежих заявок и общее число заявок
+    в колонке. Всё считается одним запросом с оконными функциями
+    (ROW_NUMBER и COUNT с PARTITION BY status), без выборки всего списка.
+    """
+    try:
+        try:
+            user = User.objects.get(id_user=user_id)
+        except User.DoesNotExist:
+            return JsonResponse(
+                {'error': 'Пользователь не найден'},
+                status=404
+            )
+
+        try:
+            limit = int(request.GET.get('limit', BOARD_DEFAULT_LIMIT))
+        except (ValueError, TypeError):
+            return JsonResponse(
+                {'error': 'Неверный формат limit'},
+                status=400
+            )
+        limit = max(1, min(limit, BOARD_MAX_LIMIT))
+
+        filter_type = request.GET.get('filter', 'my_requests')
+        status_partition = [F('status_id')]
+        requests = requests_for_user(user, filter_type).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=status_partition,
+                order_by=[F('created_at').desc(), F('id_request').desc()],
+            ),
+            column_total=Window(
+                expression=Count('id_request'),
+                partition_by=status_partition,
+            ),
+        ).filter(row_number__lte=limit).order_by('status_id', 'row_number')
+
+        # Несколько статусов БД могут соответствовать одной колонке ('Выполнена', 'Выполненные')
+        workflow = get_workflow()
+        columns = {}
+        counted_statuses = set()
+        for req in requests:
+            status_key = workflow.key_for_id(req.status_id)
+            column = columns.setdefault(status_key, {'count': 0, 'requests': []})
+            if req.status_id not in counted_statuses:
+                counted_statuses.add(req.status_id)
+                column['count'] += req.column_total
+            column['requests'].append(req)
+
+        board = {}
+        for status_key, column in columns.items():
+            column_requests = sorted(
+                column['requests'],
+                key=lambda r: (r.created_at, r.id_request),
+                reverse=True,
+            )[:limit]
+            board[status_key] = {
+                'count': column['count'],
+                'requests': [serialize_request(req, request) for req in column_requests],
+            }
+
+        return JsonResponse({
+            'success': True,
+            'limit': limit,
+            'columns': board,
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_archive_requests(request):
@@ -662,22 +897,18 @@ def get_archive_requests(request):
     Поддерживает фильтры по региону, городу и офису (ID офиса).
     """
     try:
-        from back.models import Request  # локальный импорт, чтобы избежать циклов
-
         region = request.GET.get('region')
         city = request.GET.get('city')
         office_id = request.GET.get('office')
 
         # Фильтруем только выполненные заявки
-        completed_status_names = [
-            name for name, key in STATUS_MAPPING.items() if key == 'completed'
-        ]
+        completed_status_ids = get_workflow().ids_for_keys(('completed',))
 
-        qs = Request.objects.filter(
-            status__name__in=completed_status_names
+        qs = with_comment_summary(Request.objects.filter(
+            status_id__in=completed_status_ids
         ).select_related(
-            'failure_type', 'status', 'office_address', 'performer', 'expense', 'user'
-        ).prefetch_related('comments').order_by('-created_at')
+            'failure_type', 'status', 'office_address', 'performer', 'user'
+        ).prefetch_related('request_attachments', 'expense_lines')).order_by('-created_at')
 
         # Применяем фильтры по офису
         if region:
@@ -687,83 +918,162 @@ def get_archive_requests(request):
         if office_id:
             qs = qs.filter(office_address__id_office=office_id)
 
-        requests_list = []
-        for req in qs:
-            priority = PRIORITY_REVERSE_MAPPING.get(req.urgency, 'medium')
-            issue_type = ISSUE_TYPE_REVERSE_MAPPING.get(req.failure_type.name, 'other')
-            status_key = STATUS_MAPPING.get(req.status.name, 'new')
-
-            location_parts = []
-            if req.office_location:
-                location_parts.append(req.office_location)
-            if req.employee_location:
-                location_parts.append(req.employee_location)
-            location = ', '.join(location_parts) if location_parts else 'Не указано'
-
-            # Вложения (как в get_requests)
-            from back.models import RequestAttachment
-            attachments = []
-            request_attachments = RequestAttachment.objects.filter(request=req)
-            for attachment in request_attachments:
-                if attachment.file:
-                    attachment_url = request.build_absolute_uri(attachment.file.url)
-                    attachments.append(attachment_url)
-            if not attachments and req.attachments:
-                attachment_url = request.build_absolute_uri(req.attachments.url)
-                attachments.append(attachment_url)
-
-            performer_data = None
-            if req.performer:
-                performer_data = {
-                    'id': req.performer.id_user,
-                    'first_name': req.performer.first_name or '',
-                    'last_name': req.performer.last_name or '',
-                    'middle_name': req.performer.middle_name or '',
-                    'username': req.performer.username or '',
-                }
+        requests_list = [serialize_request(req, request, include_office=True) for req in qs]
 
-            expense_data = None
-            if req.expense:
-                expense_data = {
-                    'id': req.expense.id_table,
-                    'name': req.expense.expense_name or '',
-                    'amount': float(req.expense.amount) if req.expense.amount else 0,
-                }
+        return JsonResponse({
+            'success': True,
+            'requests': requests_list,
+        })
 
-            comments_list = []
-            for comment in req.comments.all():
-                comments_list.append({
-                    'id': comment.id_comment,
-                    'content': comment.content or '',
-                    'createdAt': comment.created_at.isoformat() if comment.created_at else '',
-                })
-
-            office = req.office_address
-
-            requests_list.append({
-                'id': str(req.id_request),
-                'priority': priority,
-                'location': location,
-                'address': office.address if office else '',
-                'region': office.region if office else '',
-                'city': office.city if office else '',
-                'officeId': office.id_office if office else None,
-                'officeName': office.name if office else '',
-                'employeeLocation': req.employee_location or '',
-                'locationDescription': req.office_location or '',
-                'problemDescription': req.description or '',
-                'issueType': issue_type,
-                'status': status_key,
-                'createdAt': req.created_at.isoformat(),
-                'attachments': attachments,
-                'performer': performer_data,
-                'expense': expense_data,
-                'comments': comments_list,
-            })
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+# Размер страницы результатов поиска по умолчанию и максимальный
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def search_requests(request):
+    """
+    API endpoint полнотекстового поиска по описанию заявок и комментариям.
+    Параметры: user_id, q — текст запроса; фильтры office (ID офиса),
+    status (ключи статусов через запятую), date_from / date_to (YYYY-MM-DD, включительно);
+    limit / offset — страница результатов.
+    Сотрудники АХО ищут по всем заявкам, остальные — по своим заявкам
+    и заявкам, где они исполнители. Результаты упорядочены по релевантности.
+    """
+    try:
+        try:
+            user = User.objects.get(id_user=int(request.GET.get('user_id', '')))
+        except (ValueError, User.DoesNotExist):
+            return JsonResponse(
+                {'error': 'Пользователь не найден'},
+                status=404
+            )
+
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return JsonResponse(
+                {'error': 'Введите текст для поиска'},
+                status=400
+            )
+
+        filters = search.SearchFilters()
+        role = (user.role or '').lower()
+        if 'ахо' not in role and 'aho' not in role:
+            filters.participant_id = user.id_user
+
+        try:
+            limit = min(max(int(request.GET.get('limit', SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+            offset = max(int(request.GET.get('offset', 0)), 0)
+            if request.GET.get('office'):
+                filters.office_id = int(request.GET['office'])
+            if request.GET.get('date_from'):
+                filters.date_from = timezone.make_aware(
+                    datetime.strptime(request.GET['date_from'], '%Y-%m-%d')
+                )
+            if request.GET.get('date_to'):
+                filters.date_to = timezone.make_aware(
+                    datetime.strptime(request.GET['date_to'], '%Y-%m-%d')
+                ) + timedelta(days=1)
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Неверный формат параметров поиска'},
+                status=400
+            )
+
+        if request.GET.get('status'):
+            status_keys = [key.strip() for key in request.GET['status'].split(',') if key.strip()]
+            filters.status_ids = get_workflow().ids_for_keys(status_keys)
+
+        found, total = search.search_requests(query, filters, limit=limit, offset=offset)
+
+        # Заявки страницы загружаем одним запросом и возвращаем в порядке релевантности
+        requests_by_id = with_comment_summary(Request.objects.select_related(
+            'failure_type', 'status', 'office_address', 'performer'
+        ).prefetch_related('request_attachments', 'expense_lines')).in_bulk([request_id for request_id, _ in found])
+
+        results = []
+        for request_id, rank in found:
+            req = requests_by_id.get(request_id)
+            if req is None:
+                continue
+            data = serialize_request(req, request, include_office=True)
+            data['rank'] = round(rank, 4)
+            results.append(data)
 
         return JsonResponse({
             'success': True,
-            'requests': requests_list,
+            'total': total,
+            'requests': results,
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+# Размер страницы комментариев заявки по умолчанию и максимальный
+COMMENTS_DEFAULT_LIMIT = 20
+COMMENTS_MAX_LIMIT = 100
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_request_comments(request, request_id):
+    """
+    API endpoint для постраничного получения комментариев заявки, новые — первыми.
+    Параметры: limit — размер страницы; before — ID комментария, после которого
+    продолжить (значение nextCursor из предыдущего ответа).
+    """
+    try:
+        if not Request.objects.filter(id_request=request_id).exists():
+            return JsonResponse(
+                {'error': 'Заявка не найдена'},
+                status=404
+            )
+
+        try:
+            limit = min(max(int(request.GET.get('limit', COMMENTS_DEFAULT_LIMIT)), 1), COMMENTS_MAX_LIMIT)
+            before = int(request.GET['before']) if request.GET.get('before') else None
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Неверный формат параметров'},
+                status=400
+            )
+
+        comments = Comment.objects.filter(request_id=request_id)
+        total = comments.count()
+        if before is not None:
+            cursor = comments.filter(id_comment=before).values('created_at', 'id_comment').first()
+            if cursor is None:
+                return JsonResponse(
+                    {'error': 'Комментарий не найден'},
+                    status=400
+                )
+            # Продолжаем по индексу (request, created_at) с места, где закончилась страница
+            comments = comments.filter(
+                Q(created_at__lt=cursor['created_at'])
+                | Q(created_at=cursor['created_at'], id_comment__lt=cursor['id_comment'])
+            )
+
+        page = list(comments.order_by('-created_at', '-id_comment')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        return JsonResponse({
+            'success': True,
+            'total': total,
+            'comments': [serialize_comment(comment) for comment in page],
+            'nextCursor': page[-1].id_comment if has_more else None,
         })
 
     except Exception as e:
@@ -824,6 +1134,7 @@ def get_office_filters(request):
 
 @csrf_exempt
 @require_http_methods(["PATCH", "PUT"])
+@idempotent
 def update_request(request, request_id):
     """API endpoint для обновления данных заявки"""
     try:
@@ -843,15 +1154,6 @@ def update_request(request, request_id):
                 status=400
             )
 
-        # Поиск заявки
-        try:
-            req = Request.objects.get(id_request=request_id)
-        except Request.DoesNotExist:
-            return JsonResponse(
-                {'error': 'Заявка не найдена'},
-                status=404
-            )
-
         # Проверяем, что пользователь является сотрудником АХО
         try:
             user = User.objects.get(id_user=user_id)
@@ -866,81 +1168,106 @@ def update_request(request, request_id):
                 status=404
             )
 
-        # Обновляем поля заявки
-        if 'priority' in json_data:
-            priority_key = json_data.get('priority')
-            urgency = PRIORITY_MAPPING.get(priority_key, req.urgency)
-            req.urgency = urgency
+        expense_lines = None
+        if 'expenses' in json_data:
+            try:
+                expense_lines = parse_expense_lines(json_data.get('expenses') or [])
+            except ExpenseError as e:
+                return JsonResponse(
+                    {'error': str(e)},
+                    status=400
+                )
 
-        if 'issueType' in json_data:
-            issue_type_key = json_data.get('issueType')
-            issue_type_name = ISSUE_TYPE_MAPPING.get(issue_type_key, 'Другое')
-            failure_type, created = TypeOfFailure.objects.get_or_create(
-                name=issue_type_name,
-                defaults={'description': f'Тип поломки: {issue_type_name}'}
-            )
-            req.failure_type = failure_type
+        # Все изменения заявки — одна транзакция. Заявка заблокирована до её конца:
+        # параллельная смена статуса или исполнителя не потеряется и загрузка
+        # не перенесётся дважды
+        with transaction.atomic():
+            try:
+                req = Request.objects.select_for_update(of=('self',)).get(id_request=request_id)
+            except Request.DoesNotExist:
+                return JsonResponse(
+                    {'error': 'Заявка не найдена'},
+                    status=404
+                )
 
-        if 'locationDescription' in json_data:
-            req.office_location = json_data.get('locationDescription', req.office_location)
+            # Исполнитель и вес до изменений — для переноса загрузки
+            old_performer_id = req.performer_id
+            old_weight = req.routing_weight
+            update_fields = ['last_updated']
+
+            # Обновляем поля заявки
+            if 'priority' in json_data:
+                priority_key = json_data.get('priority')
+                req.urgency = PRIORITY_MAPPING.get(priority_key, req.urgency)
+                update_fields.append('urgency')
+
+            if 'issueType' in json_data:
+                issue_type_key = json_data.get('issueType')
+                issue_type_name = ISSUE_TYPE_MAPPING.get(issue_type_key, 'Другое')
+                failure_type, created = TypeOfFailure.objects.get_or_create(
+                    name=issue_type_name,
+                    defaults={'description': f'Тип поломки: {issue_type_name}'}
+                )
+                req.failure_type = failure_type
+                update_fields.append('failure_type')
 
-        if 'employeeLocation' in json_data:
-            req.employee_location = json_data.get('employeeLocation', req.employee_location)
+            if 'locationDescription' in json_data:
+                req.office_location = json_data.get('locationDescription', req.office_location)
+                update_fields.append('office_location')
 
-        if 'problemDescription' in json_data:
-            req.description = json_data.get('problemDescription', req.description)
+            if 'employeeLocation' in json_data:
+                req.employee_location = json_data.get('employeeLocation', req.employee_location)
+                update_fields.append('employee_location')
 
-        if 'performerId' in json_data:
-            performer_id = json_data.get('performerId')
-            if performer_id:
-                try:
-                    performer = User.objects.get(id_user=performer_id)
-                    req.performer = performer
-                except User.DoesNotExist:
-                    pass
-            else:
-                req.performer = None
+            if 'problemDescription' in json_data:
+                req.description = json_data.get('problemDescription', req.description)
+                update_fields.append('description')
 
-        if 'expenses' in json_data:
-            expenses = json_data.get('expenses', [])
-            if expenses and len(expenses) > 0:
-                # Берем первую непустую строку затрат
-                first_expense = None
-                for exp in expenses:
-                    if exp.get('name') or exp.get('amount'):
-                        first_expense = exp
-                        break
-                
-                if first_expense:
-                    expense_name = first_expense.get('name', 'Заявка')
-                    expense_amount = first_expense.get('amount', '0')
+            if 'performerId' in json_data:
+                performer_id = json_data.get('performerId')
+                if performer_id:
                     try:
-                        expense_amount = float(expense_amount) if expense_amount else 0
-                    except (ValueError, TypeError):
-                        expense_amount = 0
-                    
-                    expense, created = Table.objects.get_or_create(
-                        expense_name=expense_name,
-                        defaults={'amount': expense_amount}
-                    )
-                    if not created:
-                        expense.amount = expense_amount
-                        expense.save()
-                    req.expense = expense
-
-        if 'comment' in json_data:
-            comment_text = json_data.get('comment', '').strip()
-            # Сохраняем комментарий только если он не пустой и отличается от последнего комментария
-            if comment_text:
-                # Получаем последний комментарий к заявке
-                last_comment = req.comments.order_by('-created_at').first()
-                
-                # Создаем новый комментарий только если текст отличается от последнего
-                if not last_comment or last_comment.content.strip() != comment_text:
-                    comment = Comment.objects.create(content=comment_text)
-                    req.comments.add(comment)
-
-        req.save()
+                        req.performer = User.objects.get(id_user=performer_id)
+                        update_fields.append('performer')
+                    except User.DoesNotExist:
+                        pass
+                else:
+                    req.performer = None
+                    update_fields.append('performer')
+
+            if 'priority' in json_data or 'issueType' in json_data:
+                # Срочность или тип поломки изменились — пересчитываем вес и срок
+                req.routing_weight = request_weight(req.urgency, req.failure_type_id)
+                update_fields.append('routing_weight')
+                due_time = due_time_for(req.created_at, req.urgency, req.failure_type.name)
+                if due_time != req.due_time:
+                    req.due_time = due_time
+                    req.escalated_at = None
+                    update_fields += ['due_time', 'escalated_at']
+
+            req.save(update_fields=update_fields)
+
+            # Открытая заявка занимает исполнителя: переносим её загрузку
+            workflow = get_workflow()
+            if not workflow.statuses[workflow.key_for_id(req.status_id)].releases_load:
+                move_request_load(req, old_performer_id, old_weight)
+
+            if expense_lines is not None:
+                # Строки затрат заявки заменяются целиком, свёртка по офису обновляется сразу
+                set_request_expenses(req, expense_lines)
+
+            if 'comment' in json_data:
+                comment_text = json_data.get('comment', '').strip()
+                # Сохраняем комментарий только если он не пустой и отличается от последнего комментария
+                if comment_text:
+                    last_content = Comment.objects.filter(request=req).order_by(
+                        '-created_at', '-id_comment'
+                    ).values_list('content', flat=True).first()
+                    if last_content is None or last_content.strip() != comment_text:
+                        Comment.objects.create(request=req, content=comment_text)
+
+            if 'problemDescription' in json_data or 'issueType' in json_data:
+                dedup.reindex_request(req)
 
         return JsonResponse({
             'success': True,
@@ -999,6 +1326,7 @@ def get_notifications(request, user_id):
 
 @csrf_exempt
 @require_http_methods(["PATCH"])
+@idempotent
 def mark_notification_read(request, notification_id):
     """API endpoint для пометки уведомления как прочитанного"""
     try:
@@ -1050,18 +1378,9 @@ def mark_notification_read(request, notification_id):
         )
 
 
-# Обратный маппинг статусов (из фронтенда на БД)
-STATUS_REVERSE_MAPPING = {
-    'new': 'Новая',
-    'revision': 'На доработке',
-    'in_progress': 'В работе',
-    'completed': 'Выполнена',
-    'awaiting_purchase': 'Ожидают закупки',
-}
-
-
 @csrf_exempt
 @require_http_methods(["PATCH", "PUT"])
+@idempotent
 def update_request_status(request, request_id):
     """API endpoint для обновления статуса заявки"""
     try:
@@ -1098,75 +1417,767 @@ def update_request_status(request, request_id):
                 status=403
             )
 
-        # Поиск заявки
+        workflow = get_workflow()
+        # Заявку читаем под блокировкой внутри транзакции: параллельная смена статуса
+        # (одиночная или пакетная) дождётся её конца, поэтому загрузка не изменится
+        # дважды, а в журнал попадёт фактический предыдущий статус
+        with transaction.atomic():
+            try:
+                req = Request.objects.select_for_update(of=('self',)).get(id_request=request_id)
+            except Request.DoesNotExist:
+                return JsonResponse(
+                    {'error': 'Заявка не найдена'},
+                    status=404
+                )
+
+            # Проверяем переход по графу статусов (без обращений к БД)
+            old_status_id = req.status_id
+            try:
+                transition = workflow.transition(workflow.key_for_id(old_status_id), new_status_key)
+            except InvalidTransition as e:
+                return JsonResponse(
+                    {'error': str(e)},
+                    status=400
+                )
+            new_status = workflow.status(new_status_key)
+            new_status_name = new_status.name
+
+            if old_status_id != new_status.id_status:
+                # Обновляем статус заявки; время выполнения нужно для метрик SLA
+                req.status = new_status
+                if transition.load_delta > 0:
+                    # Заявка вернулась в работу: просрочка снова подлежит эскалации
+                    req.escalated_at = None
+                req.completed_at = timezone.now() if new_status_key == 'completed' else None
+                req.save(update_fields=['status', 'completed_at', 'escalated_at', 'last_updated'])
+
+                # Заявка, ушедшая из работы (или вернувшаяся в работу), меняет загрузку исполнителя
+                if transition.load_delta and req.performer_id:
+                    apply_load_deltas(
+                        {req.performer_id: transition.load_delta},
+                        {req.performer_id: transition.load_delta * req.routing_weight},
+                    )
+
+                dashboard.history_entry(
+                    req.id_request,
+                    dashboard.request_snapshot(req),
+                    dashboard.last_snapshots([req.id_request]).get(req.id_request),
+                    from_status_id=old_status_id,
+                    to_status=new_status,
+                    changed_by=user,
+                ).save()
+
+                # Уведомление владельцу заявки — через очередь (доставит воркер)
+                notify(req.user_id, req.id_request, transition.message(req.id_request))
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Статус заявки успешно обновлен',
+            'request': {
+                'id': req.id_request,
+                'status': new_status_key,
+                'statusName': new_status_name
+            }
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+# Максимальное число заявок в одном пакетном изменении статуса
+BULK_STATUS_MAX_REQUESTS = 1000
+
+
+@csrf_exempt
+@require_http_methods(["PATCH", "PUT"])
+@idempotent
+def bulk_update_request_status(request):
+    """
+    API endpoint для пакетного изменения статуса заявок (перенос нескольких карточек).
+    Всё выполняется в одной транзакции за фиксированное число запросов:
+    одна выборка заявок, один UPDATE статусов, один UPDATE загрузки
+    всех затронутых исполнителей и один bulk_create уведомлений.
+    """
+    try:
+        try:
+            json_data = json.loads(request.body)
+            user_id = json_data.get('user_id')
+            new_status_key = json_data.get('status')
+            request_ids = json_data.get('request_ids')
+        except json.JSONDecodeError:
+            return JsonResponse(
+                {'error': 'Неверный формат данных'},
+                status=400
+            )
+
+        if not user_id or not new_status_key or not request_ids:
+            return JsonResponse(
+                {'error': 'ID пользователя, новый статус и список заявок обязательны'},
+                status=400
+            )
+
+        try:
+            request_ids = {int(request_id) for request_id in request_ids}
+        except (ValueError, TypeError):
+            return JsonResponse(
+                {'error': 'Неверный формат списка заявок'},
+                status=400
+            )
+
+        if len(request_ids) > BULK_STATUS_MAX_REQUESTS:
+            return JsonResponse(
+                {'error': f'Можно изменить не более {BULK_STATUS_MAX_REQUESTS} заявок за раз'},
+                status=400
+            )
+
+        # Поиск пользователя
+        try:
+            user = User.objects.get(id_user=user_id)
+        except User.DoesNotExist:
+            return JsonResponse(
+                {'error': 'Пользователь не найден'},
+                status=404
+            )
+
+        # Проверяем, что пользователь является сотрудником АХО
+        if not user.role or ('ахо' not in user.role.lower() and 'aho' not in user.role.lower()):
+            return JsonResponse(
+                {'error': 'Только сотрудники АХО могут изменять статус заявок'},
+                status=403
+            )
+
+        workflow = get_workflow()
         try:
-            req = Request.objects.get(id_request=request_id)
-        except Request.DoesNotExist:
+            new_status = workflow.status(new_status_key)
+        except InvalidTransition as e:
             return JsonResponse(
-                {'error': 'Заявка не найдена'},
+                {'error': str(e)},
+                status=400
+            )
+        new_status_name = new_status.name
+
+        with transaction.atomic():
+            # Блокируем заявки до конца транзакции, чтобы параллельный перенос не потерял изменения
+            rows = list(
+                Request.objects.select_for_update(of=('self',))
+                .filter(id_request__in=request_ids)
+                .values_list(
+                    'id_request', 'user_id', 'performer_id', 'status_id', 'routing_weight',
+                    'office_address_id', 'failure_type_id', 'urgency',
+                )
+            )
+            found_ids = {row[0] for row in rows}
+            weights = {row[0]: row[4] for row in rows}
+            snapshots = {row[0]: row[5:] for row in rows}
+
+            # Недопустимые переходы отбрасываем по графу статусов, не обращаясь к БД
+            changed = []
+            rejected_ids = []
+            for request_id, owner_id, performer_id, old_status_id, *_ in rows:
+                if old_status_id == new_status.id_status:
+                    continue
+                try:
+                    transition = workflow.transition(workflow.key_for_id(old_status_id), new_status_key)
+                except InvalidTransition:
+                    rejected_ids.append(request_id)
+                    continue
+                changed.append((request_id, owner_id, performer_id, old_status_id, transition))
+            changed_ids = [row[0] for row in changed]
+
+            if changed_ids:
+                now = timezone.now()
+                Request.objects.filter(id_request__in=changed_ids).update(
+                    status=new_status,
+                    completed_at=now if new_status_key == 'completed' else None,
+                    # Вернувшиеся в работу заявки снова подлежат эскалации
+                    escalated_at=Case(
+                        When(id_request__in=[row[0] for row in changed if row[4].load_delta > 0], then=Value(None)),
+                        default=F('escalated_at'),
+                    ),
+                    last_updated=now,
+                )
+                # Срезы, под которыми заявки учтены в старом статусе, — одним запросом
+                previous = dashboard.last_snapshots(changed_ids)
+                RequestStatusHistory.objects.bulk_create([
+                    dashboard.history_entry(
+                        request_id,
+                        snapshots[request_id],
+                        previous.get(request_id),
+                        from_status_id=old_status_id,
+                        to_status=new_status,
+                        changed_by=user,
+                        changed_at=now,
+                    )
+                    for request_id, _, _, old_status_id, _ in changed
+                ])
+
+                # Переходы меняют загрузку исполнителей: суммируем изменения
+                # по исполнителям и обновляем всех одним UPDATE
+                load_deltas = Counter()
+                weight_deltas = Counter()
+                for request_id, _, performer_id, _, transition in changed:
+                    if performer_id and transition.load_delta:
+                        load_deltas[performer_id] += transition.load_delta
+                        weight_deltas[performer_id] += transition.load_delta * weights[request_id]
+                apply_load_deltas(load_deltas, weight_deltas)
+
+                notify_many([
+                    (owner_id, request_id, transition.message(request_id))
+                    for request_id, owner_id, _, _, transition in changed
+                ])
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Статусы заявок успешно обновлены',
+            'status': new_status_key,
+            'statusName': new_status_name,
+            'updated': sorted(changed_ids),
+            'unchanged': sorted(found_ids - set(changed_ids) - set(rejected_ids)),
+            'rejected': sorted(rejected_ids),
+            'notFound': sorted(request_ids - found_ids),
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+def serialize_upload(upload):
+    return {
+        'uploadId': upload.id_upload,
+        'fileName': upload.original_name,
+        'size': upload.size,
+        'offset': upload.received,
+        'state': upload.state,
+    }
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+def create_upload(request):
+    """
+    API endpoint для начала загрузки файла частями.
+    Тело: {"user_id": ..., "fileName": ..., "size": <байт>}.
+    Дальше части отправляются PUT-запросами на api/uploads/<uploadId>/?offset=N&user_id=...,
+    после последней — POST на api/uploads/<uploadId>/complete/ с тем же user_id.
+    """
+    try:
+        try:
+            json_data = json.loads(request.body)
+            user_id = int(json_data.get('user_id'))
+            size = int(json_data.get('size'))
+            file_name = str(json_data.get('fileName') or '').strip()
+        except (json.JSONDecodeError, TypeError, ValueError):
+            return JsonResponse(
+                {'error': 'Неверный формат данных'},
+                status=400
+            )
+
+        if not file_name:
+            return JsonResponse(
+                {'error': 'Имя файла обязательно'},
+                status=400
+            )
+
+        try:
+            user = User.objects.get(id_user=user_id)
+        except User.DoesNotExist:
+            return JsonResponse(
+                {'error': 'Пользователь не найден'},
+                status=404
+            )
+
+        try:
+            upload = create_chunked_upload(user, file_name, size)
+        except UploadError as e:
+            return JsonResponse(
+                {'error': str(e)},
+                status=400
+            )
+
+        data = serialize_upload(upload)
+        data['chunkSize'] = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+        return JsonResponse({'success': True, 'upload': data}, status=201)
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+@csrf_exempt
+@require_http_methods(["GET", "PUT"])
+def upload_chunk(request, upload_id):
+    """
+    API endpoint загрузки части файла (только для автора загрузки, ?user_id=...).
+    GET возвращает, сколько байт уже получено (с этого места продолжают после обрыва).
+    PUT ?offset=N дописывает тело запроса (сырые байты) начиная со смещения N.
+    """
+    try:
+        try:
+            user_id = int(request.GET.get('user_id', ''))
+        except ValueError:
+            return JsonResponse(
+                {'error': 'ID пользователя обязателен'},
+                status=400
+            )
+
+        try:
+            upload = ChunkedUpload.objects.get(id_upload=upload_id)
+        except ChunkedUpload.DoesNotExist:
+            return JsonResponse(
+                {'error': 'Загрузка не найдена'},
+                status=404
+            )
+
+        if upload.user_id != user_id:
+            return JsonResponse(
+                {'error': 'Нет доступа к этой загрузке'},
+                status=403
+            )
+
+        if request.method == 'GET':
+            return JsonResponse({'success': True, 'upload': serialize_upload(upload)})
+
+        try:
+            offset = int(request.GET.get('offset', ''))
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Не указано смещение части (offset)'},
+                status=400
+            )
+
+        try:
+            # Тело читается потоком, без буферизации всей части в памяти
+            upload = append_chunk(upload, offset, request)
+        except OffsetMismatch as e:
+            return JsonResponse(
+                {'error': str(e), 'offset': e.expected},
+                status=409
+            )
+        except UploadError as e:
+            return JsonResponse(
+                {'error': str(e)},
+                status=409
+            )
+
+        return JsonResponse({'success': True, 'upload': serialize_upload(upload)})
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+def complete_upload(request, upload_id):
+    """
+    API endpoint завершения загрузки частями. Тело: {"user_id": ..., "sha256": ...},
+    sha256 необязателен и служит для проверки целостности. Завершённая загрузка
+    прикрепляется к заявке при создании: upload_ids в create_request.
+    """
+    try:
+        try:
+            json_data = json.loads(request.body) if request.body else {}
+            user_id = int(json_data.get('user_id'))
+        except (json.JSONDecodeError, TypeError, ValueError):
+            return JsonResponse(
+                {'error': 'Неверный формат данных'},
+                status=400
+            )
+
+        try:
+            upload = ChunkedUpload.objects.get(id_upload=upload_id)
+        except ChunkedUpload.DoesNotExist:
+            return JsonResponse(
+                {'error': 'Загрузка не найдена'},
                 status=404
             )
 
-        # Получаем старый статус для сравнения
-        old_status = req.status.name
+        if upload.user_id != user_id:
+            return JsonResponse(
+                {'error': 'Нет доступа к этой загрузке'},
+                status=403
+            )
 
-        # Маппинг статуса из фронтенда на БД
-        new_status_name = STATUS_REVERSE_MAPPING.get(new_status_key)
-        if not new_status_name:
+        try:
+            upload = complete_chunked_upload(upload, json_data.get('sha256'))
+        except OffsetMismatch as e:
+            return JsonResponse(
+                {'error': 'Файл загружен не полностью', 'offset': e.expected},
+                status=409
+            )
+        except UploadError as e:
             return JsonResponse(
-                {'error': 'Неверный статус'},
+                {'error': str(e)},
                 status=400
             )
 
-        # Получаем или создаем новый статус
-        new_status, created = Status.objects.get_or_create(
-            name=new_status_name,
-            defaults={}
+        return JsonResponse({'success': True, 'upload': serialize_upload(upload)})
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
         )
 
-        # Обновляем статус заявки
-        req.status = new_status
-        req.save()
 
-        # Если заявка завершена или отправлена в архивный статус,
-        # уменьшаем загрузку исполнителя
-        if new_status_key in ('completed', 'awaiting_purchase') and req.performer:
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_time_in_status_metrics(request):
+    """
+    API endpoint метрик времени пребывания заявок в статусах.
+    Параметры: group_by=office|performer, since=YYYY-MM-DD (опционально).
+    Возвращает p50/p90/p99 в часах для каждой пары (группа, статус).
+    """
+    try:
+        group_by = request.GET.get('group_by', 'office')
+        if group_by not in ('office', 'performer'):
+            return JsonResponse(
+                {'error': 'group_by должен быть office или performer'},
+                status=400
+            )
+
+        since = None
+        since_param = request.GET.get('since')
+        if since_param:
             try:
-                load_obj = Load.objects.get(staff=req.performer)
-                if load_obj.current_tasks_count:
-                    load_obj.current_tasks_count = max(0, load_obj.current_tasks_count - 1)
-                    load_obj.save(update_fields=['current_tasks_count'])
-            except Load.DoesNotExist:
-                pass
-
-        # Создаем уведомление, если статус изменился
-        if old_status != new_status_name:
-            # Формируем текст уведомления
-            status_messages = {
-                'Выполнена': f'Ваша заявка #{req.id_request} выполнена!',
-                'На доработке': f'Ваша заявка #{req.id_request} отправлена на доработку.',
-                'В работе': f'Ваша заявка #{req.id_request} взята в работу.',
-                'Новая': f'Ваша заявка #{req.id_request} создана.',
-                'Ожидают закупки': f'Ваша заявка #{req.id_request} ожидает закупки.',
+                since = timezone.make_aware(datetime.strptime(since_param, '%Y-%m-%d'))
+            except ValueError:
+                return JsonResponse(
+                    {'error': 'Неверный формат даты, ожидается YYYY-MM-DD'},
+                    status=400
+                )
+
+        metrics = analytics.time_in_status(group_by=group_by, since=since)
+
+        # Подписи групп и статусов одним запросом на каждый справочник
+        group_ids = {item['groupId'] for item in metrics if item['groupId'] is not None}
+        if group_by == 'office':
+            group_names = dict(
+                Office.objects.filter(id_office__in=group_ids).values_list('id_office', 'name')
+            )
+        else:
+            group_names = {
+                id_user: f"{last_name} {first_name}".strip()
+                for id_user, last_name, first_name in User.objects.filter(
+                    id_user__in=group_ids
+                ).values_list('id_user', 'last_name', 'first_name')
             }
-            
-            message = status_messages.get(new_status_name, f'Статус заявки #{req.id_request} изменен на "{new_status_name}"')
-            
-            # Создаем уведомление для владельца заявки
-            Notification.objects.create(
-                user=req.user,
-                request=req,
-                message=message
+        workflow = get_workflow()
+
+        for item in metrics:
+            status_key = workflow.key_for_id(item['statusId'], default='')
+            item['groupName'] = group_names.get(item['groupId'], '')
+            item['status'] = status_key
+            item['statusName'] = workflow.name_for_key(status_key) or ''
+
+        return JsonResponse({
+            'success': True,
+            'groupBy': group_by,
+            'unit': 'hours',
+            'metrics': metrics,
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+def sla_group_names(group_by, group_ids):
+    """Подписи групп отчёта SLA: {id группы: название}"""
+    if group_by == 'office':
+        return dict(Office.objects.filter(id_office__in=group_ids).values_list('id_office', 'name'))
+    if group_by == 'performer':
+        return {
+            id_user: f"{last_name} {first_name}".strip()
+            for id_user, last_name, first_name in User.objects.filter(
+                id_user__in=group_ids
+            ).values_list('id_user', 'last_name', 'first_name')
+        }
+    return {urgency: urgency for urgency in group_ids}
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_sla_metrics(request):
+    """
+    API endpoint метрик SLA: доля заявок, выполненных в срок, перцентили
+    времени решения и возраста открытых заявок (в часах).
+    Параметры: group_by=office|performer|urgency, since / until=YYYY-MM-DD
+    (период создания заявок, опционально).
+    """
+    try:
+        group_by = request.GET.get('group_by', 'office')
+        if group_by not in ('office', 'performer', 'urgency'):
+            return JsonResponse(
+                {'error': 'group_by должен быть office, performer или urgency'},
+                status=400
+            )
+
+        try:
+            since = until = None
+            if request.GET.get('since'):
+                since = timezone.make_aware(datetime.strptime(request.GET['since'], '%Y-%m-%d'))
+            if request.GET.get('until'):
+                until = timezone.make_aware(datetime.strptime(request.GET['until'], '%Y-%m-%d')) + timedelta(days=1)
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Неверный формат даты, ожидается YYYY-MM-DD'},
+                status=400
             )
 
+        metrics = analytics.sla_report(group_by=group_by, since=since, until=until)
+
+        group_names = sla_group_names(
+            group_by, {item['groupId'] for item in metrics if item['groupId'] is not None}
+        )
+        for item in metrics:
+            item['groupName'] = group_names.get(item['groupId'], '')
+            if group_by == 'urgency':
+                item['groupId'] = PRIORITY_REVERSE_MAPPING.get(item['groupId'], item['groupId'])
+
         return JsonResponse({
             'success': True,
-            'message': 'Статус заявки успешно обновлен',
-            'request': {
-                'id': req.id_request,
-                'status': new_status_key,
-                'statusName': new_status_name
-            }
+            'groupBy': group_by,
+            'unit': 'hours',
+            'metrics': metrics,
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_cost_report(request):
+    """
+    API endpoint отчёта по затратам: суммы по офисам и месяцам из свёртки ExpenseRollup.
+    Параметры (все опциональны): office (ID офиса), region, city,
+    from / to — месяцы периода включительно (YYYY-MM).
+    """
+    try:
+        try:
+            month_from = month_to = None
+            if request.GET.get('from'):
+                month_from = datetime.strptime(request.GET['from'], '%Y-%m').date()
+            if request.GET.get('to'):
+                month_to = datetime.strptime(request.GET['to'], '%Y-%m').date()
+            office_ids = None
+            if request.GET.get('office'):
+                office_ids = [int(request.GET['office'])]
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Неверный формат параметров, месяц ожидается как YYYY-MM'},
+                status=400
+            )
+
+        region = request.GET.get('region')
+        city = request.GET.get('city')
+        if region or city:
+            offices = Office.objects.all()
+            if region:
+                offices = offices.filter(region=region)
+            if city:
+                offices = offices.filter(city=city)
+            if office_ids is not None:
+                offices = offices.filter(id_office__in=office_ids)
+            office_ids = list(offices.values_list('id_office', flat=True))
+
+        rows = []
+        total = Decimal(0)
+        for rollup in cost_report(office_ids, month_from, month_to):
+            total += rollup.total
+            rows.append({
+                'officeId': rollup.office_id,
+                'officeName': rollup.office.name,
+                'month': rollup.month.strftime('%Y-%m'),
+                'total': float(rollup.total),
+                'linesCount': rollup.lines_count,
+            })
+
+        return JsonResponse({
+            'success': True,
+            'rows': rows,
+            'total': float(total),
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+# Период дашборда по умолчанию и максимальный период почасового графика, дней
+DASHBOARD_DEFAULT_DAYS = 30
+DASHBOARD_MAX_HOURLY_DAYS = 31
+
+
+def dashboard_params(request):
+    """
+    Период [since, until) и фильтры дашборда из GET-параметров:
+    from / to (YYYY-MM-DD, включительно), office, region, issueType, priority.
+    Бросает ValueError при неверном формате.
+    """
+    if request.GET.get('to'):
+        until = timezone.make_aware(datetime.strptime(request.GET['to'], '%Y-%m-%d')) + timedelta(days=1)
+    else:
+        until = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time())) + timedelta(days=1)
+    if request.GET.get('from'):
+        since = timezone.make_aware(datetime.strptime(request.GET['from'], '%Y-%m-%d'))
+    else:
+        since = until - timedelta(days=DASHBOARD_DEFAULT_DAYS)
+    if since >= until:
+        raise ValueError('from позже to')
+
+    scope = {}
+    if request.GET.get('office'):
+        scope['office_id'] = int(request.GET['office'])
+    if request.GET.get('region'):
+        scope['region'] = request.GET['region']
+    if request.GET.get('issueType'):
+        scope['failure_type'] = ISSUE_TYPE_MAPPING[request.GET['issueType']]
+    if request.GET.get('priority'):
+        scope['urgency'] = PRIORITY_MAPPING[request.GET['priority']]
+    return since, until, scope
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_dashboard_throughput(request):
+    """
+    API endpoint графика потока заявок: сколько создано и выполнено за каждый час или день.
+    Параметры: period=day|hour и фильтры dashboard_params.
+    Данные берутся из сводки, которую обновляет команда refresh_dashboard.
+    """
+    try:
+        period = request.GET.get('period', 'day')
+        if period not in ('day', 'hour'):
+            return JsonResponse(
+                {'error': 'period должен быть day или hour'},
+                status=400
+            )
+        try:
+            since, until, scope = dashboard_params(request)
+        except (ValueError, KeyError):
+            return JsonResponse(
+                {'error': 'Неверный формат параметров дашборда'},
+                status=400
+            )
+        if period == 'hour' and until - since > timedelta(days=DASHBOARD_MAX_HOURLY_DAYS):
+            return JsonResponse(
+                {'error': f'Почасовой график строится не больше чем за {DASHBOARD_MAX_HOURLY_DAYS} дней'},
+                status=400
+            )
+
+        series = [
+            {'bucket': bucket.isoformat(), 'created': created, 'closed': closed}
+            for bucket, created, closed in dashboard.throughput(period, since, until, **scope)
+        ]
+
+        return JsonResponse({
+            'success': True,
+            'period': period,
+            'series': series,
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_dashboard_backlog(request):
+    """
+    API endpoint текущей очереди: число заявок в каждом статусе.
+    Параметры: фильтры office, region, issueType, priority.
+    """
+    try:
+        try:
+            _, _, scope = dashboard_params(request)
+        except (ValueError, KeyError):
+            return JsonResponse(
+                {'error': 'Неверный формат параметров дашборда'},
+                status=400
+            )
+
+        workflow = get_workflow()
+        closed_ids = set(workflow.ids_for_keys(('completed',)))
+        statuses = {}
+        open_total = 0
+        for status_id, total in dashboard.backlog(**scope).items():
+            status_key = workflow.key_for_id(status_id, default='')
+            statuses[status_key] = statuses.get(status_key, 0) + total
+            if status_id not in closed_ids:
+                open_total += total
+
+        return JsonResponse({
+            'success': True,
+            'statuses': statuses,
+            'open': open_total,
+        })
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Ошибка сервера: {str(e)}'},
+            status=500
+        )
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_dashboard_offices(request):
+    """
+    API endpoint сводки по офисам за период: создано, выполнено, открыто сейчас и затраты.
+    Параметры: from / to (YYYY-MM-DD), region.
+    """
+    try:
+        try:
+            since, until, scope = dashboard_params(request)
+        except (ValueError, KeyError):
+            return JsonResponse(
+                {'error': 'Неверный формат параметров дашборда'},
+                status=400
+            )
+
+        summary = dashboard.office_summary(since, until, region=scope.get('region'))
+        offices = Office.objects.filter(id_office__in=summary.keys()).order_by('name')
+        rows = []
+        for office in offices:
+            item = summary[office.id_office]
+            rows.append({
+                'officeId': office.id_office,
+                'officeName': office.name,
+                'region': office.region or '',
+                'city': office.city or '',
+                'created': item['created'],
+                'closed': item['closed'],
+                'open': item['open'],
+                'cost': float(item['cost']),
+            })
+
+        return JsonResponse({
+            'success': True,
+            'offices': rows,
         })
 
     except Exception as e:
@@ -1174,3 +2185,18 @@ def update_request_status(request, request_id):
             {'error': f'Ошибка сервера: {str(e)}'},
             status=500
         )
+
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """
+    Отдаёт медиафайл по подписанной ссылке. Ссылки выдают только endpoints,
+    которые уже проверили доступ пользователя к заявке или профилю.
+    """
+    if not check_media_signature(path, request.GET.get('token')):
+        return JsonResponse({'error': 'Ссылка недействительна или устарела'}, status=403)
+    try:
+        return serve_file(request, path)
+    except Http404:
+        return JsonResponse({'error': 'Файл не найден'}, status=404)
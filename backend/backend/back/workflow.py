@@ -0,0 +1,178 @@
+"""
+Движок статусов заявки.
+
+Все статусы, их ключи на фронтенде, разрешённые переходы и побочные эффекты
+переходов (изменение загрузки исполнителя, текст уведомления) описаны здесь
+в таблицах и компилируются в граф. Граф строится один раз на процесс
+(один запрос к таблице Status) и сбрасывается при изменении статусов в БД.
+Проверка перехода выполняется по графу в памяти, без обращений к БД.
+"""
+from dataclasses import dataclass, field
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Status
+
+
+class InvalidTransition(Exception):
+    """Переход между статусами не разрешён"""
+
+
+@dataclass(frozen=True)
+class StatusDef:
+    key: str  # ключ статуса на фронтенде
+    name: str  # название статуса в БД
+    message: str  # шаблон уведомления владельцу заявки при переходе в статус
+    aliases: tuple = ()  # устаревшие названия этого же статуса в БД
+    releases_load: bool = False  # заявка в этом статусе не занимает исполнителя
+
+
+STATUSES = (
+    StatusDef('new', 'Новая', 'Ваша заявка #{id} создана.'),
+    StatusDef('revision', 'На доработке', 'Ваша заявка #{id} отправлена на доработку.'),
+    StatusDef('in_progress', 'В работе', 'Ваша заявка #{id} взята в работу.'),
+    StatusDef(
+        'completed', 'Выполнена', 'Ваша заявка #{id} выполнена!',
+        aliases=('Выполненные',), releases_load=True,
+    ),
+    StatusDef(
+        'awaiting_purchase', 'Ожидают закупки', 'Ваша заявка #{id} ожидает закупки.',
+        releases_load=True,
+    ),
+)
+
+INITIAL_STATUS_KEY = 'new'
+
+# Разрешённые переходы: из статуса -> в статусы.
+# Канбан АХО позволяет перетащить заявку между любыми своими колонками,
+# а кнопка «Отметить выполненной» доступна в любом статусе, кроме выполненной
+TRANSITIONS = {
+    'new': ('in_progress', 'revision', 'awaiting_purchase', 'completed'),
+    'revision': ('new', 'in_progress', 'completed'),
+    'in_progress': ('new', 'revision', 'awaiting_purchase', 'completed'),
+    'awaiting_purchase': ('new', 'in_progress', 'revision', 'completed'),
+    # Выполненную заявку можно переоткрыть или вернуть в ожидание закупки
+    'completed': ('new', 'in_progress', 'revision', 'awaiting_purchase'),
+}
+
+
+@dataclass(frozen=True)
+class Transition:
+    source: StatusDef
+    target: StatusDef
+    load_delta: int  # на сколько изменить счётчик задач исполнителя
+
+    def message(self, request_id):
+        return self.target.message.format(id=request_id)
+
+
+@dataclass
+class Workflow:
+    """Скомпилированный граф статусов"""
+    statuses: dict = field(default_factory=dict)  # key -> StatusDef
+    status_objects: dict = field(default_factory=dict)  # key -> Status (канонический)
+    keys_by_name: dict = field(default_factory=dict)  # название в БД -> key
+    keys_by_id: dict = field(default_factory=dict)  # id_status -> key
+    transitions: dict = field(default_factory=dict)  # (key, key) -> Transition
+
+    def status(self, key) -> Status:
+        """Объект Status для ключа фронтенда"""
+        try:
+            return self.status_objects[key]
+        except KeyError:
+            raise InvalidTransition(f'Неизвестный статус: {key}') from None
+
+    @property
+    def initial_status(self) -> Status:
+        return self.status_objects[INITIAL_STATUS_KEY]
+
+    def key_for_name(self, name, default='new'):
+        return self.keys_by_name.get(name, default)
+
+    def key_for_id(self, status_id, default='new'):
+        return self.keys_by_id.get(status_id, default)
+
+    def name_for_key(self, key):
+        status_def = self.statuses.get(key)
+        return status_def.name if status_def else None
+
+    def names_for_key(self, key):
+        """Все названия статуса в БД, включая устаревшие"""
+        return [name for name, status_key in self.keys_by_name.items() if status_key == key]
+
+    def ids_for_keys(self, keys):
+        return [status_id for status_id, key in self.keys_by_id.items() if key in keys]
+
+    def transition(self, source_key, target_key) -> Transition:
+        """Возвращает переход или бросает InvalidTransition; к БД не обращается"""
+        if target_key not in self.statuses:
+            raise InvalidTransition(f'Неизвестный статус: {target_key}')
+        try:
+            return self.transitions[(source_key, target_key)]
+        except KeyError:
+            raise InvalidTransition(
+                f'Переход из "{self.name_for_key(source_key)}" '
+                f'в "{self.name_for_key(target_key)}" не разрешён'
+            ) from None
+
+
+def compile_workflow() -> Workflow:
+    """Строит граф статусов; недостающие статусы создаются в БД"""
+    statuses = {status_def.key: status_def for status_def in STATUSES}
+    names = {}
+    for status_def in STATUSES:
+        names[status_def.name] = status_def.key
+        for alias in status_def.aliases:
+            names[alias] = status_def.key
+
+    existing = list(Status.objects.filter(name__in=names.keys()).order_by('id_status'))
+    existing_names = {status.name for status in existing}
+    missing = [
+        Status(name=status_def.name)
+        for status_def in STATUSES
+        if status_def.name not in existing_names
+    ]
+    if missing:
+        Status.objects.bulk_create(missing)
+        existing = list(Status.objects.filter(name__in=names.keys()).order_by('id_status'))
+
+    workflow = Workflow(statuses=statuses, keys_by_name=names)
+    for status in existing:
+        key = names[status.name]
+        workflow.keys_by_id[status.id_status] = key
+        # Канонический объект — первый статус с основным названием
+        if status.name == statuses[key].name:
+            workflow.status_objects.setdefault(key, status)
+
+    for source_key, target_keys in TRANSITIONS.items():
+        source = statuses[source_key]
+        # Повторная установка того же статуса допустима и ничего не меняет
+        workflow.transitions[(source_key, source_key)] = Transition(source, source, 0)
+        for target_key in target_keys:
+            target = statuses[target_key]
+            load_delta = int(source.releases_load) - int(target.releases_load)
+            workflow.transitions[(source_key, target_key)] = Transition(source, target, load_delta)
+    return workflow
+
+
+_workflow = None
+
+
+def get_workflow() -> Workflow:
+    """Граф статусов текущего процесса (компилируется при первом обращении)"""
+    global _workflow
+    if _workflow is None:
+        _workflow = compile_workflow()
+    return _workflow
+
+
+def reset_workflow():
+    global _workflow
+    _workflow = None
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+def _invalidate_workflow(sender, **kwargs):
+    reset_workflow()
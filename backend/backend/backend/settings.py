@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'back.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -140,6 +141,60 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Медиафайлы отдаются view serve_media по подписанным ссылкам (срок действия в секундах).
+# В продакшене передачу файла лучше отдать веб-серверу: MEDIA_ACCEL_REDIRECT_PREFIX —
+# internal-location nginx, указывающий на MEDIA_ROOT (например, /protected-media/),
+# MEDIA_X_SENDFILE — заголовок X-Sendfile для Apache/lighttpd
+MEDIA_URL_MAX_AGE = int(os.environ.get('MEDIA_URL_MAX_AGE', str(24 * 60 * 60)))
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+MEDIA_X_SENDFILE = os.environ.get('MEDIA_X_SENDFILE', 'False').lower() == 'true'
+
+# Каталог для загрузок, ожидающих фоновой обработки (не должен раздаваться как media)
+UPLOAD_STAGING_ROOT = Path(os.environ.get('UPLOAD_STAGING_ROOT', BASE_DIR / 'upload_staging'))
+
+# Загрузка файлов частями (api/uploads/): максимальный размер файла
+# и рекомендуемый размер части, в байтах
+CHUNKED_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
+# Максимальная сторона изображений после обработки, в пикселях
+ATTACHMENT_MAX_IMAGE_SIDE = 2560
+AVATAR_MAX_IMAGE_SIDE = 512
+
+# Сколько секунд хранится ответ на запрос с заголовком Idempotency-Key
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Поиск дублей при создании заявки: минимальная похожесть описаний (0..1)
+# и за сколько последних дней сравнивать с открытыми заявками
+DUPLICATE_SIMILARITY_THRESHOLD = 0.5
+DUPLICATE_WINDOW_DAYS = 14
+
+# Сроки выполнения заявок (SLA): часов от создания по срочности. Для отдельных типов
+# поломок срок можно переопределить: {'Сеть': {'Критическая': 2}}
+SLA_HOURS = {'Критическая': 4, 'Высокая': 24, 'Средняя': 72, 'Низкая': 168}
+SLA_HOURS_BY_FAILURE_TYPE = {}
+
+# Назначение исполнителя: вес заявки в загрузке сотрудника = вес срочности
+# × трудоёмкость типа поломки (по медиане фактического времени решения)
+ROUTING_URGENCY_WEIGHTS = {'Критическая': 4.0, 'Высокая': 2.0, 'Средняя': 1.0, 'Низкая': 0.5}
+
+# Миниатюры изображений (WebP + JPEG): имя размера -> большая сторона в пикселях.
+# THUMBNAIL_WORKERS — число процессов для кодирования (0 — без пула, в текущем процессе)
+THUMBNAIL_SIZES = {'small': 160, 'medium': 480, 'large': 1024}
+THUMBNAIL_WORKERS = int(os.environ['THUMBNAIL_WORKERS']) if os.environ.get('THUMBNAIL_WORKERS') else None
+
+# Фоновые задачи (manage.py run_jobs). Если воркер не запущен (локальная разработка),
+# можно выполнять задачи сразу после коммита: DJANGO_BACKGROUND_JOBS_EAGER=True
+BACKGROUND_JOBS_EAGER = os.environ.get('DJANGO_BACKGROUND_JOBS_EAGER', 'False').lower() == 'true'
+
+# Уведомления доставляет воркер: события одного получателя по одной заявке
+# в пределах окна (секунд) склеиваются в одно уведомление
+NOTIFICATION_COALESCE_SECONDS = int(os.environ.get('NOTIFICATION_COALESCE_SECONDS', '30'))
+
+# Сжатие ответов (brotli/gzip) — только для тел больше порога, в байтах
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 5
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -187,6 +242,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
@@ -194,4 +250,4 @@ CORS_ALLOW_HEADERS = [
 ]
 
 # Дополнительные настройки для работы с файлами
-CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken']
+CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken', 'Idempotent-Replayed']
@@ -16,8 +16,6 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from django.conf import settings
-from django.conf.urls.static import static
 from back import views
 
 urlpatterns = [
@@ -25,17 +23,36 @@ urlpatterns = [
     path('api/auth/login/', views.login, name='login'),
     path('api/user/profile/<int:user_id>/', views.get_profile, name='get_profile'),
     path('api/user/avatar/<int:user_id>/', views.upload_avatar, name='upload_avatar'),
+    path(
+        'api/user/notification-settings/<int:user_id>/',
+        views.update_notification_settings,
+        name='update_notification_settings',
+    ),
     path('api/users/', views.get_users, name='get_users'),
+    path('api/users/search/', views.search_users, name='search_users'),
     path('api/requests/create/', views.create_request, name='create_request'),
     path('api/requests/<int:user_id>/', views.get_requests, name='get_requests'),
+    path('api/requests/<int:user_id>/board/', views.get_requests_board, name='get_requests_board'),
     path('api/requests/archive/', views.get_archive_requests, name='get_archive_requests'),
+    path('api/requests/search/', views.search_requests, name='search_requests'),
+    path('api/requests/<int:request_id>/comments/', views.get_request_comments, name='get_request_comments'),
     path('api/requests/<int:request_id>/update/', views.update_request, name='update_request'),
     path('api/requests/<int:request_id>/status/', views.update_request_status, name='update_request_status'),
+    path('api/requests/status/bulk/', views.bulk_update_request_status, name='bulk_update_request_status'),
     path('api/offices/filters/', views.get_office_filters, name='get_office_filters'),
+    path('api/metrics/time-in-status/', views.get_time_in_status_metrics, name='get_time_in_status_metrics'),
+    path('api/metrics/sla/', views.get_sla_metrics, name='get_sla_metrics'),
+    path('api/metrics/costs/', views.get_cost_report, name='get_cost_report'),
+    path('api/dashboard/throughput/', views.get_dashboard_throughput, name='get_dashboard_throughput'),
+    path('api/dashboard/backlog/', views.get_dashboard_backlog, name='get_dashboard_backlog'),
+    path('api/dashboard/offices/', views.get_dashboard_offices, name='get_dashboard_offices'),
     path('api/notifications/<int:user_id>/', views.get_notifications, name='get_notifications'),
     path('api/notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
+    path('api/uploads/', views.create_upload, name='create_upload'),
+    path('api/uploads/<str:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('api/uploads/<str:upload_id>/complete/', views.complete_upload, name='complete_upload'),
+    path('api/media/<path:path>', views.serve_media, name='serve_media'),
 ]
 
-# Добавляем URL для медиа файлов в режиме разработки
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Медиафайлы отдаются только через serve_media по подписанным ссылкам: прямой
+# маршрут MEDIA_URL (static() в режиме DEBUG) обходил бы проверку доступа
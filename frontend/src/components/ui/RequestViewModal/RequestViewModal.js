@@ -164,6 +164,15 @@ export default function RequestViewModal({ request, isOpen, onClose }) {
   // Инициализация данных для редактирования
   useEffect(() => {
     if (request && isOpen) {
+      // Все строки затрат заявки (при сохранении они заменяются целиком)
+      // и пустые строки для новых — в таблице не меньше 4 строк
+      const expenseRows = (request.expenses || []).map((expense) => ({
+        name: (expense.name && expense.name !== 'Заявка') ? expense.name : '',
+        amount: expense.amount ? String(expense.amount) : ''
+      }))
+      while (expenseRows.length < 4) {
+        expenseRows.push({ name: '', amount: '' })
+      }
       setEditedData({
         priority: request.priority || 'medium',
         issueType: request.issueType || 'other',
@@ -172,20 +181,7 @@ export default function RequestViewModal({ request, isOpen, onClose }) {
         locationDescription: request.locationDescription || request.location || '',
         problemDescription: request.problemDescription || '',
         performerId: request.performer?.id || '',
-        expenses: request.expense ? [
-          {
-            name: (request.expense.name && request.expense.name !== 'Заявка') ? request.expense.name : '',
-            amount: request.expense.amount ? String(request.expense.amount) : ''
-          },
-          { name: '', amount: '' },
-          { name: '', amount: '' },
-          { name: '', amount: '' }
-        ] : [
-          { name: '', amount: '' },
-          { name: '', amount: '' },
-          { name: '', amount: '' },
-          { name: '', amount: '' }
-        ],
+        expenses: expenseRows,
         comment: request.comments && request.comments.length > 0 
           ? request.comments[request.comments.length - 1].content || '' 
           : '',